@@ -0,0 +1,251 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from atm_pin import hash_pin
+from atm_service import Bank, DEPOSIT_STEP, WITHDRAW_STEP, TRANSFER_MIN
+from atm_storage import SqliteStorage, import_data, save_data, HISTORY_PAGE_SIZE
+
+# Headless benchmark for the ATM ledger (no display needed).
+#
+#   python atm_bench.py --sizes 1000,100000 --backends sqlite,json --ops 20000 --out bench.json
+#
+# For every (backend, size) a synthetic bank is generated in a temp directory
+# and measured in a fresh child process, so peak RSS and cold-start time belong
+# to that scenario alone. Results go to stdout as a table and, with --out, to
+# a JSON file; --compare old.json prints the change against an earlier run.
+
+BENCH_FORMAT = 1
+DEFAULT_MIX = {"withdraw": 0.3, "deposit": 0.3, "transfer": 0.2, "balance": 0.1, "statement": 0.05, "login": 0.05}
+TXN_TYPES = ("DEPOSIT", "WITHDRAW", "TRANSFER_IN", "TRANSFER_OUT", "LOGIN")
+
+def card_number(i):
+    return f"{4000_0000_0000_0000 + i}"
+
+def synthetic_users(size, history, seed):
+    # Every account shares one PIN hash: deriving a million salted hashes would dominate setup.
+    rng = random.Random(seed)
+    pin_hash = hash_pin("1234")
+    start = datetime(2024, 1, 1)
+    for i in range(size):
+        balance = float(rng.randrange(1_000, 200_000, 50))
+        when = start + timedelta(seconds=rng.randrange(0, 86400 * 30))
+        txns = []
+        for _ in range(rng.randint(history // 2, history)):
+            ttype = rng.choice(TXN_TYPES)
+            amount = 0.0 if ttype == "LOGIN" else float(rng.randrange(100, 5_000, 100))
+            balance += amount if ttype in ("DEPOSIT", "TRANSFER_IN") else -amount if ttype != "LOGIN" else 0
+            balance = max(balance, 0.0)
+            meta = {"to": card_number(rng.randrange(size))} if ttype == "TRANSFER_OUT" else {}
+            txns.append({"time": when.strftime("%Y-%m-%d %H:%M:%S"), "type": ttype,
+                         "amount": amount, "balance": balance, "meta": meta})
+            when += timedelta(seconds=rng.randrange(60, 86400))
+        yield card_number(i), {"name": f"Customer {i}", "account_number": f"AC-{100000 + i}",
+                               "pin_hash": pin_hash, "balance": balance, "transactions": txns}
+
+def generate_bank(path, size, history, seed=0):
+    if path.endswith(".json"):
+        history = min(history, HISTORY_PAGE_SIZE - 1)  # keep it all in the hot page
+        save_data(path, {"users": dict(synthetic_users(size, history, seed)), "atm": {}})
+        return
+    db = SqliteStorage(path)
+    chunk = {}
+    for card, user in synthetic_users(size, history, seed):
+        chunk[card] = user
+        if len(chunk) >= 10_000:
+            import_data(db, {"users": chunk})
+            chunk = {}
+    import_data(db, {"users": chunk})
+    db.close()
+
+def io_written():
+    # Bytes handed to write() by this process; falls back to 0 where /proc is unavailable.
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+def peak_rss_mb():
+    # VmHWM resets on exec; ru_maxrss would carry over the parent's peak into a spawned child.
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+def run_workload(bank, size, ops, threads, mix, seed):
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    latencies = {n: [] for n in names}
+    per_thread = ops // threads
+
+    def worker(idx):
+        rng = random.Random(seed * 1000 + idx)
+        local = {n: [] for n in names}
+        for _ in range(per_thread):
+            op = rng.choices(names, weights)[0]
+            card = card_number(rng.randrange(size))
+            t0 = time.perf_counter()
+            if op == "withdraw":
+                bank.withdraw(card, WITHDRAW_STEP * rng.randint(1, 5))
+            elif op == "deposit":
+                bank.deposit(card, DEPOSIT_STEP * rng.randint(1, 20))
+            elif op == "transfer":
+                bank.transfer(card, card_number(rng.randrange(size)), rng.randint(TRANSFER_MIN, 500))
+            elif op == "balance":
+                bank.get_user(card)
+            elif op == "statement":
+                bank.history(card, 10)
+            elif op == "login":
+                bank.login(card, "1234")
+            local[op].append(time.perf_counter() - t0)
+        for n in names:
+            latencies[n].extend(local[n])
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return latencies, time.perf_counter() - start
+
+def measure(scenario):
+    # Runs in a child process.
+    path = scenario["path"]
+    written0 = io_written()
+    t0 = time.perf_counter()
+    bank = Bank.open(path, group_commit=scenario["group_commit"])
+    load_seconds = time.perf_counter() - t0
+    rss_after_load = peak_rss_mb()
+    written1 = io_written()
+    try:
+        latencies, elapsed = run_workload(bank, scenario["size"], scenario["ops"], scenario["threads"],
+                                          scenario["mix"], scenario["seed"])
+        bank.flush()
+    finally:
+        bank.close()
+    written2 = io_written()
+    total = sum(len(v) for v in latencies.values())
+    all_lat = sorted(x for v in latencies.values() for x in v)
+    result = {
+        "backend": scenario["backend"],
+        "size": scenario["size"],
+        "threads": scenario["threads"],
+        "group_commit": scenario["group_commit"],
+        "ops": total,
+        "load_seconds": load_seconds,
+        "ops_per_sec": total / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(all_lat, 50) * 1000,
+        "p99_ms": percentile(all_lat, 99) * 1000,
+        "peak_rss_mb": peak_rss_mb(),
+        "rss_after_load_mb": rss_after_load,
+        "bytes_written_per_op": (written2 - written1) / total if total else 0.0,
+        "load_bytes_written": written1 - written0,
+        "per_op": {},
+    }
+    for name, values in latencies.items():
+        values.sort()
+        result["per_op"][name] = {
+            "count": len(values),
+            "p50_ms": percentile(values, 50) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+        }
+    return result
+
+def scenario_key(r):
+    return f"{r['backend']}/{r['size']}/t{r['threads']}{'/gc' if r['group_commit'] else ''}"
+
+def print_table(results, baseline=None):
+    base = {scenario_key(r): r for r in (baseline or {}).get("results", [])}
+    print(f"{'scenario':<26}{'load s':>9}{'ops/s':>11}{'p50 ms':>9}{'p99 ms':>9}{'RSS MB':>9}{'B/op':>9}")
+    for r in results:
+        key = scenario_key(r)
+        print(f"{key:<26}{r['load_seconds']:>9.3f}{r['ops_per_sec']:>11,.0f}{r['p50_ms']:>9.3f}"
+              f"{r['p99_ms']:>9.3f}{r['peak_rss_mb']:>9.1f}{r['bytes_written_per_op']:>9.0f}")
+        old = base.get(key)
+        if old:
+            def delta(field):
+                return (r[field] - old[field]) / old[field] * 100 if old[field] else 0.0
+            print(f"{'  vs baseline':<26}{delta('load_seconds'):>+8.1f}%{delta('ops_per_sec'):>+10.1f}%"
+                  f"{delta('p50_ms'):>+8.1f}%{delta('p99_ms'):>+8.1f}%{delta('peak_rss_mb'):>+8.1f}%"
+                  f"{delta('bytes_written_per_op'):>+8.1f}%")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ATM ledger operations on synthetic banks.")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma separated card counts")
+    parser.add_argument("--backends", default="sqlite,json", help="comma separated: sqlite, json")
+    parser.add_argument("--history", type=int, default=20, help="max transactions generated per card")
+    parser.add_argument("--ops", type=int, default=20000, help="operations per scenario")
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--group-commit", action="store_true")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workdir", help="where to generate banks (default: a temp dir, removed afterwards)")
+    parser.add_argument("--out", help="write machine-readable results to this JSON file")
+    parser.add_argument("--compare", help="earlier --out file to compare against")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="atm_bench_")
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    try:
+        for backend in args.backends.split(","):
+            for size in (int(s) for s in args.sizes.split(",")):
+                ext = ".json" if backend == "json" else ".db"
+                path = os.path.join(workdir, f"bank_{backend}_{size}{ext}")
+                scenario = {"backend": backend, "size": size, "path": path, "ops": args.ops,
+                            "threads": args.threads, "group_commit": args.group_commit,
+                            "mix": DEFAULT_MIX, "seed": args.seed}
+                with ctx.Pool(1, maxtasksperchild=1) as pool:
+                    if not os.path.exists(path):
+                        t0 = time.perf_counter()
+                        pool.apply(generate_bank, (path, size, args.history, args.seed))
+                        print(f"generated {path} in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+                    results.append(pool.apply(measure, (scenario,)))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+    if args.out:
+        report = {
+            "format": BENCH_FORMAT,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+            "results": results,
+        }
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
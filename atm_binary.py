@@ -0,0 +1,302 @@
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+from collections.abc import MutableMapping
+
+# Versioned binary format for the bank snapshot (*.bank), an alternative to
+# the pretty-printed JSON file. Layout, little-endian:
+#
+#   header     64 bytes  magic "ATMB", version, counts and section offsets
+#   accounts   64 bytes each, sorted by card number:
+#              card, balance, first transaction record, hot transactions,
+#              total transactions, (offset, length) of the account's other
+#              fields as compact JSON in the heap
+#   txns       48 bytes each, grouped by account, oldest first:
+#              time, type code, amount, balance, (offset, length) of meta JSON
+#   heap       JSON blobs: account fields, transaction meta, and the
+#              top-level extras (atm settings, journal_seq, the type table)
+#
+# BankFile maps the file and binary-searches the account table, so looking up
+# an account or its balance never decodes any history. Only the hot page of
+# each account (user["transactions"]) is stored here; sealed history pages stay
+# in the .history directory next to it, as with the JSON file.
+#
+# JsonStorage opens a .bank file through BankUsers, which stands in for
+# data["users"] and decodes an account (with its hot page) the first time it
+# is asked for, so opening a large bank decodes nothing up front.
+#
+#   python atm_binary.py to-binary bank_data.json bank_data.bank
+#   python atm_binary.py to-json bank_data.bank bank_data.json
+#   python atm_binary.py show bank_data.bank 1111222233334444
+
+MAGIC = b"ATMB"
+VERSION = 1
+BANK_EXT = ".bank"
+HEADER = struct.Struct("<4sHHQQQQQQQ")   # magic, version, flags, accounts, txns, 3 section offsets, extras (off, len)
+ACCOUNT = struct.Struct("<24sdQIQQI")    # card, balance, txn start, hot txns, txn_count, fields (off, len)
+TXN = struct.Struct("<19sBddQI")         # time, type code, amount, balance, meta (off, len)
+ACCOUNT_FIXED = ("balance", "transactions", "txn_count")  # kept in the account record, not the JSON fields
+
+def fixed(text, size, what):
+    # struct's "s" fields pad or silently cut; a cut card number would point at another account.
+    raw = text.encode()
+    if len(raw) > size:
+        raise ValueError(f"{what} {text!r} is longer than {size} bytes and does not fit the bank format")
+    return raw
+
+class Heap:
+    def __init__(self, base):
+        self.base = base
+        self.buf = bytearray()
+
+    def put(self, obj):
+        if not obj:
+            return 0, 0
+        raw = json.dumps(obj, separators=(",", ":")).encode()
+        off = self.base + len(self.buf)
+        self.buf += raw
+        return off, len(raw)
+
+def write_bank(path, data):
+    # Full snapshot, written like save_data: temp file, fsync, rename.
+    users = sorted(data["users"].items())
+    n_txns = sum(len(user.get("transactions", ())) for _, user in users)
+    accounts_off = HEADER.size
+    txns_off = accounts_off + len(users) * ACCOUNT.size
+    heap = Heap(txns_off + n_txns * TXN.size)
+    types = {}
+    accounts = bytearray(len(users) * ACCOUNT.size)
+    txns = bytearray(n_txns * TXN.size)
+    t = 0
+    for i, (card, user) in enumerate(users):
+        hot = list(user.get("transactions", ()))
+        fields = {k: v for k, v in user.items() if k not in ACCOUNT_FIXED}
+        ACCOUNT.pack_into(accounts, i * ACCOUNT.size, fixed(card, 24, "card number"), user["balance"], t, len(hot),
+                          user.get("txn_count", len(hot)), *heap.put(fields))
+        for txn in hot:
+            code = types.setdefault(txn["type"], len(types))
+            TXN.pack_into(txns, t * TXN.size, fixed(txn["time"], 19, "transaction time"), code, txn["amount"], txn["balance"],
+                          *heap.put(txn.get("meta")))
+            t += 1
+    extras = {k: v for k, v in data.items() if k != "users"}
+    extras["txn_types"] = list(types)
+    extra_off, extra_len = heap.put(extras)
+    header = HEADER.pack(MAGIC, VERSION, 0, len(users), n_txns, accounts_off, txns_off, heap.base,
+                         extra_off, extra_len)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        for part in (header, accounts, txns, heap.buf):
+            f.write(part)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+class BankFile:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, _, self.n_accounts, self.n_txns, self.accounts_off, self.txns_off,
+         self.heap_off, extra_off, extra_len) = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a bank file")
+        if version != VERSION:
+            raise ValueError(f"{path} is bank format version {version}; this build reads version {VERSION}")
+        self.extras = self._blob(extra_off, extra_len) or {}
+        self.types = self.extras.pop("txn_types", [])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.n_accounts
+
+    def close(self):
+        self.mm.close()
+
+    def _blob(self, off, length):
+        return json.loads(self.mm[off:off + length]) if length else None
+
+    def _card_at(self, i):
+        off = self.accounts_off + i * ACCOUNT.size
+        return self.mm[off:off + 24].rstrip(b"\0").decode()
+
+    def _find(self, card):
+        lo, hi = 0, self.n_accounts
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._card_at(mid) < card:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < self.n_accounts and self._card_at(lo) == card else None
+
+    def cards(self):
+        return [self._card_at(i) for i in range(self.n_accounts)]
+
+    def _user(self, i, with_txns):
+        card, balance, start, hot, total, off, length = ACCOUNT.unpack_from(self.mm, self.accounts_off + i * ACCOUNT.size)
+        user = self._blob(off, length) or {}
+        user["balance"] = balance
+        user["txn_count"] = total
+        if with_txns:
+            user["transactions"] = self._txns(start, hot)
+        return card.rstrip(b"\0").decode(), user
+
+    def _txns(self, start, n):
+        out = []
+        types = self.types
+        for when, code, amount, balance, off, length in TXN.iter_unpack(
+                self.mm[self.txns_off + start * TXN.size:self.txns_off + (start + n) * TXN.size]):
+            out.append({"time": when.rstrip(b"\0").decode(), "type": types[code], "amount": amount,
+                        "balance": balance, "meta": self._blob(off, length) or {}})
+        return out
+
+    def get_user(self, card, with_txns=False):
+        # Account fields without its history unless asked for.
+        i = self._find(card)
+        return None if i is None else self._user(i, with_txns)[1]
+
+    def transactions(self, card):
+        i = self._find(card)
+        if i is None:
+            return []
+        _, _, start, hot, _, _, _ = ACCOUNT.unpack_from(self.mm, self.accounts_off + i * ACCOUNT.size)
+        return self._txns(start, hot)
+
+    def entries(self):
+        # (card, fields without transactions) for every account, in card order.
+        for i in range(self.n_accounts):
+            yield self._user(i, False)
+
+    def to_data(self):
+        data = dict(self.extras)
+        data["users"] = dict(self._user(i, True) for i in range(self.n_accounts))
+        return data
+
+class BankUsers(MutableMapping):
+    # data["users"] backed by a BankFile. Accounts are decoded on first access
+    # and handed to on_load (PagedHistory.attach) before anyone sees them;
+    # after that the decoded dict is the live record. materialize() decodes
+    # the rest and closes the file, before a snapshot replaces it on disk.
+    def __init__(self, bank_file, on_load=None):
+        self.file = bank_file
+        self.on_load = on_load
+        self.loaded = {}
+        self._cards = None
+
+    def __getitem__(self, card):
+        user = self.loaded.get(card)
+        if user is None:
+            user = self.file.get_user(card, with_txns=True) if self.file is not None else None
+            if user is None:
+                raise KeyError(card)
+            if self.on_load is not None:
+                self.on_load(card, user)
+            self.loaded[card] = user
+        return user
+
+    def __setitem__(self, card, user):
+        if card not in self:
+            self._card_list().append(card)
+        self.loaded[card] = user
+
+    def __delitem__(self, card):
+        raise TypeError("accounts cannot be removed from a bank file")
+
+    def __contains__(self, card):
+        return card in self.loaded or (self.file is not None and self.file._find(card) is not None)
+
+    def __iter__(self):
+        return iter(list(self._card_list()))
+
+    def __len__(self):
+        return len(self._card_list())
+
+    def _card_list(self):
+        if self._cards is None:
+            self._cards = self.file.cards()
+        return self._cards
+
+    def entries(self):
+        # (card, account fields) without decoding any history; for the card directory.
+        for card, user in self.file.entries():
+            yield card, self.loaded.get(card, user)
+
+    def materialize(self):
+        # -> plain dict of every account; the file is closed afterwards.
+        users = {card: self[card] for card in self._card_list()}
+        self.close()
+        return users
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+def open_bank(path):
+    # Extras as a dict, with a lazy data["users"]; see BankUsers.
+    bank_file = BankFile(path)
+    data = dict(bank_file.extras)
+    data["users"] = BankUsers(bank_file)
+    return data
+
+def read_bank(path):
+    with BankFile(path) as bf:
+        return bf.to_data()
+
+def convert(src, dst):
+    # Either direction, picked by the file extensions. Pending journal records
+    # are folded in, and the sealed history pages are copied when the name changes.
+    from atm_storage import JsonStorage, history_dir, save_data, snapshot_of
+    if not os.path.exists(src):
+        raise FileNotFoundError(src)  # JsonStorage would seed a demo bank there
+    store = JsonStorage(src)
+    try:
+        data = snapshot_of(store.data)
+        data["journal_seq"] = store.journal.seq
+        save_data(dst, data)
+    finally:
+        store.close()
+    if history_dir(src) != history_dir(dst) and os.path.isdir(history_dir(src)):
+        shutil.copytree(history_dir(src), history_dir(dst), dirs_exist_ok=True)
+    return len(data["users"])
+
+def main(argv):
+    if len(argv) == 3 and argv[0] in ("to-binary", "to-json"):
+        src, dst = argv[1], argv[2]
+        want = BANK_EXT if argv[0] == "to-binary" else ".json"
+        if not dst.endswith(want):
+            print(f"{dst} should end in {want}")
+            return 2
+        if not os.path.exists(src):
+            print(f"{src} does not exist")
+            return 1
+        if os.path.exists(dst):
+            print(f"{dst} already exists")
+            return 1
+        print(f"Converted {convert(src, dst)} accounts: {src} -> {dst}")
+        return 0
+    if len(argv) in (2, 3) and argv[0] == "show":
+        with BankFile(argv[1]) as bf:
+            if len(argv) == 2:
+                print(f"{argv[1]}: format v{VERSION}, {len(bf)} accounts, {bf.n_txns} transactions")
+                return 0
+            user = bf.get_user(argv[2], with_txns=True)
+            if user is None:
+                print("Card not recognized.")
+                return 1
+            user.pop("pin_hash", None)
+            print(json.dumps(user, indent=2))
+            return 0
+    print("usage: python atm_binary.py to-binary SRC.json DST.bank | to-json SRC.bank DST.json | show FILE.bank [CARD]")
+    return 2
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,132 @@
+from bisect import bisect_left, bisect_right
+
+# Card lookup for the welcome screen's picker.
+#
+# A query matches an account whose card number, account number or name starts
+# with it (case-insensitively; spaces and dashes in a card number are
+# ignored). Results come in three runs, one per index: card-number matches in
+# card order, then account-number matches, then name matches, each in the
+# order of its index. An account is listed once, in the first run it matches.
+# The cursor of a page is [run, key, card] of the last index entry the page
+# read (key and card are None at the start of a run), so every page is a range
+# scan that starts where the previous one stopped. Entries already listed in
+# an earlier run are read and skipped; a page reads at most SCAN_BUDGET times
+# its size, so one can come back short, or empty, with a cursor when most of
+# what it read was skipped. A run is left out altogether once an earlier one
+# had an empty prefix, since that run listed every account.
+#
+# find_paged() is the shared paging logic; a backend only supplies
+# scan(run, prefix, after, n). CardDirectory is the in-memory index JsonStorage
+# uses; SqliteStorage scans its own indexes (see SqliteStorage.find_cards).
+
+DIRECTORY_PAGE_SIZE = 20
+SCAN_BUDGET = 4  # index entries a page may read, per entry it returns
+RUNS = ("card", "account_number", "name")
+
+_LOWER = {c: c + 32 for c in range(ord("A"), ord("Z") + 1)}
+
+def fold(text):
+    # ASCII-only like SQLite's lower(), so both backends agree on matches and order.
+    return text.translate(_LOWER)
+
+def entry_of(card, user):
+    return {"card": card, "name": user["name"], "account_number": user["account_number"]}
+
+def key_of(run, entry):
+    return entry["card"] if run == 0 else fold(entry[RUNS[run]])
+
+def prefixes_of(query):
+    q = fold(query.strip())
+    digits = q.replace(" ", "").replace("-", "")
+    return [digits if digits.isdigit() else q, q, q]
+
+def prefix_end(prefix):
+    # Smallest string greater than every string starting with prefix; None for "".
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1) if prefix else None
+
+def first_run(entry, prefixes):
+    for run, prefix in enumerate(prefixes):
+        if key_of(run, entry).startswith(prefix):
+            return run
+    return None
+
+def find_paged(query, limit, after, scan):
+    # -> (entries, cursor for the next page or None)
+    prefixes = prefixes_of(query)
+    run = after[0] if after else 0
+    pos = (after[1], after[2]) if after and after[1] is not None else None
+    budget = (limit + 1) * SCAN_BUDGET
+    found = []
+    while run < len(RUNS) and len(found) <= limit and budget > 0:
+        if "" in prefixes[:run]:
+            run = len(RUNS)  # an earlier run already listed every account
+            break
+        want = min(limit + 1 - len(found), budget)
+        batch = scan(run, prefixes[run], pos, want)
+        budget -= len(batch)
+        for key, card, entry in batch:
+            pos = (key, card)
+            if first_run(entry, prefixes) == run:  # else already listed in an earlier run
+                found.append((run, key, card, entry))
+        if len(batch) < want:
+            run, pos = run + 1, None
+    if len(found) > limit:
+        found = found[:limit]
+        cursor = list(found[-1][:3])
+    elif run < len(RUNS):
+        cursor = [run, *(pos or (None, None))]  # out of budget; resume where the scan stopped
+    else:
+        cursor = None
+    return [entry for *_, entry in found], cursor
+
+def cursor_key(cursor):
+    run, key, card = cursor
+    return run, key or "", card or ""
+
+def merge_pages(query, limit, pages):
+    # Combine pages that several stores (atm_shard's shards) returned for the
+    # same query and cursor into one page in the same order. A store that ran
+    # out of scan budget has only read up to its cursor, so nothing past the
+    # smallest such cursor is certain yet; the merged page stops there.
+    prefixes = prefixes_of(query)
+    found = []
+    bound = None
+    for entries, cursor in pages:
+        if cursor is not None and (bound is None or cursor_key(cursor) < cursor_key(bound)):
+            bound = cursor
+        for entry in entries:
+            run = first_run(entry, prefixes)
+            found.append((run, key_of(run, entry), entry["card"], entry))
+    found.sort(key=lambda f: f[:3])
+    if bound is not None:
+        found = [f for f in found if f[:3] <= cursor_key(bound)]
+    if len(found) > limit:
+        found = found[:limit]
+        cursor = list(found[-1][:3])
+    else:
+        cursor = bound
+    return [entry for *_, entry in found], cursor
+
+class CardDirectory:
+    # Sorted (key, card) lists, one per run, over (card, user) pairs. Names and
+    # account numbers never change at runtime, so the entries are kept as built.
+    def __init__(self, users):
+        entries = [entry_of(card, user) for card, user in users]
+        self.entries = {e["card"]: e for e in entries}
+        self.keys = [sorted((key_of(run, e), e["card"]) for e in entries) for run in range(len(RUNS))]
+
+    def __len__(self):
+        return len(self.keys[0])
+
+    def scan(self, run, prefix, after, n):
+        keys = self.keys[run]
+        i = bisect_right(keys, after) if after else bisect_left(keys, (prefix, ""))
+        out = []
+        while i < len(keys) and len(out) < n and keys[i][0].startswith(prefix):
+            key, card = keys[i]
+            out.append((key, card, self.entries[card]))
+            i += 1
+        return out
+
+    def find(self, query="", limit=DIRECTORY_PAGE_SIZE, after=None):
+        return find_paged(query, limit, after, self.scan)
@@ -1,81 +1,114 @@
 
 
+import time
+_PROCESS_START = time.perf_counter()  # startup profile origin; taken before the heavier imports
+
 import json
 import os
-import time
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from hashlib import sha256
 import tkinter as tk
 from tkinter import messagebox, ttk, filedialog
 
+from atm_service import (Bank, now_str, format_currency, WITHDRAW_MIN, WITHDRAW_STEP,
+                         DEPOSIT_MIN, DEPOSIT_STEP)
+from atm_statement import TXN_TYPES, iter_chunks, iter_statement, statement_header, write_statement
+from ui_toast import Toaster
+
 APP_TITLE = "Python ATM"
-DATA_FILE = "bank_data.json"
+DATA_FILE = os.environ.get("ATM_DATA_FILE", "bank_data.db")  # use a .json or .bank path for the journaled in-memory store
+LEGACY_DATA_FILE = "bank_data.json"  # imported once into DATA_FILE on first start
+LEDGER_ADDRESS = os.environ.get("ATM_LEDGER")  # "host:port" or socket path of atm_server.py; unset = local data file
+LEDGER_SHARDS = int(os.environ.get("ATM_SHARDS", "0"))  # > 1 = split DATA_FILE across that many atm_shard processes
 SESSION_TIMEOUT_SECONDS = 120  # auto logout after inactivity
-WITHDRAW_MIN = 100
-WITHDRAW_STEP = 100
-DEPOSIT_MIN = 50
-DEPOSIT_STEP = 50
-TRANSFER_MIN = 1
-
-def hash_pin(pin: str) -> str:
-    return sha256(("atm_salt::" + pin).encode()).hexdigest()
-
-def load_data():
-    if not os.path.exists(DATA_FILE):
-        seed_data = {
-            "users": {
-                "1111222233334444": {
-                    "name": "Alice Demo",
-                    "account_number": "AC-10001",
-                    "pin_hash": hash_pin("1234"),
-                    "balance": 35000.0,
-                    "transactions": []
-                },
-                "5555666677778888": {
-                    "name": "Bob Demo",
-                    "account_number": "AC-10002",
-                    "pin_hash": hash_pin("4321"),
-                    "balance": 12500.0,
-                    "transactions": []
-                }
-            },
-            "atm": {
-                "cash_stock": 10_00_00  # simulated cash stock (not enforced strictly, just for realism)
-            }
-        }
-        save_data(seed_data)
-    with open(DATA_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-def save_data(data):
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
-
-def now_str():
-    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-def format_currency(x):
-    # Simple formatting with commas
-    return f"₹{x:,.2f}"
+STATEMENT_PAGE_SIZE = 50  # statement rows fetched per scroll step
+CARD_PAGE_SIZE = 20  # welcome-screen picker entries fetched per scroll step
+CARD_SEARCH_DELAY_MS = 200  # pause in typing before the picker searches
+THEME_FILE = os.environ.get("ATM_THEME_FILE", "azure.tcl")  # sourced only if it exists
+PROFILE_STARTUP = os.environ.get("ATM_PROFILE_STARTUP", "")  # "1" = startup report on stderr, "json" = one JSON line
+EXIT_WHEN_READY = os.environ.get("ATM_EXIT_WHEN_READY") == "1"  # quit once interactive (atm_startup_bench.py)
+
+def open_bank():
+    # Runs on the worker thread while the splash is up. The server and shard
+    # modules pull in asyncio and multiprocessing, so they are only imported
+    # when configured.
+    if LEDGER_ADDRESS:
+        from atm_server import LedgerClient
+        return LedgerClient.from_address(LEDGER_ADDRESS)
+    if LEDGER_SHARDS > 1:
+        from atm_shard import ShardedBank
+        return ShardedBank.open(DATA_FILE, shards=LEDGER_SHARDS, legacy_json=LEGACY_DATA_FILE)
+    return Bank.open(DATA_FILE, legacy_json=LEGACY_DATA_FILE)
+
+def posted(bank, op, card, *args):
+    # Runs on the worker thread: a withdraw/deposit/transfer, then the account
+    # as it stands afterwards for the receipt.
+    ok, msg = getattr(bank, op)(card, *args)
+    return ok, msg, bank.get_user(card) if ok else None
+
+def card_login(bank, card, pin):
+    # Worker side of PinScreen.try_login; None if the card is not known.
+    if not bank.get_user(card):
+        return None
+    return bank.login(card, pin)
+
+def end_session(bank):
+    bank.logout()
+    bank.flush()
+
+class StartupProfile:
+    # Named marks, in seconds since atm_gui was imported, up to the first
+    # usable welcome screen.
+    def __init__(self, start=_PROCESS_START):
+        self.start = start
+        self.marks = []
+
+    def mark(self, name):
+        self.marks.append((name, time.perf_counter() - self.start))
+
+    def report(self):
+        lines = [f"{'phase':<16}{'+ms':>9}{'at ms':>9}"]
+        prev = 0.0
+        for name, at in self.marks:
+            lines.append(f"{name:<16}{(at - prev) * 1000:>9.1f}{at * 1000:>9.1f}")
+            prev = at
+        return "\n".join(lines)
+
+    def as_dict(self):
+        return {name: at for name, at in self.marks}
 
 class ATMApp(tk.Tk):
     def __init__(self):
+        self.profile = StartupProfile()
+        self.profile.mark("imports")
         super().__init__()
         self.title(APP_TITLE)
         self.geometry("980x600")
         self.resizable(False, False)
+        self.profile.mark("tk")
 
-        self.data = load_data()
+        # The bank opens on the worker thread (a SQLite migration, a large JSON
+        # file or shard processes can take a while); calls queued behind it on
+        # the worker wait for it, and the screens come up once it is ready.
+        self.bank = None
         self.current_card = None
         self.last_activity = time.time()
+        self.worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="atm-worker")
+        self._opening = self.worker.submit(open_bank)
+        self._ready = False
+        self._syncing = False  # a sync_if_due is queued on the worker
 
         # Style
         style = ttk.Style(self)
-        try:
-            self.call("source", "azure.tcl")
-            style.theme_use("azure")
-        except Exception:
-            style.theme_use("clam")
+        theme = "clam"
+        if os.path.exists(THEME_FILE):
+            try:
+                self.call("source", THEME_FILE)
+                theme = "azure"
+            except tk.TclError:
+                pass
+        style.theme_use(theme)
 
         style.configure("TFrame", background="#0f172a")
         style.configure("TLabel", background="#0f172a", foreground="#e2e8f0", font=("Inter", 12))
@@ -87,115 +120,117 @@ class ATMApp(tk.Tk):
         # Container for screens
         self.container = ttk.Frame(self, padding=20)
         self.container.pack(fill="both", expand=True)
+        self.container.rowconfigure(0, weight=1)     # screens fill the window whichever ones exist yet
+        self.container.columnconfigure(0, weight=1)
 
-        self.frames = {}
-        for F in (WelcomeScreen, PinScreen, MenuScreen, AmountScreen, DepositScreen,
-                  TransferScreen, StatementScreen, ChangePinScreen, BalanceScreen):
-            frame = F(parent=self.container, app=self)
-            self.frames[F.__name__] = frame
-            frame.grid(row=0, column=0, sticky="nsew")
+        self.frames = {}  # screens are built on their first show()
+        self.splash = ttk.Label(self.container, text="Starting…", style="Header.TLabel")
+        self.splash.grid(row=0, column=0)
+        self.toast = Toaster(self)  # outcomes show here instead of in modal dialogs
+        self.profile.mark("theme + splash")
+        self.after_idle(self.profile.mark, "first frame")
 
-        self.show("WelcomeScreen")
         self.bind_all("<Any-KeyPress>", self._activity)
         self.bind_all("<Button>", self._activity)
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+        self.after(15, self._wait_for_bank)
+
+    def _wait_for_bank(self):
+        if not self._opening.done():
+            self.after(15, self._wait_for_bank)
+            return
+        error = self._opening.exception()
+        if error is not None:
+            self.splash.config(text=f"Could not open the bank data:\n{error}")
+            return
+        self.bank = self._opening.result()
+        self.profile.mark("bank open")
+        self.splash.destroy()
+        self.show("WelcomeScreen")
+        self.profile.mark("welcome shown")
         self.after(1000, self._check_timeout)
 
+    def mark_ready(self):
+        # Called by WelcomeScreen once its first page of cards is listed.
+        if self._ready:
+            return
+        self._ready = True
+        self.profile.mark("interactive")
+        if PROFILE_STARTUP == "json":
+            print(json.dumps(self.profile.as_dict()), file=sys.stderr)
+        elif PROFILE_STARTUP:
+            print(self.profile.report(), file=sys.stderr)
+        if EXIT_WHEN_READY:
+            self.after_idle(self._on_close)
+
+    def _on_close(self):
+        self.worker.shutdown(wait=True)
+        if self._opening.exception() is None:
+            self._opening.result().close()
+        self.destroy()
+
+    def run_async(self, fn, *args, on_done, on_error=None):
+        # Run a slow bank call (PIN hashing, network round trip) off the Tk thread;
+        # on_done(result) is called back on the Tk thread once it finishes. If the
+        # call raises, the error is shown and on_error(exc) runs instead, so the
+        # caller can re-enable whatever it disabled.
+        fut = self.worker.submit(fn, *args)
+
+        def poll():
+            if not fut.done():
+                self.after(15, poll)
+                return
+            try:
+                result = fut.result()
+            except Exception as e:
+                self.toast.error(f"The bank could not complete the request: {e}")
+                if on_error is not None:
+                    on_error(e)
+                return
+            on_done(result)
+        self.after(15, poll)
+
+    def fetch_user(self, on_done):
+        # The logged-in account, read on the worker like every other bank call.
+        # on_done(user) is skipped if the card changed (or is unknown) by then.
+        card = self.current_card
+        if not card:
+            return
+
+        def done(user):
+            if user and card == self.current_card:
+                on_done(user)
+        self.run_async(self.bank.get_user, card, on_done=done)
+
     def _activity(self, event=None):
         self.last_activity = time.time()
 
     def _check_timeout(self):
         if self.current_card and (time.time() - self.last_activity > SESSION_TIMEOUT_SECONDS):
-            messagebox.showinfo("Session Timeout", "You have been logged out due to inactivity.")
             self.logout()
+            self.toast.info("You have been logged out due to inactivity.")
+        if not self._syncing:
+            self._syncing = True
+            self.run_async(self.bank.sync_if_due, on_done=self._synced, on_error=self._synced)
         self.after(1000, self._check_timeout)
 
+    def _synced(self, result=None):
+        self._syncing = False
+
     def show(self, name: str):
-        frame = self.frames[name]
+        frame = self.frames.get(name)
+        if frame is None:
+            frame = self.frames[name] = SCREENS[name](parent=self.container, app=self)
+            frame.grid(row=0, column=0, sticky="nsew")
         frame.tkraise()
         if hasattr(frame, "on_show"):
             frame.on_show()
 
     def logout(self):
         self.current_card = None
+        self.run_async(end_session, self.bank, on_done=lambda _: None)  # ahead of any later login on the worker
         self.show("WelcomeScreen")
 
-    # Data helpers
-    def get_user(self, card):
-        return self.data["users"].get(card)
-
-    def add_txn(self, card, ttype, amount, balance_after, meta=None):
-        user = self.get_user(card)
-        if not user:
-            return
-        if meta is None:
-            meta = {}
-        user["transactions"].append({
-            "time": now_str(),
-            "type": ttype,
-            "amount": round(float(amount), 2),
-            "balance": round(float(balance_after), 2),
-            "meta": meta
-        })
-        # keep only last 200 to limit file growth
-        user["transactions"] = user["transactions"][-200:]
-        save_data(self.data)
-
-    def withdraw(self, card, amount):
-        user = self.get_user(card)
-        if not user:
-            return False, "Unknown card"
-        if amount < WITHDRAW_MIN or amount % WITHDRAW_STEP != 0:
-            return False, f"Amount must be at least {WITHDRAW_MIN} and a multiple of {WITHDRAW_STEP}."
-        if user["balance"] < amount:
-            return False, "Insufficient funds."
-        user["balance"] -= amount
-        save_data(self.data)
-        self.add_txn(card, "WITHDRAW", amount, user["balance"])
-        return True, f"Dispensed {format_currency(amount)}. New balance: {format_currency(user['balance'])}"
-
-    def deposit(self, card, amount):
-        user = self.get_user(card)
-        if not user:
-            return False, "Unknown card"
-        if amount < DEPOSIT_MIN or amount % DEPOSIT_STEP != 0:
-            return False, f"Amount must be at least {DEPOSIT_MIN} and a multiple of {DEPOSIT_STEP}."
-        user["balance"] += amount
-        save_data(self.data)
-        self.add_txn(card, "DEPOSIT", amount, user["balance"])
-        return True, f"Deposited {format_currency(amount)}. New balance: {format_currency(user['balance'])}"
-
-    def transfer(self, from_card, to_card, amount):
-        if from_card == to_card:
-            return False, "Cannot transfer to the same account."
-        src = self.get_user(from_card)
-        dst = self.get_user(to_card)
-        if not src:
-            return False, "Unknown source card."
-        if not dst:
-            return False, "Destination card not found."
-        if amount < TRANSFER_MIN:
-            return False, f"Minimum transfer is {TRANSFER_MIN}."
-        if src["balance"] < amount:
-            return False, "Insufficient funds."
-        src["balance"] -= amount
-        dst["balance"] += amount
-        save_data(self.data)
-        self.add_txn(from_card, "TRANSFER_OUT", amount, src["balance"], meta={"to": to_card})
-        self.add_txn(to_card, "TRANSFER_IN", amount, dst["balance"], meta={"from": from_card})
-        return True, f"Transferred {format_currency(amount)} to {dst['name']} ({to_card})."
-
-    def change_pin(self, card, old_pin, new_pin):
-        user = self.get_user(card)
-        if not user:
-            return False, "Unknown card."
-        if user["pin_hash"] != hash_pin(old_pin):
-            return False, "Old PIN is incorrect."
-        if len(new_pin) < 4 or not new_pin.isdigit():
-            return False, "PIN must be at least 4 digits."
-        user["pin_hash"] = hash_pin(new_pin)
-        save_data(self.data)
-        return True, "PIN updated successfully."
-
     def export_receipt(self, lines, title="receipt"):
         ts = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"{title}_{ts}.txt"
@@ -203,6 +238,14 @@ class ATMApp(tk.Tk):
             f.write("\n".join(lines))
         return filename
 
+    def save_receipt(self, lines, title="receipt"):
+        fn = self.export_receipt(lines, title)
+        self.toast.info(f"Receipt saved as {fn}")
+
+    def offer_receipt(self, msg, lines, title):
+        # Success toast with a one-click receipt; the next operation can be keyed in straight away.
+        self.toast.info(msg, action=("Save receipt", lambda: self.save_receipt(lines, title)))
+
 # -------------------------- UI SCREENS --------------------------
 
 class Keypad(ttk.Frame):
@@ -242,12 +285,29 @@ class WelcomeScreen(ttk.Frame):
         ttk.Label(left, text="Welcome to", style="Header.TLabel").pack(anchor="w", pady=(10, 0))
         ttk.Label(left, text=APP_TITLE, style="Big.TLabel").pack(anchor="w")
 
-        ttk.Label(left, text="Insert your card (select from demo)", font=("Inter", 13, "italic")).pack(anchor="w", pady=10)
+        ttk.Label(left, text="Insert your card (search by card number, account or name)",
+                  font=("Inter", 13, "italic")).pack(anchor="w", pady=10)
 
         self.card_var = tk.StringVar()
-        self.card_combo = ttk.Combobox(left, textvariable=self.card_var, state="readonly", width=36)
-        self.card_combo.pack(anchor="w", pady=5)
-        self._refresh_cards()
+        self.search_var = tk.StringVar()
+        self._entries = []       # directory entries shown in card_list
+        self._cursor = None      # find_cards cursor for the next page
+        self._more = False
+        self._loading = False
+        self._generation = 0     # bumped per search so late pages of an old one are dropped
+        self._search_job = None
+        self._query = ""
+        ttk.Entry(left, textvariable=self.search_var, width=38).pack(anchor="w", pady=5)
+        self.search_var.trace_add("write", lambda *_: self._schedule_search())
+        picker = ttk.Frame(left)
+        picker.pack(anchor="w")
+        self.card_list = tk.Listbox(picker, height=5, width=52, exportselection=False)
+        self.card_scroll = ttk.Scrollbar(picker, orient="vertical", command=self.card_list.yview)
+        self.card_list.configure(yscrollcommand=self._on_scroll)
+        self.card_list.bind("<<ListboxSelect>>", self._on_select)
+        self.card_list.bind("<Double-Button-1>", lambda e: self.insert_card())
+        self.card_scroll.pack(side="right", fill="y")
+        self.card_list.pack(side="left")
 
         ttk.Button(left, text="Insert Card", command=self.insert_card, style="Menu.TButton").pack(anchor="w", pady=12)
 
@@ -255,7 +315,7 @@ class WelcomeScreen(ttk.Frame):
             "Demo Cards:\n"
             "• Alice Demo — Card: 1111222233334444 — PIN: 1234\n"
             "• Bob Demo   — Card: 5555666677778888 — PIN: 4321\n\n"
-            "Tip: You can add more users by editing bank_data.json"
+            f"Tip: You can add more users by editing {LEGACY_DATA_FILE} before first start"
         ))
         info.pack(anchor="w", pady=16)
 
@@ -266,11 +326,65 @@ class WelcomeScreen(ttk.Frame):
         ttk.Label(right, text="Secure • Fast • Simple", style="Header.TLabel").pack(pady=20)
         ttk.Label(right, text="Use the keypad on each screen\nfor easy input.", justify="center").pack(pady=10)
 
+    def _schedule_search(self):
+        # Typing restarts a short timer, so a burst of keystrokes costs one lookup.
+        if self._search_job is not None:
+            self.after_cancel(self._search_job)
+        self._search_job = self.after(CARD_SEARCH_DELAY_MS, self._refresh_cards)
+
     def _refresh_cards(self):
-        cards = list(self.app.data["users"].keys())
-        self.card_combo["values"] = cards
-        if cards:
-            self.card_combo.current(0)
+        if self._search_job is not None:
+            self.after_cancel(self._search_job)
+            self._search_job = None
+        self._query = self.search_var.get()
+        self._generation += 1
+        self._entries = []
+        self._cursor = None
+        self._more = True
+        self._loading = False
+        self.card_list.delete(0, "end")
+        self.card_var.set("")
+        self._load_more()
+
+    def _on_scroll(self, first, last):
+        # Like the statement view: the next page is fetched as the list nears its end.
+        self.card_scroll.set(first, last)
+        if float(last) > 0.9:
+            self.after_idle(self._load_more)
+
+    def _load_more(self):
+        if self._loading or not self._more:
+            return
+        self._loading = True
+        generation = self._generation
+
+        def done(result):
+            if generation != self._generation:
+                return  # the search changed while this page was loading
+            self._loading = False
+            entries, self._cursor = result
+            for entry in entries:
+                self.card_list.insert("end", f"{entry['card']}   {entry['name']} ({entry['account_number']})")
+            self._entries += entries
+            self._more = self._cursor is not None
+            if self._entries and not self.card_var.get():
+                self.card_list.selection_set(0)
+                self.card_var.set(self._entries[0]["card"])
+            self.app.mark_ready()
+            if self._more and self.card_list.yview()[1] > 0.9:
+                self.after_idle(self._load_more)  # not enough rows yet to fill the list
+
+        def failed(exc):
+            if generation == self._generation:
+                self._loading = False  # scrolling to the end tries again
+
+        self.app.run_async(self.app.bank.find_cards, self._query, CARD_PAGE_SIZE, self._cursor,
+                           on_done=done, on_error=failed)
+
+    def _on_select(self, event=None):
+        sel = self.card_list.curselection()
+        if sel:
+            self.card_var.set(self._entries[sel[0]]["card"])
 
     def open_data_file(self):
         path = os.path.abspath(DATA_FILE)
@@ -290,12 +404,13 @@ class WelcomeScreen(ttk.Frame):
     def insert_card(self):
         card = self.card_var.get()
         if not card:
-            messagebox.showwarning("Select Card", "Please select a card to insert.")
+            self.app.toast.error("Please select a card to insert.")
             return
         self.app.current_card = card
         self.app.show("PinScreen")
 
     def on_show(self):
+        self.search_var.set("")
         self._refresh_cards()
 
 class PinScreen(ttk.Frame):
@@ -317,7 +432,8 @@ class PinScreen(ttk.Frame):
         self.pin_entry.pack(anchor="w", pady=10)
         self.pin_entry.focus()
 
-        ttk.Button(left, text="Login", command=self.try_login, style="Menu.TButton").pack(anchor="w", pady=10)
+        self.login_btn = ttk.Button(left, text="Login", command=self.try_login, style="Menu.TButton")
+        self.login_btn.pack(anchor="w", pady=10)
         ttk.Button(left, text="Cancel", command=self.app.logout).pack(anchor="w")
 
         self.keypad = Keypad(right,
@@ -338,27 +454,33 @@ class PinScreen(ttk.Frame):
         self.pin_var.set(cur[:-1])
 
     def on_show(self):
-        user = self.app.get_user(self.app.current_card) if self.app.current_card else None
-        if user:
-            self.name_label.config(text=f"Hello, {user['name']}")
+        self.name_label.config(text="")
+        self.app.fetch_user(lambda user: self.name_label.config(text=f"Hello, {user['name']}"))
         self.pin_var.set("")
         self.pin_entry.focus_set()
 
     def try_login(self):
         pin = self.pin_var.get().strip()
         if not pin.isdigit() or len(pin) < 4:
-            messagebox.showerror("Invalid PIN", "PIN must be at least 4 digits.")
+            self.app.toast.error("PIN must be at least 4 digits.")
             return
-        user = self.app.get_user(self.app.current_card)
-        if not user:
-            messagebox.showerror("Error", "Card not recognized.")
+        if self.login_btn.instate(["disabled"]):
+            return  # a login is already being checked
+        self.login_btn.state(["disabled"])
+        self.app.run_async(card_login, self.app.bank, self.app.current_card, pin, on_done=self._login_done,
+                           on_error=lambda e: self.login_btn.state(["!disabled"]))
+
+    def _login_done(self, result):
+        self.login_btn.state(["!disabled"])
+        if result is None:
+            self.app.toast.error("Card not recognized.")
             self.app.logout()
             return
-        if user["pin_hash"] != hash_pin(pin):
-            messagebox.showerror("Access Denied", "Incorrect PIN. Try again.")
+        ok, msg = result
+        if not ok:
+            self.app.toast.error(msg)
             self.pin_var.set("")
             return
-        self.app.add_txn(self.app.current_card, "LOGIN", 0, user["balance"])
         self.app.show("MenuScreen")
 
 class MenuScreen(ttk.Frame):
@@ -380,7 +502,7 @@ class MenuScreen(ttk.Frame):
             ("Withdraw", lambda: self.app.show("AmountScreen")),
             ("Deposit", lambda: self.app.show("DepositScreen")),
             ("Transfer", lambda: self.app.show("TransferScreen")),
-            ("Mini Statement", lambda: self.app.show("StatementScreen")),
+            ("Statement", lambda: self.app.show("StatementScreen")),
             ("Change PIN", lambda: self.app.show("ChangePinScreen")),
         ]
 
@@ -390,9 +512,7 @@ class MenuScreen(ttk.Frame):
             btn.grid(row=r, column=c, padx=12, pady=12, ipadx=8, ipady=12)
 
     def on_show(self):
-        user = self.app.get_user(self.app.current_card)
-        if user:
-            self.user_label.config(text=f"{user['name']} — {user['account_number']}")
+        self.app.fetch_user(lambda user: self.user_label.config(text=f"{user['name']} — {user['account_number']}"))
 
 class BalanceScreen(ttk.Frame):
     def __init__(self, parent, app: ATMApp):
@@ -404,6 +524,7 @@ class BalanceScreen(ttk.Frame):
         ttk.Button(top, text="← Back", command=lambda: self.app.show("MenuScreen")).pack(side="left")
         ttk.Label(top, text="Account Balance", style="Header.TLabel").pack(side="left", padx=12)
 
+        self._user = None  # account as last fetched; the receipt shows what is on screen
         self.balance_label = ttk.Label(self, text="", style="Big.TLabel")
         self.balance_label.pack(pady=20)
 
@@ -413,12 +534,16 @@ class BalanceScreen(ttk.Frame):
         ttk.Button(btns, text="Main Menu", command=lambda: self.app.show("MenuScreen")).pack(side="left", padx=8)
 
     def on_show(self):
-        user = self.app.get_user(self.app.current_card)
-        if user:
-            self.balance_label.config(text=f"Available Balance: {format_currency(user['balance'])}")
+        self._user = None
+        self.balance_label.config(text="Checking…")
+        self.app.fetch_user(self._show_user)
+
+    def _show_user(self, user):
+        self._user = user
+        self.balance_label.config(text=f"Available Balance: {format_currency(user['balance'])}")
 
     def export_receipt(self):
-        user = self.app.get_user(self.app.current_card)
+        user = self._user
         if not user:
             return
         lines = [
@@ -428,13 +553,13 @@ class BalanceScreen(ttk.Frame):
             f"Account: {user['account_number']}",
             f"Available Balance: {format_currency(user['balance'])}",
         ]
-        fn = self.app.export_receipt(lines, title="balance_receipt")
-        messagebox.showinfo("Receipt Saved", f"Saved as {fn}")
+        self.app.save_receipt(lines, title="balance_receipt")
 
 class AmountScreen(ttk.Frame):
     def __init__(self, parent, app: ATMApp):
         super().__init__(parent)
         self.app = app
+        self._busy = False  # an operation is on its way to the bank
         self.amount_var = tk.StringVar()
 
         top = ttk.Frame(self, padding=20)
@@ -479,23 +604,31 @@ class AmountScreen(ttk.Frame):
         try:
             amount = int(self.amount_var.get())
         except Exception:
-            messagebox.showerror("Invalid Input", "Enter a whole number amount.")
+            self.app.toast.error("Enter a whole number amount.")
             return
-        ok, msg = self.app.withdraw(self.app.current_card, amount)
+        if self._busy:
+            return  # the last withdrawal is still being processed
+        self._busy = True
+        self.app.run_async(posted, self.app.bank, "withdraw", self.app.current_card, amount,
+                           on_done=lambda result: self._withdraw_done(amount, result), on_error=self._failed)
+
+    def _failed(self, exc):
+        self._busy = False
+
+    def _withdraw_done(self, amount, result):
+        self._busy = False
+        ok, msg, user = result
         if ok:
             self.status.config(text=msg, foreground="#a3e635")
-            if messagebox.askyesno("Receipt", "Withdrawal successful. Do you want a receipt?"):
-                user = self.app.get_user(self.app.current_card)
-                lines = [
-                    f"{APP_TITLE} — Withdrawal Receipt",
-                    f"Date: {now_str()}",
-                    f"Name: {user['name']}",
-                    f"Account: {user['account_number']}",
-                    f"Amount: {format_currency(amount)}",
-                    f"Balance: {format_currency(user['balance'])}",
-                ]
-                fn = self.app.export_receipt(lines, title="withdraw_receipt")
-                messagebox.showinfo("Receipt Saved", f"Saved as {fn}")
+            lines = [
+                f"{APP_TITLE} — Withdrawal Receipt",
+                f"Date: {now_str()}",
+                f"Name: {user['name']}",
+                f"Account: {user['account_number']}",
+                f"Amount: {format_currency(amount)}",
+                f"Balance: {format_currency(user['balance'])}",
+            ]
+            self.app.offer_receipt(msg, lines, "withdraw_receipt")
         else:
             self.status.config(text=msg, foreground="#fca5a5")
 
@@ -503,6 +636,7 @@ class DepositScreen(ttk.Frame):
     def __init__(self, parent, app: ATMApp):
         super().__init__(parent)
         self.app = app
+        self._busy = False  # an operation is on its way to the bank
         self.amount_var = tk.StringVar()
 
         top = ttk.Frame(self, padding=20)
@@ -546,23 +680,31 @@ class DepositScreen(ttk.Frame):
         try:
             amount = int(self.amount_var.get())
         except Exception:
-            messagebox.showerror("Invalid Input", "Enter a whole number amount.")
+            self.app.toast.error("Enter a whole number amount.")
             return
-        ok, msg = self.app.deposit(self.app.current_card, amount)
+        if self._busy:
+            return  # the last deposit is still being processed
+        self._busy = True
+        self.app.run_async(posted, self.app.bank, "deposit", self.app.current_card, amount,
+                           on_done=lambda result: self._deposit_done(amount, result), on_error=self._failed)
+
+    def _failed(self, exc):
+        self._busy = False
+
+    def _deposit_done(self, amount, result):
+        self._busy = False
+        ok, msg, user = result
         if ok:
             self.status.config(text=msg, foreground="#a3e635")
-            if messagebox.askyesno("Receipt", "Deposit successful. Do you want a receipt?"):
-                user = self.app.get_user(self.app.current_card)
-                lines = [
-                    f"{APP_TITLE} — Deposit Receipt",
-                    f"Date: {now_str()}",
-                    f"Name: {user['name']}",
-                    f"Account: {user['account_number']}",
-                    f"Amount: {format_currency(amount)}",
-                    f"Balance: {format_currency(user['balance'])}",
-                ]
-                fn = self.app.export_receipt(lines, title="deposit_receipt")
-                messagebox.showinfo("Receipt Saved", f"Saved as {fn}")
+            lines = [
+                f"{APP_TITLE} — Deposit Receipt",
+                f"Date: {now_str()}",
+                f"Name: {user['name']}",
+                f"Account: {user['account_number']}",
+                f"Amount: {format_currency(amount)}",
+                f"Balance: {format_currency(user['balance'])}",
+            ]
+            self.app.offer_receipt(msg, lines, "deposit_receipt")
         else:
             self.status.config(text=msg, foreground="#fca5a5")
 
@@ -570,6 +712,7 @@ class TransferScreen(ttk.Frame):
     def __init__(self, parent, app: ATMApp):
         super().__init__(parent)
         self.app = app
+        self._busy = False  # an operation is on its way to the bank
         self.card_var = tk.StringVar()
         self.amount_var = tk.StringVar()
 
@@ -633,24 +776,38 @@ class TransferScreen(ttk.Frame):
         try:
             amount = int(self.amount_var.get())
         except Exception:
-            messagebox.showerror("Invalid Input", "Enter a whole number amount.")
+            self.app.toast.error("Enter a whole number amount.")
             return
-        ok, msg = self.app.transfer(self.app.current_card, to_card, amount)
+        if self._busy:
+            return  # the last transfer is still being processed
+        self._busy = True
+        bank = self.app.bank
+
+        def transfer(card):
+            ok, msg, src = posted(bank, "transfer", card, to_card, amount)
+            return ok, msg, src, bank.get_user(to_card) if ok else None
+
+        self.app.run_async(transfer, self.app.current_card,
+                           on_done=lambda result: self._transfer_done(to_card, amount, result),
+                           on_error=self._failed)
+
+    def _failed(self, exc):
+        self._busy = False
+
+    def _transfer_done(self, to_card, amount, result):
+        self._busy = False
+        ok, msg, src, dst = result
         if ok:
             self.status.config(text=msg, foreground="#a3e635")
-            if messagebox.askyesno("Receipt", "Transfer successful. Do you want a receipt?"):
-                src = self.app.get_user(self.app.current_card)
-                dst = self.app.get_user(to_card)
-                lines = [
-                    f"{APP_TITLE} — Transfer Receipt",
-                    f"Date: {now_str()}",
-                    f"From: {src['name']}  ({self.app.current_card})",
-                    f"To:   {dst['name']} ({to_card})",
-                    f"Amount: {format_currency(amount)}",
-                    f"Your New Balance: {format_currency(src['balance'])}",
-                ]
-                fn = self.app.export_receipt(lines, title="transfer_receipt")
-                messagebox.showinfo("Receipt Saved", f"Saved as {fn}")
+            lines = [
+                f"{APP_TITLE} — Transfer Receipt",
+                f"Date: {now_str()}",
+                f"From: {src['name']}  ({self.app.current_card})",
+                f"To:   {dst['name']} ({to_card})",
+                f"Amount: {format_currency(amount)}",
+                f"Your New Balance: {format_currency(src['balance'])}",
+            ]
+            self.app.offer_receipt(msg, lines, "transfer_receipt")
         else:
             self.status.config(text=msg, foreground="#fca5a5")
 
@@ -658,13 +815,35 @@ class StatementScreen(ttk.Frame):
     def __init__(self, parent, app: ATMApp):
         super().__init__(parent)
         self.app = app
+        self._chunks = None    # iter_chunks generator for the current filter
+        self._more = False     # whether the history has rows beyond those shown
+        self._loading = False
 
-        top = ttk.Frame(self, padding=20)
+        top = ttk.Frame(self, padding=(20, 20, 20, 6))
         top.pack(fill="x")
         ttk.Button(top, text="← Back", command=lambda: self.app.show("MenuScreen")).pack(side="left")
-        ttk.Label(top, text="Mini Statement (Last 10)", style="Header.TLabel").pack(side="left", padx=12)
-
-        self.tree = ttk.Treeview(self, columns=("time", "type", "amount", "balance", "meta"), show="headings", height=12)
+        ttk.Label(top, text="Statement", style="Header.TLabel").pack(side="left", padx=12)
+        self.count_label = ttk.Label(top, text="")
+        self.count_label.pack(side="right")
+
+        filters = ttk.Frame(self, padding=(20, 0))
+        filters.pack(fill="x")
+        self.since_var = tk.StringVar()
+        self.until_var = tk.StringVar()
+        self.type_var = tk.StringVar(value="All")
+        ttk.Label(filters, text="From:").pack(side="left")
+        ttk.Entry(filters, textvariable=self.since_var, width=12).pack(side="left", padx=(4, 12))
+        ttk.Label(filters, text="To:").pack(side="left")
+        ttk.Entry(filters, textvariable=self.until_var, width=12).pack(side="left", padx=(4, 12))
+        ttk.Label(filters, text="Type:").pack(side="left")
+        ttk.Combobox(filters, textvariable=self.type_var, values=("All",) + TXN_TYPES,
+                     state="readonly", width=14).pack(side="left", padx=(4, 12))
+        ttk.Button(filters, text="Apply", command=self.reload).pack(side="left")
+        ttk.Label(filters, text="dates as YYYY-MM-DD").pack(side="left", padx=12)
+
+        body = ttk.Frame(self)
+        body.pack(fill="both", expand=True, padx=20, pady=10)
+        self.tree = ttk.Treeview(body, columns=("time", "type", "amount", "balance", "meta"), show="headings", height=12)
         self.tree.heading("time", text="Time")
         self.tree.heading("type", text="Type")
         self.tree.heading("amount", text="Amount")
@@ -675,52 +854,99 @@ class StatementScreen(ttk.Frame):
         self.tree.column("amount", width=120, anchor="e")
         self.tree.column("balance", width=120, anchor="e")
         self.tree.column("meta", width=250)
-        self.tree.pack(fill="both", expand=True, padx=20, pady=10)
+        self.scroll = ttk.Scrollbar(body, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self._on_scroll)
+        self.scroll.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
 
         btns = ttk.Frame(self, padding=10)
         btns.pack()
-        ttk.Button(btns, text="Export as Receipt", command=self.export_receipt).pack(side="left", padx=8)
+        ttk.Button(btns, text="Export TXT", command=lambda: self.export(".txt")).pack(side="left", padx=8)
+        ttk.Button(btns, text="Export CSV", command=lambda: self.export(".csv")).pack(side="left", padx=8)
+        ttk.Button(btns, text="Export Printable", command=lambda: self.export(".prn")).pack(side="left", padx=8)
 
     def on_show(self):
-        for row in self.tree.get_children():
-            self.tree.delete(row)
-        user = self.app.get_user(self.app.current_card)
-        if not user:
+        self.reload()
+
+    def _filters(self):
+        # (since, until, types) from the filter bar; dates are compared against the "YYYY-MM-DD HH:MM:SS" stamps.
+        since, until = self.since_var.get().strip(), self.until_var.get().strip()
+        for text in (since, until):
+            if text:
+                datetime.strptime(text, "%Y-%m-%d")
+        types = None if self.type_var.get() == "All" else [self.type_var.get()]
+        return since or None, (until + " 23:59:59") if until else None, types
+
+    def reload(self):
+        try:
+            since, until, types = self._filters()
+        except ValueError:
+            self.app.toast.error("Dates must be YYYY-MM-DD.")
             return
-        txns = user.get("transactions", [])[-10:]
-        for t in txns[::-1]:
-            meta_str = ""
-            if t.get("meta"):
-                kv = [f"{k}:{v}" for k, v in t["meta"].items()]
-                meta_str = ", ".join(kv)
-            self.tree.insert("", "end", values=(
-                t.get("time", ""),
-                t.get("type", ""),
-                format_currency(t.get("amount", 0)),
-                format_currency(t.get("balance", 0)),
-                meta_str
-            ))
-
-    def export_receipt(self):
-        user = self.app.get_user(self.app.current_card)
-        if not user:
+        self.tree.delete(*self.tree.get_children())
+        self._chunks = iter_chunks(self.app.bank, self.app.current_card, since, until, types,
+                                   chunk=STATEMENT_PAGE_SIZE)
+        self._more = True
+        self._loading = False
+        self._load_more()
+
+    def _on_scroll(self, first, last):
+        # Rows are fetched a chunk at a time as the view nears the bottom of what is loaded.
+        self.scroll.set(first, last)
+        if float(last) > 0.9:
+            self.after_idle(self._load_more)
+
+    def _load_more(self):
+        if self._loading or not self._more or self._chunks is None or not self.app.current_card:
             return
-        txns = user.get("transactions", [])[-10:]
-        lines = [
-            f"{APP_TITLE} — Mini Statement",
-            f"Date: {now_str()}",
-            f"Name: {user['name']}",
-            f"Account: {user['account_number']}",
-            "",
-        ]
-        for t in txns[::-1]:
-            meta_str = ""
-            if t.get("meta"):
-                kv = [f"{k}:{v}" for k, v in t["meta"].items()]
-                meta_str = " (" + ", ".join(kv) + ")"
-            lines.append(f"{t['time']}  {t['type']:<14} {format_currency(t['amount']):>12}  Bal: {format_currency(t['balance'])}{meta_str}")
-        fn = self.app.export_receipt(lines, title="mini_statement")
-        messagebox.showinfo("Receipt Saved", f"Saved as {fn}")
+        self._loading = True
+        chunks = self._chunks
+
+        def done(result):
+            if chunks is not self._chunks:
+                return  # the filter changed while this chunk was loading
+            self._loading = False
+            rows, cursor = result
+            for row in rows:
+                self.tree.insert("", "end", values=row.values())
+            self._more = cursor is not None
+            shown = len(self.tree.get_children())
+            self.count_label.config(text=f"{shown} transactions" + (" (scroll for more)" if self._more else ""))
+            if self._more and self.tree.yview()[1] > 0.9:
+                self.after_idle(self._load_more)  # not enough rows yet to fill the view
+
+        def failed(exc):
+            if chunks is self._chunks:
+                self._loading = False
+                self._chunks = None  # a generator that raised is finished; Show starts over
+
+        self.app.run_async(next, chunks, on_done=done, on_error=failed)
+
+    def export(self, ext):
+        if not self.app.current_card:
+            return
+        try:
+            since, until, types = self._filters()
+        except ValueError:
+            self.app.toast.error("Dates must be YYYY-MM-DD.")
+            return
+        bank = self.app.bank
+        filename = f"statement_{datetime.now().strftime('%Y%m%d_%H%M%S')}{ext}"
+
+        def export(card):
+            # On the worker: the account for the header, then the rows, streamed to the file.
+            user = bank.get_user(card)
+            if not user:
+                return None
+            header = statement_header(f"{APP_TITLE} — Statement", user, since, until, types)
+            return write_statement(iter_statement(bank, card, since, until, types), filename, header)
+
+        def done(n):
+            if n is not None:
+                self.app.toast.info(f"Saved {n} transactions as {filename}")
+
+        self.app.toast.info("Exporting statement…")
+        self.app.run_async(export, self.app.current_card, on_done=done)
 
 class ChangePinScreen(ttk.Frame):
     def __init__(self, parent, app: ATMApp):
@@ -747,7 +973,8 @@ class ChangePinScreen(ttk.Frame):
         e3 = ttk.Entry(form, textvariable=self.conf_var, show="•", font=("Inter", 14), width=20)
         e1.grid(row=0, column=1, pady=4); e2.grid(row=1, column=1, pady=4); e3.grid(row=2, column=1, pady=4)
 
-        ttk.Button(form, text="Update PIN", command=self.do_change, style="Menu.TButton").grid(row=3, column=0, columnspan=2, pady=10)
+        self.update_btn = ttk.Button(form, text="Update PIN", command=self.do_change, style="Menu.TButton")
+        self.update_btn.grid(row=3, column=0, columnspan=2, pady=10)
         self.status = ttk.Label(form, text="", foreground="#a3e635")
         self.status.grid(row=4, column=0, columnspan=2, sticky="w")
 
@@ -790,9 +1017,25 @@ class ChangePinScreen(ttk.Frame):
         if newp != conf:
             self.status.config(text="New PIN and confirmation do not match.", foreground="#fca5a5")
             return
-        ok, msg = self.app.change_pin(self.app.current_card, oldp, newp)
+        if self.update_btn.instate(["disabled"]):
+            return
+        self.update_btn.state(["disabled"])
+        self.status.config(text="Checking...", foreground="#e2e8f0")
+        self.app.run_async(self.app.bank.change_pin, self.app.current_card, oldp, newp, on_done=self._change_done,
+                           on_error=self._change_failed)
+
+    def _change_done(self, result):
+        self.update_btn.state(["!disabled"])
+        ok, msg = result
         self.status.config(text=msg, foreground="#a3e635" if ok else "#fca5a5")
 
+    def _change_failed(self, exc):
+        self.update_btn.state(["!disabled"])
+        self.status.config(text="")
+
+SCREENS = {F.__name__: F for F in (WelcomeScreen, PinScreen, MenuScreen, AmountScreen, DepositScreen,
+                                    TransferScreen, StatementScreen, ChangePinScreen, BalanceScreen)}
+
 def main():
     app = ATMApp()
     app.mainloop()
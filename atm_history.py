@@ -0,0 +1,103 @@
+import json
+import os
+from collections import deque
+
+# Unbounded per-account transaction history for the JSON store.
+#
+# The newest HISTORY_PAGE_SIZE entries of an account live in a ring buffer
+# (user["transactions"]), so appending never copies the list. Whenever another
+# full page has accumulated it is sealed into a cold segment file
+# <directory>/<card>/<page>.json and its time bounds are recorded in
+# user["history_pages"]. Page k always holds positions [k*size, (k+1)*size) of
+# the account's history, so re-sealing during journal replay is idempotent.
+
+HISTORY_PAGE_SIZE = 200
+
+class PagedHistory:
+    def __init__(self, directory, page_size=HISTORY_PAGE_SIZE):
+        self.directory = directory
+        self.page_size = page_size
+
+    def attach(self, card, user):
+        # Bring a freshly loaded account into shape; older files only had a capped list.
+        hot = user.get("transactions", [])
+        user.setdefault("txn_count", len(hot))
+        user.setdefault("history_pages", [])
+        user["transactions"] = deque(hot, maxlen=self.page_size)
+        if len(user["history_pages"]) < user["txn_count"] // self.page_size:
+            self._seal(card, user)
+
+    def append(self, card, user, txn):
+        user["transactions"].append(txn)
+        user["txn_count"] += 1
+        if user["txn_count"] % self.page_size == 0:
+            self._seal(card, user)
+
+    def _page_path(self, card, page):
+        return os.path.join(self.directory, card, f"{page:06d}.json")
+
+    def _seal(self, card, user):
+        page = user["txn_count"] // self.page_size - 1
+        entries = list(user["transactions"])[-self.page_size:]
+        path = self._page_path(card, page)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entries, f, separators=(",", ":"))
+        os.replace(tmp, path)
+        bounds = [entries[0]["time"], entries[-1]["time"]]
+        pages = user["history_pages"]
+        if page < len(pages):
+            pages[page] = bounds
+        else:
+            pages.append(bounds)
+
+    def load_page(self, card, page):
+        with open(self._page_path(card, page), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def iter_all(self, card, user):
+        # Oldest first; used for migration and export.
+        size = self.page_size
+        sealed = len(user["history_pages"])
+        for page in range(sealed):
+            yield from self.load_page(card, page)
+        hot = list(user["transactions"])
+        skip = len(hot) - (user["txn_count"] - sealed * size)
+        yield from hot[skip:]
+
+    def read(self, card, user, limit=10, before=None, since=None, until=None, types=None):
+        # Newest-first slice of history, optionally limited to since <= time <= until
+        # and to the given transaction types.
+        # `before` is the cursor returned by the previous call; None means "start at the newest".
+        # Only the pages that overlap the requested range are read from disk.
+        size = self.page_size
+        total = user["txn_count"]
+        hot = list(user["transactions"])
+        hot_start = total - len(hot)
+        pos = total if before is None else before
+        out = []
+        while pos > 0 and len(out) < limit:
+            if pos > hot_start:
+                chunk, base = hot, hot_start
+            else:
+                page = (pos - 1) // size
+                first, last = user["history_pages"][page]
+                if since and last < since:
+                    pos = 0
+                    break
+                if until and first > until:
+                    pos = page * size
+                    continue
+                chunk, base = self.load_page(card, page), page * size
+            i = pos - 1
+            while i >= base and len(out) < limit:
+                t = chunk[i - base]
+                if since and t["time"] < since:
+                    i = -1
+                    break
+                if (not until or t["time"] <= until) and (not types or t["type"] in types):
+                    out.append(t)
+                i -= 1
+            pos = i + 1
+        return out, (pos if pos > 0 else None)
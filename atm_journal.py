@@ -0,0 +1,148 @@
+import json
+import os
+import time
+
+# Append-only operation log for the ATM bank data.
+#
+# Every mutation is written as one compact JSON line instead of rewriting the
+# whole bank file. The full file is only rewritten on compaction, after which
+# the log is truncated. Each record carries a sequence number "n"; the snapshot
+# remembers the last sequence it contains ("journal_seq") so replay after a
+# crash between snapshot and truncation never applies a record twice.
+# A record holds every op of one logical operation and is written as a single
+# line, so a torn write drops the whole operation rather than half of it.
+#
+# Snapshots are written in the background: rotate() moves the log aside to
+# <journal>.old and starts a fresh one, and drop_old() deletes it once the
+# snapshot covering it is on disk. Until then replay reads both files.
+
+JOURNAL_FSYNC_BATCH = 32        # fsync after this many unsynced records...
+JOURNAL_FSYNC_INTERVAL = 0.25   # ...or once this many seconds have passed
+JOURNAL_COMPACT_EVERY = 5000    # records before the snapshot is rewritten
+
+def apply_record(data, rec, append_txn):
+    # A record is one committed unit of work: {"n": seq, "ops": [...]}.
+    # Older logs wrote a bare op per line, so accept those too.
+    for op in rec.get("ops", (rec,)):
+        card = op.get("c")
+        user = data["users"].get(card)
+        if user is None:
+            continue
+        kind = op["op"]
+        if kind == "bal":
+            user["balance"] = op["v"]
+        elif kind == "pin":
+            user["pin_hash"] = op["v"]
+        elif kind == "txn":
+            append_txn(card, user, op["t"])
+
+class Journal:
+    def __init__(self, path, fsync_batch=JOURNAL_FSYNC_BATCH, fsync_interval=JOURNAL_FSYNC_INTERVAL):
+        self.path = path
+        self.old_path = path + ".old"
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.seq = 0        # last sequence number handed out
+        self.count = 0      # records in the log since the last compaction
+        self._f = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def replay(self, after_seq=0):
+        # Yield records newer than after_seq. A torn last line (crash during
+        # write) is cut off so the next append starts on a clean line.
+        self.seq = max(self.seq, after_seq)
+        for path in (self.old_path, self.path):
+            if os.path.exists(path):
+                yield from self._replay_file(path, after_seq)
+
+    def _replay_file(self, path, after_seq):
+        good = 0
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                good += len(line)
+                self.count += 1
+                n = rec.get("n", 0)
+                if n > self.seq:
+                    self.seq = n
+                if n > after_seq:
+                    yield rec
+        if good != os.path.getsize(path):
+            with open(path, "r+b") as f:
+                f.truncate(good)
+
+    def append(self, rec):
+        if self._f is None:
+            self._f = open(self.path, "a", encoding="utf-8")
+        self.seq += 1
+        rec["n"] = self.seq
+        self._f.write(json.dumps(rec, separators=(",", ":")) + "\n")
+        self._f.flush()
+        self.count += 1
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_batch:
+            self.sync()
+        else:
+            self.sync_if_due()
+        return self.seq
+
+    def append_many(self, recs):
+        # Group commit: every record in one write, then a single fsync before returning.
+        if self._f is None:
+            self._f = open(self.path, "a", encoding="utf-8")
+        lines = []
+        for rec in recs:
+            self.seq += 1
+            rec["n"] = self.seq
+            lines.append(json.dumps(rec, separators=(",", ":")) + "\n")
+        self._f.write("".join(lines))
+        self._f.flush()
+        self.count += len(recs)
+        self._unsynced += len(recs)
+        self.sync()
+        return self.seq
+
+    def sync_if_due(self):
+        if self._unsynced and time.monotonic() - self._last_sync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        if self._f is not None and self._unsynced:
+            os.fsync(self._f.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def reset(self):
+        # Called once a snapshot containing every record up to self.seq is safely on disk.
+        self.close()
+        with open(self.path, "w", encoding="utf-8"):
+            pass
+        self.drop_old()
+        self.count = 0
+
+    def has_old(self):
+        return os.path.exists(self.old_path)
+
+    def rotate(self):
+        # Start a fresh log; everything up to self.seq stays readable in old_path
+        # until drop_old(). Only one rotation may be outstanding.
+        self.close()
+        if os.path.exists(self.path):
+            os.replace(self.path, self.old_path)
+        self.count = 0
+
+    def drop_old(self):
+        if os.path.exists(self.old_path):
+            os.remove(self.old_path)
+
+    def close(self):
+        if self._f is not None:
+            self.sync()
+            self._f.close()
+            self._f = None
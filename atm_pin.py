@@ -0,0 +1,130 @@
+import argparse
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# PIN hashing for the ATM.
+#
+# Stored hashes are self-describing so the cost can be raised without a
+# migration; anything not matching the current settings is re-hashed on the
+# next successful login (see Bank.login):
+#   pbkdf2_sha256$<iterations>$<salt hex>$<hash hex>
+#   scrypt$<n>$<r>$<p>$<salt hex>$<hash hex>
+#   <64 hex chars>   legacy single SHA-256 with the old global salt
+#
+# hashlib releases the GIL while deriving keys, so verification can run on
+# worker threads without stalling the Tk event loop.
+
+PIN_KDF = os.environ.get("ATM_PIN_KDF", "pbkdf2_sha256")  # or "scrypt"
+PBKDF2_ITERATIONS = int(os.environ.get("ATM_PBKDF2_ITERATIONS", "100000"))
+SCRYPT_N = int(os.environ.get("ATM_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = 8
+SCRYPT_P = 1
+SALT_BYTES = 16
+VERIFY_CACHE_SIZE = 256  # successful (hash, pin) checks remembered per process
+
+def legacy_hash_pin(pin: str) -> str:
+    return hashlib.sha256(("atm_salt::" + pin).encode()).hexdigest()
+
+def _derive(scheme, params, salt, pin):
+    if scheme == "pbkdf2_sha256":
+        (iterations,) = params
+        return hashlib.pbkdf2_hmac("sha256", pin.encode(), salt, iterations)
+    if scheme == "scrypt":
+        n, r, p = params
+        return hashlib.scrypt(pin.encode(), salt=salt, n=n, r=r, p=p, maxmem=128 * r * n * 2 + 1024 * 1024)
+    raise ValueError(f"unknown PIN hash scheme {scheme!r}")
+
+def current_params(scheme=None):
+    scheme = scheme or PIN_KDF
+    if scheme == "pbkdf2_sha256":
+        return scheme, (PBKDF2_ITERATIONS,)
+    if scheme == "scrypt":
+        return scheme, (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    raise ValueError(f"unknown PIN hash scheme {scheme!r}")
+
+def hash_pin(pin: str, scheme=None, params=None) -> str:
+    if params is None:
+        scheme, params = current_params(scheme)
+    salt = os.urandom(SALT_BYTES)
+    digest = _derive(scheme, params, salt, pin)
+    stored = "$".join([scheme, *map(str, params), salt.hex(), digest.hex()])
+    _remember(stored, pin)  # the next login with this PIN needs no second derivation
+    return stored
+
+def parse_hash(stored):
+    parts = stored.split("$")
+    if len(parts) == 1:
+        return "legacy", (), None, parts[0]
+    return parts[0], tuple(int(x) for x in parts[1:-2]), bytes.fromhex(parts[-2]), parts[-1]
+
+def needs_rehash(stored):
+    scheme, params, _, _ = parse_hash(stored)
+    return (scheme, params) != current_params()
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_key = os.urandom(32)  # per-process; keeps raw PINs out of the cache
+
+def _verify_key(stored, pin):
+    return stored, hmac.new(_cache_key, pin.encode(), hashlib.sha256).digest()
+
+def _remember(stored, pin):
+    with _cache_lock:
+        _cache[_verify_key(stored, pin)] = True
+        while len(_cache) > VERIFY_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+def verify_pin(pin: str, stored: str) -> bool:
+    key = _verify_key(stored, pin)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return True
+    scheme, params, salt, expected = parse_hash(stored)
+    if scheme == "legacy":
+        ok = hmac.compare_digest(legacy_hash_pin(pin), expected)
+    else:
+        ok = hmac.compare_digest(_derive(scheme, params, salt, pin).hex(), expected)
+    if ok:
+        _remember(stored, pin)  # only successes are cached, so every wrong guess still pays the full cost
+    return ok
+
+def bench(scheme, params, seconds=1.0, threads=None):
+    # Logins/sec a server could sustain at this cost, using all cores.
+    threads = threads or os.cpu_count() or 1
+    stored = hash_pin("1234", scheme, params)
+    deadline = time.perf_counter() + seconds
+    counts = [0] * threads
+
+    def worker(i):
+        salt = parse_hash(stored)[2]
+        while time.perf_counter() < deadline:
+            _derive(scheme, params, salt, "1234")  # bypass the cache: measure the KDF itself
+            counts[i] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(worker, range(threads)))
+    elapsed = time.perf_counter() - start
+    return sum(counts) / elapsed, elapsed * threads / max(sum(counts), 1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PIN hashing cost settings.")
+    parser.add_argument("--seconds", type=float, default=1.0, help="time per setting")
+    parser.add_argument("--threads", type=int, default=None, help="worker threads (default: all cores)")
+    args = parser.parse_args()
+    settings = [("pbkdf2_sha256", (n,)) for n in (10_000, 50_000, 100_000, 200_000, 600_000)]
+    settings += [("scrypt", (n, SCRYPT_R, SCRYPT_P)) for n in (2 ** 12, 2 ** 14, 2 ** 15)]
+    print(f"{'scheme':<15}{'cost':<22}{'logins/s':>12}{'ms/login':>12}")
+    for scheme, params in settings:
+        rate, latency = bench(scheme, params, args.seconds, args.threads)
+        marker = "  <- current" if (scheme, params) == current_params(scheme) and scheme == PIN_KDF else ""
+        print(f"{scheme:<15}{','.join(map(str, params)):<22}{rate:>12,.0f}{latency * 1000:>12.1f}{marker}")
+
+if __name__ == "__main__":
+    main()
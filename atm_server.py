@@ -0,0 +1,338 @@
+import argparse
+import asyncio
+import itertools
+import json
+import socket
+import threading
+
+from atm_directory import DIRECTORY_PAGE_SIZE
+from atm_service import Bank
+
+# Ledger server: lets many ATM frontends share one Bank over a local socket.
+#
+# Wire format is one JSON object per line in each direction:
+#   request  {"id": 7, "op": "withdraw", "args": ["1111222233334444", 500]}
+#   response {"id": 7, "result": [true, "Dispensed ..."]}  or  {"id": 7, "error": "..."}
+# Clients may pipeline: send many requests without waiting for replies. Requests
+# from one connection run in order on a worker thread (the Bank does its own
+# locking, so connections proceed in parallel) and replies are flushed once the
+# connection's backlog is drained. Replies carry the request id.
+#
+# Each connection is one terminal session. A successful login binds the
+# connection to that card (a failed one or logout unbinds it); money and
+# history ops are refused for any other card, and get_user only returns the
+# balance of the bound card (name and account number otherwise, e.g. for a
+# transfer's payee).
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+SYNC_INTERVAL_SECONDS = 1.0
+
+# op name -> whether the Bank method returns a tuple the client should get back as one
+OPS = {
+    "get_user": False,
+    "cards": False,
+    "find_cards": True,
+    "recent_txns": False,
+    "history": True,
+    "login": True,
+    "withdraw": True,
+    "deposit": True,
+    "transfer": True,
+    "change_pin": True,
+    "flush": False,
+    "barrier": False,
+    "write_queue_depth": False,
+    "logout": False,
+}
+SESSION_OPS = {"recent_txns", "history", "withdraw", "deposit", "transfer", "change_pin"}  # first arg must be the bound card
+PUBLIC_FIELDS = ("name", "account_number")
+SESSION_FIELDS = PUBLIC_FIELDS + ("balance",)
+
+def public_record(user, own):
+    # JSON-safe subset of an account record; never the PIN hash or history.
+    return {k: user[k] for k in (SESSION_FIELDS if own else PUBLIC_FIELDS) if k in user}
+
+def encode(msg):
+    return (json.dumps(msg, separators=(",", ":")) + "\n").encode()
+
+class LedgerServer:
+    def __init__(self, bank):
+        self.bank = bank
+        self.server = None
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None):
+        if unix_path:
+            self.server = await asyncio.start_unix_server(self._handle, path=unix_path)
+        else:
+            self.server = await asyncio.start_server(self._handle, host, port)
+        self._sync_task = asyncio.create_task(self._sync_loop())
+        return self.server
+
+    async def _sync_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(SYNC_INTERVAL_SECONDS)
+            await loop.run_in_executor(None, self.bank.sync_if_due)
+
+    async def _handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        session = {"card": None}  # card this connection is logged in with
+
+        async def worker():
+            while True:
+                req = await queue.get()
+                if req is None:
+                    return
+                try:
+                    op = req.get("op")
+                    args = req.get("args", [])
+                    if op not in OPS:
+                        raise ValueError(f"unknown op {op!r}")
+                    if op in SESSION_OPS and (not args or args[0] != session["card"]):
+                        raise PermissionError("not logged in with this card")
+                    if op == "logout":
+                        session["card"] = None
+                        result = None
+                    else:
+                        result = await loop.run_in_executor(None, lambda: getattr(self.bank, op)(*args))
+                    if op == "login":
+                        session["card"] = args[0] if result[0] else None
+                    elif op == "get_user" and result:
+                        result = public_record(result, args[0] == session["card"])
+                    data = encode({"id": req.get("id"), "result": result})
+                except Exception as e:
+                    data = encode({"id": req.get("id"), "error": f"{type(e).__name__}: {e}"})
+                writer.write(data)
+                if queue.empty():
+                    await writer.drain()
+
+        task = asyncio.create_task(worker())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    req = json.loads(line)
+                except ValueError:
+                    req = None
+                queue.put_nowait(req if isinstance(req, dict) else {"id": None, "op": None})
+            queue.put_nowait(None)
+            await task
+        except ConnectionError:
+            task.cancel()
+        finally:
+            writer.close()
+
+    async def serve_forever(self):
+        async with self.server:
+            await self.server.serve_forever()
+
+class LedgerError(Exception):
+    pass
+
+class LedgerClient:
+    # Blocking client with the same methods as Bank, so ATMApp can use either.
+    # One connection is kept open and reused; call_many() pipelines a batch.
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None, timeout=10.0):
+        self.address = unix_path or (host, port)
+        self.timeout = timeout
+        self._sock = None
+        self._file = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_address(cls, address):
+        # "host:port", ":port" or a unix socket path
+        if ":" in address:
+            host, port = address.rsplit(":", 1)
+            return cls(host or DEFAULT_HOST, int(port))
+        return cls(unix_path=address)
+
+    def _connect(self):
+        if isinstance(self.address, str):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.address)
+        else:
+            sock = socket.create_connection(self.address, timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock = sock
+        self._file = sock.makefile("rb")
+
+    def _drop(self):
+        if self._sock is not None:
+            self._file.close()
+            self._sock.close()
+        self._sock = self._file = None
+
+    def call_many(self, calls):
+        # calls: list of (op, args); returns results in the same order.
+        with self._lock:
+            if self._sock is None:
+                self._connect()
+            ids = []
+            payload = b""
+            for op, args in calls:
+                req_id = next(self._ids)
+                ids.append(req_id)
+                payload += encode({"id": req_id, "op": op, "args": list(args)})
+            try:
+                self._sock.sendall(payload)
+                replies = {}
+                while len(replies) < len(ids):
+                    line = self._file.readline()
+                    if not line:
+                        raise ConnectionError("ledger server closed the connection")
+                    reply = json.loads(line)
+                    replies[reply["id"]] = reply
+            except (OSError, ValueError):
+                # Never retry: the request may already have been applied.
+                self._drop()
+                raise
+        results = []
+        for (op, _), req_id in zip(calls, ids):
+            reply = replies[req_id]
+            if "error" in reply:
+                raise LedgerError(reply["error"])
+            result = reply["result"]
+            results.append(tuple(result) if OPS[op] else result)
+        return results
+
+    def call(self, op, *args):
+        return self.call_many([(op, args)])[0]
+
+    def get_user(self, card):
+        return self.call("get_user", card)
+
+    def cards(self):
+        return self.call("cards")
+
+    def find_cards(self, query="", limit=DIRECTORY_PAGE_SIZE, after=None):
+        return self.call("find_cards", query, limit, after)
+
+    def recent_txns(self, card, limit=10):
+        return self.call("recent_txns", card, limit)
+
+    def history(self, card, limit=10, before=None, since=None, until=None, types=None):
+        return self.call("history", card, limit, before, since, until, types)
+
+    def login(self, card, pin):
+        return self.call("login", card, pin)
+
+    def withdraw(self, card, amount):
+        return self.call("withdraw", card, amount)
+
+    def deposit(self, card, amount):
+        return self.call("deposit", card, amount)
+
+    def transfer(self, from_card, to_card, amount):
+        return self.call("transfer", from_card, to_card, amount)
+
+    def change_pin(self, card, old_pin, new_pin):
+        return self.call("change_pin", card, old_pin, new_pin)
+
+    def flush(self):
+        return self.call("flush")
+
+    def barrier(self):
+        return self.call("barrier")
+
+    def write_queue_depth(self):
+        return self.call("write_queue_depth")
+
+    def logout(self):
+        return self.call("logout")
+
+    def sync_if_due(self):
+        pass  # the server syncs its own storage
+
+    def close(self):
+        with self._lock:
+            self._drop()
+
+class AsyncLedgerClient:
+    # asyncio client; any number of coroutines can await calls on one connection concurrently.
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+        self._ids = itertools.count(1)
+        self._waiting = {}
+        self._reader_task = asyncio.create_task(self._read_loop())
+
+    @classmethod
+    async def connect(cls, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None):
+        if unix_path:
+            reader, writer = await asyncio.open_unix_connection(unix_path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def _read_loop(self):
+        try:
+            while True:
+                line = await self._reader.readline()
+                if not line:
+                    break
+                reply = json.loads(line)
+                fut = self._waiting.pop(reply.get("id"), None)
+                if fut is not None and not fut.done():
+                    fut.set_result(reply)
+        finally:
+            for fut in self._waiting.values():
+                if not fut.done():
+                    fut.set_exception(ConnectionError("ledger server closed the connection"))
+            self._waiting.clear()
+
+    async def call(self, op, *args):
+        req_id = next(self._ids)
+        fut = asyncio.get_running_loop().create_future()
+        self._waiting[req_id] = fut
+        self._writer.write(encode({"id": req_id, "op": op, "args": list(args)}))
+        await self._writer.drain()
+        reply = await fut
+        if "error" in reply:
+            raise LedgerError(reply["error"])
+        result = reply["result"]
+        return tuple(result) if OPS.get(op) else result
+
+    async def close(self):
+        self._writer.close()
+        self._reader_task.cancel()
+
+async def _serve(args):
+    if args.shards > 1:
+        from atm_shard import ShardedBank  # atm_shard imports this module
+        bank = ShardedBank.open(args.data, shards=args.shards, legacy_json=args.legacy_json,
+                                group_commit=args.group_commit)
+    else:
+        bank = Bank.open(args.data, legacy_json=args.legacy_json, group_commit=args.group_commit)
+    server = LedgerServer(bank)
+    await server.start(args.host, args.port, args.unix)
+    where = args.unix or f"{args.host}:{args.port}"
+    print(f"Ledger server on {where} using {args.data}")
+    try:
+        await server.serve_forever()
+    finally:
+        bank.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve one ATM ledger to many frontends.")
+    parser.add_argument("--data", default="bank_data.db")
+    parser.add_argument("--legacy-json", default="bank_data.json")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", help="listen on a unix socket path instead of TCP")
+    parser.add_argument("--group-commit", action="store_true", help="batch concurrent commits into one write")
+    parser.add_argument("--shards", type=int, default=1, help="split the ledger across this many processes")
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
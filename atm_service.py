@@ -0,0 +1,424 @@
+import argparse
+import random
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager, ExitStack
+from datetime import datetime
+
+from atm_directory import DIRECTORY_PAGE_SIZE
+from atm_pin import hash_pin, needs_rehash, verify_pin
+from atm_storage import open_storage
+
+# UI-independent banking core. ATMApp is one client of a Bank; any number of
+# Session objects (threads, a simulator, a network server) can drive the same
+# Bank concurrently.
+#
+# Locking: every operation takes the per-account lock of each card it touches
+# (in sorted order, so transfers cannot deadlock) for the whole
+# read-check-commit sequence. Storage objects are not thread-safe, so each call
+# into storage additionally holds _storage_lock, but only for that call.
+#
+# With group_commit=True, commits from concurrent operations are queued and
+# written together by a GroupCommitter thread (one storage commit_many per
+# group). Each caller still blocks, with its account locks held, until its own
+# unit is durable, so semantics are unchanged; only the write cost is shared.
+
+WITHDRAW_MIN = 100
+WITHDRAW_STEP = 100
+DEPOSIT_MIN = 50
+DEPOSIT_STEP = 50
+TRANSFER_MIN = 1
+GROUP_COMMIT_MAX_OPS = 500      # flush a group once this many units are queued...
+GROUP_COMMIT_MAX_DELAY = 0.005  # ...or this many seconds after the first one arrived,
+GROUP_COMMIT_IDLE_GAP = 0.0005  # ...or as soon as no new unit has arrived for this long
+
+def now_str():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def format_currency(x):
+    # Simple formatting with commas
+    return f"₹{x:,.2f}"
+
+class GroupCommitter:
+    def __init__(self, commit_many, max_ops=GROUP_COMMIT_MAX_OPS, max_delay=GROUP_COMMIT_MAX_DELAY,
+                 idle_gap=GROUP_COMMIT_IDLE_GAP):
+        self.commit_many = commit_many
+        self.max_ops = max_ops
+        self.max_delay = max_delay
+        self.idle_gap = idle_gap
+        self._queue = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+        self._thread.start()
+
+    def submit(self, ops):
+        # Returns a Future that resolves once ops are durable (asyncio callers can wrap_future it).
+        fut = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("group committer is closed")
+            self._queue.append((ops, fut))
+            self._cond.notify()
+        return fut
+
+    def pending(self):
+        with self._cond:
+            return len(self._queue)
+
+    def _next_group(self):
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            deadline = time.monotonic() + self.max_delay
+            while len(self._queue) < self.max_ops and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                seen = len(self._queue)
+                self._cond.wait(min(remaining, self.idle_gap))
+                if len(self._queue) == seen:
+                    break  # arrivals have dried up; waiting longer only adds latency
+            group = self._queue[:self.max_ops]
+            del self._queue[:self.max_ops]
+            return group
+
+    def _run(self):
+        while True:
+            group = self._next_group()
+            if not group:
+                return  # closed and drained
+            try:
+                errors = self.commit_many([ops for ops, _ in group])
+            except Exception as e:
+                errors = [e] * len(group)
+            for (_, fut), error in zip(group, errors):
+                if error is None:
+                    fut.set_result(None)
+                else:
+                    fut.set_exception(error)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+class Bank:
+    def __init__(self, storage, group_commit=False):
+        self.storage = storage
+        self._storage_lock = threading.RLock()
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._local = threading.local()
+        self.committer = GroupCommitter(self._commit_many) if group_commit else None
+
+    @classmethod
+    def open(cls, path, legacy_json=None, group_commit=False):
+        return cls(open_storage(path, legacy_json=legacy_json), group_commit=group_commit)
+
+    def _account_lock(self, card):
+        with self._locks_guard:
+            lock = self._locks.get(card)
+            if lock is None:
+                lock = self._locks[card] = threading.RLock()
+            return lock
+
+    @contextmanager
+    def locked(self, *cards):
+        with ExitStack() as stack:
+            for card in sorted(set(cards)):
+                stack.enter_context(self._account_lock(card))
+            yield
+
+    # Read helpers; records are copies so callers never see a half-applied commit
+    def get_user(self, card):
+        with self._storage_lock:
+            user = self.storage.get_user(card)
+            return dict(user) if user else None
+
+    def cards(self):
+        with self._storage_lock:
+            return self.storage.cards()
+
+    def find_cards(self, query="", limit=DIRECTORY_PAGE_SIZE, after=None):
+        with self._storage_lock:
+            return self.storage.find_cards(query, limit, after)
+
+    def recent_txns(self, card, limit=10):
+        with self._storage_lock:
+            return self.storage.transactions(card, limit)
+
+    def history(self, card, limit=10, before=None, since=None, until=None, types=None):
+        with self._storage_lock:
+            return self.storage.history(card, limit, before, since, until, types)
+
+    @contextmanager
+    def transaction(self):
+        # Unit of work: ops staged inside the block are committed together as
+        # one storage commit, or not at all if the block raises.
+        ops = getattr(self._local, "tx", None)
+        if ops is not None:
+            yield ops
+            return
+        self._local.tx = ops = []
+        try:
+            yield ops
+        finally:
+            self._local.tx = None
+        if ops:
+            self._commit(ops)
+
+    def _commit(self, ops):
+        if self.committer is not None:
+            self.committer.submit(ops).result()
+            return
+        with self._storage_lock:
+            self.storage.commit(ops)
+
+    def _commit_many(self, batches):
+        with self._storage_lock:
+            return self.storage.commit_many(batches)
+
+    def _record(self, op, card, **fields):
+        entry = {"op": op, "c": card, **fields}
+        ops = getattr(self._local, "tx", None)
+        if ops is not None:
+            ops.append(entry)
+        else:
+            self._commit([entry])
+
+    def add_txn(self, card, ttype, amount, balance_after, meta=None):
+        if not self.get_user(card):
+            return
+        if meta is None:
+            meta = {}
+        self._record("txn", card, t={
+            "time": now_str(),
+            "type": ttype,
+            "amount": round(float(amount), 2),
+            "balance": round(float(balance_after), 2),
+            "meta": meta
+        })
+
+    # Operations; each returns (ok, message) like the screens expect
+    def login(self, card, pin):
+        with self.locked(card):
+            user = self.get_user(card)
+            if not user:
+                return False, "Card not recognized."
+            if not verify_pin(pin, user["pin_hash"]):
+                return False, "Incorrect PIN. Try again."
+            with self.transaction():
+                if needs_rehash(user["pin_hash"]):
+                    # Hash settings changed (or a legacy hash): upgrade while we have the PIN.
+                    self._record("pin", card, v=hash_pin(pin))
+                self.add_txn(card, "LOGIN", 0, user["balance"])
+            return True, f"Hello, {user['name']}"
+
+    def withdraw(self, card, amount):
+        with self.locked(card):
+            user = self.get_user(card)
+            if not user:
+                return False, "Unknown card"
+            if amount < WITHDRAW_MIN or amount % WITHDRAW_STEP != 0:
+                return False, f"Amount must be at least {WITHDRAW_MIN} and a multiple of {WITHDRAW_STEP}."
+            if user["balance"] < amount:
+                return False, "Insufficient funds."
+            new_balance = user["balance"] - amount
+            with self.transaction():
+                self._record("bal", card, v=new_balance)
+                self.add_txn(card, "WITHDRAW", amount, new_balance)
+            return True, f"Dispensed {format_currency(amount)}. New balance: {format_currency(new_balance)}"
+
+    def deposit(self, card, amount):
+        with self.locked(card):
+            user = self.get_user(card)
+            if not user:
+                return False, "Unknown card"
+            if amount < DEPOSIT_MIN or amount % DEPOSIT_STEP != 0:
+                return False, f"Amount must be at least {DEPOSIT_MIN} and a multiple of {DEPOSIT_STEP}."
+            new_balance = user["balance"] + amount
+            with self.transaction():
+                self._record("bal", card, v=new_balance)
+                self.add_txn(card, "DEPOSIT", amount, new_balance)
+            return True, f"Deposited {format_currency(amount)}. New balance: {format_currency(new_balance)}"
+
+    def transfer(self, from_card, to_card, amount):
+        if from_card == to_card:
+            return False, "Cannot transfer to the same account."
+        with self.locked(from_card, to_card):
+            src = self.get_user(from_card)
+            dst = self.get_user(to_card)
+            if not src:
+                return False, "Unknown source card."
+            if not dst:
+                return False, "Destination card not found."
+            if amount < TRANSFER_MIN:
+                return False, f"Minimum transfer is {TRANSFER_MIN}."
+            if src["balance"] < amount:
+                return False, "Insufficient funds."
+            src_balance = src["balance"] - amount
+            dst_balance = dst["balance"] + amount
+            with self.transaction():
+                self._record("bal", from_card, v=src_balance)
+                self._record("bal", to_card, v=dst_balance)
+                self.add_txn(from_card, "TRANSFER_OUT", amount, src_balance, meta={"to": to_card})
+                self.add_txn(to_card, "TRANSFER_IN", amount, dst_balance, meta={"from": from_card})
+            return True, f"Transferred {format_currency(amount)} to {dst['name']} ({to_card})."
+
+    def post_transfer(self, card, ttype, amount, counterparty, xfer=None):
+        # One side of a transfer whose checks were made elsewhere (atm_shard's
+        # two-phase commit). Returns the new balance.
+        with self.locked(card):
+            user = self.get_user(card)
+            if ttype == "TRANSFER_OUT":
+                new_balance = user["balance"] - amount
+                meta = {"to": counterparty}
+            else:
+                new_balance = user["balance"] + amount
+                meta = {"from": counterparty}
+            if xfer is not None:
+                meta["xfer"] = xfer
+            with self.transaction():
+                self._record("bal", card, v=new_balance)
+                self.add_txn(card, ttype, amount, new_balance, meta=meta)
+            return new_balance
+
+    def change_pin(self, card, old_pin, new_pin):
+        with self.locked(card):
+            user = self.get_user(card)
+            if not user:
+                return False, "Unknown card."
+            if not verify_pin(old_pin, user["pin_hash"]):
+                return False, "Old PIN is incorrect."
+            if len(new_pin) < 4 or not new_pin.isdigit():
+                return False, "PIN must be at least 4 digits."
+            self._record("pin", card, v=hash_pin(new_pin))
+            return True, "PIN updated successfully."
+
+    def logout(self):
+        pass  # a local Bank keeps no per-terminal session; LedgerClient ends its server-side one
+
+    def flush(self):
+        with self._storage_lock:
+            self.storage.flush()
+
+    def barrier(self):
+        with self._storage_lock:
+            self.storage.barrier()
+
+    def write_queue_depth(self):
+        return self.storage.write_queue_depth()
+
+    def sync_if_due(self):
+        with self._storage_lock:
+            self.storage.sync_if_due()
+
+    def close(self):
+        if self.committer is not None:
+            self.committer.close()
+        with self._storage_lock:
+            self.storage.close()
+
+class Session:
+    # One terminal's view of the bank: the inserted card and whether the PIN was accepted.
+    def __init__(self, bank):
+        self.bank = bank
+        self.card = None
+        self.authenticated = False
+
+    def insert_card(self, card):
+        self.card = card
+        self.authenticated = False
+
+    def login(self, pin):
+        ok, msg = self.bank.login(self.card, pin)
+        self.authenticated = ok
+        return ok, msg
+
+    def _require_login(self):
+        if not self.authenticated:
+            raise PermissionError("session is not logged in")
+
+    def balance(self):
+        self._require_login()
+        return self.bank.get_user(self.card)["balance"]
+
+    def withdraw(self, amount):
+        self._require_login()
+        return self.bank.withdraw(self.card, amount)
+
+    def deposit(self, amount):
+        self._require_login()
+        return self.bank.deposit(self.card, amount)
+
+    def transfer(self, to_card, amount):
+        self._require_login()
+        return self.bank.transfer(self.card, to_card, amount)
+
+    def change_pin(self, old_pin, new_pin):
+        self._require_login()
+        return self.bank.change_pin(self.card, old_pin, new_pin)
+
+    def statement(self, limit=10):
+        self._require_login()
+        return self.bank.recent_txns(self.card, limit)
+
+    def logout(self):
+        self.card = None
+        self.authenticated = False
+        self.bank.flush()
+
+def run_terminals(bank, logins, terminals=8, ops_per_terminal=200, seed=0):
+    # Drive `terminals` concurrent sessions against one bank; logins is a list of (card, pin).
+    # Returns (completed operations, elapsed seconds).
+    cards = [card for card, _ in logins]
+    done = [0] * terminals
+
+    def terminal(idx):
+        rng = random.Random(seed + idx)
+        session = Session(bank)
+        card, pin = logins[idx % len(logins)]
+        session.insert_card(card)
+        if not session.login(pin)[0]:
+            return
+        for _ in range(ops_per_terminal):
+            r = rng.random()
+            if r < 0.4:
+                session.deposit(DEPOSIT_STEP * rng.randint(1, 20))
+            elif r < 0.7:
+                session.withdraw(WITHDRAW_STEP * rng.randint(1, 5))
+            elif r < 0.9:
+                session.transfer(rng.choice(cards), rng.randint(TRANSFER_MIN, 500))
+            else:
+                session.balance()
+            done[idx] += 1
+        session.logout()
+
+    threads = [threading.Thread(target=terminal, args=(i,)) for i in range(terminals)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sum(done), time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Run simulated ATM terminals against one ledger.")
+    parser.add_argument("data", nargs="?", default="bank_data.db")
+    parser.add_argument("--terminals", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=200, help="operations per terminal")
+    parser.add_argument("--group-commit", action="store_true")
+    args = parser.parse_args()
+    bank = Bank.open(args.data, group_commit=args.group_commit)
+    try:
+        logins = [("1111222233334444", "1234"), ("5555666677778888", "4321")]
+        count, elapsed = run_terminals(bank, logins, args.terminals, args.ops)
+        print(f"{count} ops from {args.terminals} terminals in {elapsed:.2f}s ({count / elapsed:,.0f} ops/s)")
+    finally:
+        bank.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,517 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import uuid
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+
+from atm_directory import DIRECTORY_PAGE_SIZE, merge_pages
+from atm_server import LedgerError
+from atm_service import Bank, format_currency, now_str, TRANSFER_MIN
+from atm_storage import SqliteStorage, import_data, open_storage
+
+# Sharded ledger: cards are partitioned by a stable hash of the card number
+# across worker processes. Each shard is a process that owns one SQLite file
+# (<data>.shard<i>of<n>.db) and its own Bank, so operations on different shards
+# use different cores. ShardedBank has the same methods as Bank and routes
+# every operation naming one card to the shard that owns it; a transfer whose
+# cards live on the same shard is a plain Bank.transfer there.
+#
+# Cross-shard transfers use two-phase commit, coordinated by ShardedBank:
+#   1. prepare each side, in card order: the shard takes a lease on the card
+#      and checks it (it exists; the source has the funds). A failed prepare
+#      aborts the sides already prepared.
+#   2. the decision is appended to <data>.2pc and fsynced, then both sides
+#      commit their half (Bank.post_transfer, meta {"xfer": id}) and release
+#      the lease; a "done" line follows.
+# Every balance change on a shard takes the leases of its cards, so nothing can
+# move a balance between prepare and commit. Leases are always taken in card
+# order, as Bank.locked does for account locks, so transfers cannot deadlock.
+# On open, decisions without "done" are finished: a half that is not in its
+# card's history is applied again. The search has no time bound, because "t"
+# is wall-clock and a clock step back could hide a half that was committed.
+#
+# The first open splits the unsharded bank at <data> (importing legacy JSON or
+# seeding it as Bank.open would); <data> itself is not used afterwards.
+#
+#   python atm_shard.py --shards 1,2,4,8 --size 10000 --ops 20000 --threads 32
+
+DEFAULT_SHARDS = 4
+SHARD_WORKER_THREADS = 64       # requests one shard runs at once; keep >= threads calling the ShardedBank
+DECISION_LOG_COMPACT_EVERY = 10_000  # finished decisions before <data>.2pc is truncated
+
+# op name -> runs on the phase-2 pool (never waits for a lease, so it cannot
+# be starved by requests that are waiting for the lease it would release)
+SHARD_OPS = {
+    "get_user": False,
+    "cards": False,
+    "find_cards": False,
+    "recent_txns": False,
+    "history": False,
+    "login": False,
+    "withdraw": False,
+    "deposit": False,
+    "transfer": False,
+    "change_pin": False,
+    "prepare": False,
+    "commit": True,
+    "abort": True,
+    "applied": False,
+    "redo": False,
+    "flush": False,
+    "barrier": False,
+    "write_queue_depth": False,
+    "sync_if_due": False,
+}
+
+def shard_of(card, shards):
+    # crc32 rather than hash(): str hashes are salted per process.
+    return zlib.crc32(card.encode()) % shards
+
+def shard_paths(path, shards):
+    root = os.path.splitext(path)[0]
+    return [f"{root}.shard{i}of{shards}.db" for i in range(shards)]
+
+def decision_log_path(path):
+    return os.path.splitext(path)[0] + ".2pc"
+
+def split_bank(path, paths, legacy_json=None):
+    # Copy every account and its full history from the bank at path into one
+    # SQLite file per shard. Files are built under a temporary name and
+    # renamed at the end, so an interrupted split starts over.
+    parts = [p + ".part" for p in paths]
+    for p in parts:
+        for leftover in (p, p + "-wal", p + "-shm"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    src = open_storage(path, legacy_json=legacy_json)
+    dbs = [SqliteStorage(p) for p in parts]
+    try:
+        chunks = [{} for _ in dbs]
+        for card in src.cards():
+            chunk = chunks[shard_of(card, len(dbs))]
+            chunk[card] = dict(src.get_user(card))
+            if len(chunk) >= 10_000:
+                import_data(dbs[shard_of(card, len(dbs))], {"users": chunk}, src.iter_transactions)
+                chunk.clear()
+        for db, chunk in zip(dbs, chunks):
+            import_data(db, {"users": chunk}, src.iter_transactions)
+    finally:
+        for db in dbs:
+            db.close()
+        src.close()
+    for part, p in zip(parts, paths):
+        os.replace(part, p)
+
+class Leases:
+    # Per-card locks that, unlike Bank's RLocks, may be released by a thread
+    # other than the one that took them: a prepare and its commit arrive as
+    # separate requests.
+    def __init__(self):
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def _lock(self, card):
+        with self._guard:
+            lock = self._locks.get(card)
+            if lock is None:
+                lock = self._locks[card] = threading.Lock()
+            return lock
+
+    def acquire(self, card):
+        self._lock(card).acquire()
+
+    def release(self, card):
+        self._lock(card).release()
+
+    @contextmanager
+    def held(self, *cards):
+        cards = sorted(set(cards))
+        taken = []
+        try:
+            for card in cards:
+                self.acquire(card)
+                taken.append(card)
+            yield
+        finally:
+            for card in reversed(taken):
+                self.release(card)
+
+class ShardWorker:
+    # Runs inside a shard process: the Bank for this shard plus the
+    # participant side of the two-phase commit.
+    def __init__(self, bank):
+        self.bank = bank
+        self.leases = Leases()
+        self.prepared = {}  # xfer id -> (card, ttype, amount, counterparty)
+
+    def call(self, op, args):
+        if op not in SHARD_OPS:
+            raise ValueError(f"unknown op {op!r}")
+        method = getattr(self, op, None) or getattr(self.bank, op)
+        return method(*args)
+
+    def withdraw(self, card, amount):
+        with self.leases.held(card):
+            return self.bank.withdraw(card, amount)
+
+    def deposit(self, card, amount):
+        with self.leases.held(card):
+            return self.bank.deposit(card, amount)
+
+    def transfer(self, from_card, to_card, amount):
+        with self.leases.held(from_card, to_card):
+            return self.bank.transfer(from_card, to_card, amount)
+
+    def prepare(self, xfer, card, ttype, amount, counterparty):
+        # Phase 1. On success the card's lease stays held until commit or abort.
+        self.leases.acquire(card)
+        user = self.bank.get_user(card)
+        if not user:
+            self.leases.release(card)
+            return False, "Unknown source card." if ttype == "TRANSFER_OUT" else "Destination card not found."
+        if ttype == "TRANSFER_OUT" and user["balance"] < amount:
+            self.leases.release(card)
+            return False, "Insufficient funds."
+        self.prepared[xfer] = (card, ttype, amount, counterparty)
+        return True, user["name"]
+
+    def commit(self, xfer):
+        card, ttype, amount, counterparty = self.prepared.pop(xfer)
+        try:
+            return self.bank.post_transfer(card, ttype, amount, counterparty, xfer)
+        finally:
+            self.leases.release(card)
+
+    def abort(self, xfer):
+        entry = self.prepared.pop(xfer, None)
+        if entry is not None:
+            self.leases.release(entry[0])
+
+    def applied(self, card, ttype, xfer):
+        # Recovery: is this half of transfer xfer already in the card's history?
+        # Newest first, so a half that was committed is normally on the first page.
+        before = None
+        while True:
+            page, before = self.bank.history(card, 100, before, None, None, [ttype])
+            if any(t["meta"].get("xfer") == xfer for t in page):
+                return True
+            if before is None:
+                return False
+
+    def redo(self, xfer, card, ttype, amount, counterparty):
+        with self.leases.held(card):
+            return self.bank.post_transfer(card, ttype, amount, counterparty, xfer)
+
+def _serve_shard(conn, path, group_commit):
+    # Shard process main loop. Requests are (id, op, args); replies are
+    # (id, ok, result or error text), sent as soon as each request finishes.
+    bank = Bank.open(path, group_commit=group_commit)
+    worker = ShardWorker(bank)
+    requests = ThreadPoolExecutor(SHARD_WORKER_THREADS, thread_name_prefix="shard")
+    phase2 = ThreadPoolExecutor(4, thread_name_prefix="shard-2pc")
+    send_lock = threading.Lock()
+
+    def run(req_id, op, args):
+        try:
+            reply = (req_id, True, worker.call(op, args))
+        except Exception as e:
+            reply = (req_id, False, f"{type(e).__name__}: {e}")
+        with send_lock:
+            conn.send(reply)
+
+    try:
+        while True:
+            try:
+                msg = conn.recv()
+            except EOFError:
+                break
+            if msg is None:
+                break
+            req_id, op, args = msg
+            (phase2 if SHARD_OPS.get(op) else requests).submit(run, req_id, op, args)
+    finally:
+        requests.shutdown()
+        phase2.shutdown()
+        bank.close()
+        conn.close()
+
+class ShardClient:
+    # Parent side of one shard process. Any number of threads may have calls
+    # outstanding; a reader thread matches replies to their Futures by id.
+    def __init__(self, ctx, path, group_commit=False):
+        self.path = path
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_serve_shard, args=(child, path, group_commit),
+                                   name=f"atm-{os.path.basename(path)}", daemon=True)
+        self.process.start()
+        child.close()
+        self._ids = itertools.count(1)
+        self._waiting = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self._reader = threading.Thread(target=self._read_loop, name="shard-reader", daemon=True)
+        self._reader.start()
+
+    def _read_loop(self):
+        try:
+            while True:
+                req_id, ok, result = self.conn.recv()
+                with self._lock:
+                    fut = self._waiting.pop(req_id)
+                if ok:
+                    fut.set_result(result)
+                else:
+                    fut.set_exception(LedgerError(result))
+        except (EOFError, OSError):
+            pass
+        finally:
+            with self._lock:
+                self._closed = True
+                waiting, self._waiting = self._waiting, {}
+            for fut in waiting.values():
+                fut.set_exception(ConnectionError(f"shard {self.path} exited"))
+
+    def submit(self, op, *args):
+        fut = Future()
+        with self._lock:
+            if self._closed:
+                raise ConnectionError(f"shard {self.path} exited")
+            req_id = next(self._ids)
+            self._waiting[req_id] = fut
+            self.conn.send((req_id, op, args))
+        return fut
+
+    def call(self, op, *args):
+        return self.submit(op, *args).result()
+
+    def close(self):
+        with self._lock:
+            if not self._closed:
+                self.conn.send(None)
+        self.process.join()
+        self._reader.join()
+        self.conn.close()
+
+class DecisionLog:
+    # Commit decisions of cross-shard transfers, one JSON line each:
+    #   {"x": id, "t": time, "from": card, "to": card, "amount": 500.0}
+    # written and fsynced before phase 2, then {"done": id} once both halves
+    # are committed.
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._f = None
+        self._open = 0      # decisions written but not done
+        self._finished = 0  # done lines since the last truncation
+
+    def pending(self):
+        if not os.path.exists(self.path):
+            return []
+        decisions = {}
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    break  # torn last line: that decision was never acted on
+                if "done" in rec:
+                    decisions.pop(rec["done"], None)
+                else:
+                    decisions[rec["x"]] = rec
+        return list(decisions.values())
+
+    def reset(self):
+        with self._lock:
+            if self._f is not None:
+                self._f.close()
+            self._f = open(self.path, "wb")
+            self._finished = 0
+
+    def commit(self, xfer, from_card, to_card, amount):
+        line = json.dumps({"x": xfer, "t": now_str(), "from": from_card, "to": to_card, "amount": amount})
+        with self._lock:
+            self._f.write(line.encode() + b"\n")
+            self._f.flush()
+            os.fsync(self._f.fileno())
+            self._open += 1
+
+    def done(self, xfer):
+        with self._lock:
+            self._f.write(json.dumps({"done": xfer}).encode() + b"\n")
+            self._open -= 1
+            self._finished += 1
+            if self._open == 0 and self._finished >= DECISION_LOG_COMPACT_EVERY:
+                self._f.truncate(0)
+                self._f.seek(0)
+                self._finished = 0
+
+    def close(self):
+        with self._lock:
+            if self._f is not None:
+                self._f.close()
+                self._f = None
+
+class ShardedBank:
+    # Same methods as Bank, so ATMApp, atm_server and the benchmarks can use either.
+    def __init__(self, paths, decision_log, group_commit=False):
+        ctx = multiprocessing.get_context("spawn")
+        self.shards = [ShardClient(ctx, path, group_commit) for path in paths]
+        self.decisions = DecisionLog(decision_log)
+        self._recover()
+
+    @classmethod
+    def open(cls, path, shards=DEFAULT_SHARDS, legacy_json=None, group_commit=False):
+        paths = shard_paths(path, shards)
+        present = [p for p in paths if os.path.exists(p)]
+        if not present:
+            split_bank(path, paths, legacy_json)
+        elif len(present) != len(paths):
+            raise ValueError(f"only {len(present)} of {len(paths)} shard files of {path} exist")
+        return cls(paths, decision_log_path(path), group_commit=group_commit)
+
+    def shard_for(self, card):
+        return self.shards[shard_of(card, len(self.shards))]
+
+    def _broadcast(self, op, *args):
+        return [f.result() for f in [shard.submit(op, *args) for shard in self.shards]]
+
+    def _recover(self):
+        for d in self.decisions.pending():
+            for card, ttype, counterparty in ((d["from"], "TRANSFER_OUT", d["to"]),
+                                              (d["to"], "TRANSFER_IN", d["from"])):
+                shard = self.shard_for(card)
+                if not shard.call("applied", card, ttype, d["x"]):
+                    shard.call("redo", d["x"], card, ttype, d["amount"], counterparty)
+        self.decisions.reset()
+
+    def get_user(self, card):
+        return self.shard_for(card).call("get_user", card)
+
+    def cards(self):
+        return sorted(itertools.chain.from_iterable(self._broadcast("cards")))
+
+    def find_cards(self, query="", limit=DIRECTORY_PAGE_SIZE, after=None):
+        return merge_pages(query, limit, self._broadcast("find_cards", query, limit, after))
+
+    def recent_txns(self, card, limit=10):
+        return self.shard_for(card).call("recent_txns", card, limit)
+
+    def history(self, card, limit=10, before=None, since=None, until=None, types=None):
+        return self.shard_for(card).call("history", card, limit, before, since, until, types)
+
+    def login(self, card, pin):
+        return self.shard_for(card).call("login", card, pin)
+
+    def withdraw(self, card, amount):
+        return self.shard_for(card).call("withdraw", card, amount)
+
+    def deposit(self, card, amount):
+        return self.shard_for(card).call("deposit", card, amount)
+
+    def change_pin(self, card, old_pin, new_pin):
+        return self.shard_for(card).call("change_pin", card, old_pin, new_pin)
+
+    def transfer(self, from_card, to_card, amount):
+        if from_card == to_card:
+            return False, "Cannot transfer to the same account."
+        src, dst = self.shard_for(from_card), self.shard_for(to_card)
+        if src is dst:
+            return src.call("transfer", from_card, to_card, amount)
+        if amount < TRANSFER_MIN:
+            return False, f"Minimum transfer is {TRANSFER_MIN}."
+        xfer = uuid.uuid4().hex
+        sides = sorted([(from_card, src, "TRANSFER_OUT", to_card), (to_card, dst, "TRANSFER_IN", from_card)],
+                       key=lambda side: side[0])
+        prepared = []
+        names = {}
+        try:
+            for card, shard, ttype, counterparty in sides:
+                ok, info = shard.call("prepare", xfer, card, ttype, amount, counterparty)
+                if not ok:
+                    break
+                prepared.append(shard)
+                names[card] = info
+        finally:
+            if len(prepared) < len(sides):
+                for shard in prepared:
+                    shard.call("abort", xfer)
+        if len(prepared) < len(sides):
+            return False, info
+        self.decisions.commit(xfer, from_card, to_card, amount)
+        for fut in [shard.submit("commit", xfer) for shard in prepared]:
+            fut.result()
+        self.decisions.done(xfer)
+        return True, f"Transferred {format_currency(amount)} to {names[to_card]} ({to_card})."
+
+    def logout(self):
+        pass  # sessions are the frontend's business, as with Bank
+
+    def flush(self):
+        self._broadcast("flush")
+
+    def barrier(self):
+        self._broadcast("barrier")
+
+    def write_queue_depth(self):
+        return sum(self._broadcast("write_queue_depth"))
+
+    def sync_if_due(self):
+        self._broadcast("sync_if_due")
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+        self.decisions.close()
+
+def bench(size, ops, threads, shard_counts, group_commit, seed, workdir):
+    from atm_bench import DEFAULT_MIX, generate_bank, run_workload
+    source = os.path.join(workdir, f"bank_{size}.db")
+    generate_bank(source, size, history=10, seed=seed)
+    results = []
+    for n in shard_counts:
+        bank = ShardedBank.open(source, shards=n, group_commit=group_commit)
+        try:
+            latencies, elapsed = run_workload(bank, size, ops, threads, DEFAULT_MIX, seed)
+            bank.flush()
+        finally:
+            bank.close()
+        total = sum(len(v) for v in latencies.values())
+        results.append({"shards": n, "ops": total, "seconds": elapsed, "ops_per_sec": total / elapsed})
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of the sharded ATM ledger by shard count.")
+    parser.add_argument("--shards", default="1,2,4,8", help="comma separated shard counts")
+    parser.add_argument("--size", type=int, default=10000, help="cards in the synthetic bank")
+    parser.add_argument("--ops", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=32, help="client threads (at most SHARD_WORKER_THREADS)")
+    parser.add_argument("--group-commit", action="store_true")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="atm_shard_")
+    try:
+        results = bench(args.size, args.ops, args.threads, [int(s) for s in args.shards.split(",")],
+                        args.group_commit, args.seed, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(f"{os.cpu_count()} CPUs, {args.size} cards, {args.threads} threads", file=sys.stderr)
+    print(f"{'shards':>6}{'ops/s':>11}{'speedup':>9}")
+    base = results[0]["ops_per_sec"]
+    for r in results:
+        print(f"{r['shards']:>6}{r['ops_per_sec']:>11,.0f}{r['ops_per_sec'] / base:>8.2f}x")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"cpus": os.cpu_count(), "args": vars(args), "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
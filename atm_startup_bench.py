@@ -0,0 +1,91 @@
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from atm_bench import generate_bank
+
+# Cold-start benchmark for the ATM window (needs a display; use xvfb-run on a
+# headless box).
+#
+#   python atm_startup_bench.py --runs 10 --size 100000 --out startup.json
+#
+# Each run starts atm_gui.py in a fresh interpreter with ATM_PROFILE_STARTUP=json
+# and ATM_EXIT_WHEN_READY=1, so the app reports its StartupProfile marks and
+# quits as soon as the welcome screen lists cards. "wall" is measured from
+# outside, from spawning the interpreter until the process exits. The first
+# run only warms the OS file cache and is not counted.
+
+GUI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "atm_gui.py")
+
+def run_once(env, cwd):
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, GUI], env=env, cwd=cwd, capture_output=True, text=True, timeout=120)
+    wall = time.perf_counter() - t0
+    if proc.returncode != 0:
+        raise RuntimeError(f"atm_gui.py exited with {proc.returncode}:\n{proc.stderr}")
+    for line in reversed(proc.stderr.splitlines()):
+        if line.startswith("{"):
+            marks = json.loads(line)
+            marks["wall"] = wall
+            return marks
+    raise RuntimeError(f"no startup profile in the output of atm_gui.py:\n{proc.stderr}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Time from launch until the ATM welcome screen is usable.")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--size", type=int, default=1000, help="cards in the synthetic bank")
+    parser.add_argument("--backend", default="sqlite", choices=("sqlite", "json"))
+    parser.add_argument("--shards", type=int, default=0, help="> 1 to start a sharded ledger (sqlite only)")
+    parser.add_argument("--out", help="write machine-readable results to this JSON file")
+    parser.add_argument("--compare", help="earlier --out file to compare against")
+    args = parser.parse_args()
+    if sys.platform.startswith("linux") and not os.environ.get("DISPLAY"):
+        print("atm_startup_bench.py needs a display; run it under xvfb-run", file=sys.stderr)
+        return 2
+
+    workdir = tempfile.mkdtemp(prefix="atm_startup_")
+    try:
+        path = os.path.join(workdir, "bank" + (".json" if args.backend == "json" else ".db"))
+        generate_bank(path, args.size, history=5)
+        env = dict(os.environ, ATM_DATA_FILE=path, ATM_PROFILE_STARTUP="json", ATM_EXIT_WHEN_READY="1",
+                   ATM_SHARDS=str(args.shards))
+        env.pop("ATM_LEDGER", None)
+        run_once(env, workdir)
+        runs = [run_once(env, workdir) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    phases = list(runs[0])
+    medians = {name: statistics.median(r[name] for r in runs) for name in phases}
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["median"]
+    print(f"{'phase':<16}{'median ms':>11}{'min ms':>9}{'max ms':>9}" + (f"{'vs base':>10}" if baseline else ""))
+    for name in phases:
+        values = [r[name] * 1000 for r in runs]
+        line = f"{name:<16}{medians[name] * 1000:>11.1f}{min(values):>9.1f}{max(values):>9.1f}"
+        if baseline and baseline.get(name):
+            line += f"{(medians[name] - baseline[name]) / baseline[name] * 100:>+9.1f}%"
+        print(line)
+    if args.out:
+        report = {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "args": vars(args),
+            "median": medians,
+            "runs": runs,
+        }
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
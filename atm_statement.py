@@ -0,0 +1,111 @@
+import csv
+import itertools
+from datetime import datetime
+
+from atm_service import format_currency
+
+# Account statements over a date range and a set of transaction types.
+#
+# Statements are read from the account history in chunks of STATEMENT_CHUNK,
+# newest first, following the history cursor, so neither the screen nor the
+# exporters ever hold more than one chunk. Each transaction is formatted once
+# into a StatementRow that both the Treeview and the writers use.
+#
+#   rows = iter_statement(bank, card, since="2026-10-01", until="2026-10-31 23:59:59")
+#   write_statement(rows, "statement.csv", header)
+
+STATEMENT_CHUNK = 200
+TXN_TYPES = ("LOGIN", "WITHDRAW", "DEPOSIT", "TRANSFER_OUT", "TRANSFER_IN")
+EXPORT_FORMATS = {".txt": "text", ".csv": "csv", ".prn": "print"}
+PRINT_PAGE_LINES = 60  # lines per page of the printable layout, page header included
+
+def format_meta(meta):
+    return ", ".join(f"{k}:{v}" for k, v in meta.items()) if meta else ""
+
+class StatementRow:
+    __slots__ = ("time", "type", "amount", "balance", "meta")
+
+    def __init__(self, t):
+        self.time = t.get("time", "")
+        self.type = t.get("type", "")
+        self.amount = format_currency(t.get("amount", 0))
+        self.balance = format_currency(t.get("balance", 0))
+        self.meta = format_meta(t.get("meta"))
+
+    def values(self):
+        return self.time, self.type, self.amount, self.balance, self.meta
+
+    def line(self):
+        meta = f" ({self.meta})" if self.meta else ""
+        return f"{self.time}  {self.type:<14} {self.amount:>12}  Bal: {self.balance}{meta}"
+
+def iter_chunks(bank, card, since=None, until=None, types=None, chunk=STATEMENT_CHUNK, before=None):
+    # Yields (rows, cursor) newest first; cursor resumes after the chunk, None once exhausted.
+    types = list(types) if types else None
+    while True:
+        txns, before = bank.history(card, chunk, before, since, until, types)
+        yield [StatementRow(t) for t in txns], before
+        if before is None:
+            return
+
+def iter_statement(bank, card, since=None, until=None, types=None, chunk=STATEMENT_CHUNK):
+    for rows, _ in iter_chunks(bank, card, since, until, types, chunk):
+        yield from rows
+
+def statement_header(title, user, since=None, until=None, types=None):
+    span = f"{since or 'first transaction'} to {until or 'now'}"
+    return [
+        title,
+        f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+        f"Name: {user['name']}",
+        f"Account: {user['account_number']}",
+        f"Period: {span}",
+        f"Types: {', '.join(types) if types else 'all'}",
+    ]
+
+def write_text(rows, f, header):
+    f.write("\n".join(header) + "\n\n")
+    n = 0
+    for row in rows:
+        f.write(row.line() + "\n")
+        n += 1
+    return n
+
+def write_csv(rows, f, header):
+    writer = csv.writer(f)
+    writer.writerow(("time", "type", "amount", "balance", "meta"))
+    n = 0
+    for row in rows:
+        writer.writerow(row.values())
+        n += 1
+    return n
+
+def write_print(rows, f, header):
+    # Fixed-width pages separated by form feeds, each repeating the header and column titles.
+    body = PRINT_PAGE_LINES - len(header) - 4
+    cols = f"{'Time':<21}{'Type':<15}{'Amount':>12}  {'Balance':>12}  Meta"
+    n = 0
+    rows = iter(rows)
+    for page in itertools.count(1):
+        chunk = list(itertools.islice(rows, body))
+        if not chunk and page > 1:
+            break
+        if page > 1:
+            f.write("\f")
+        f.write("\n".join(header) + f"\nPage {page}\n\n{cols}\n{'-' * len(cols)}\n")
+        for row in chunk:
+            f.write(f"{row.time:<21}{row.type:<15}{row.amount:>12}  {row.balance:>12}  {row.meta}\n")
+        n += len(chunk)
+        if len(chunk) < body:
+            break
+    return n
+
+WRITERS = {"text": write_text, "csv": write_csv, "print": write_print}
+
+def write_statement(rows, path, header, fmt=None):
+    # fmt defaults from the file extension; returns the number of transactions written.
+    if fmt is None:
+        ext = path[path.rfind("."):].lower() if "." in path else ""
+        fmt = EXPORT_FORMATS.get(ext, "text")
+    with open(path, "w", encoding="utf-8", newline="" if fmt == "csv" else None) as f:
+        return WRITERS[fmt](rows, f, header)
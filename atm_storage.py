@@ -0,0 +1,608 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+
+from atm_binary import BANK_EXT, BankUsers, open_bank, write_bank
+from atm_directory import CardDirectory, DIRECTORY_PAGE_SIZE, entry_of, find_paged, prefix_end
+from atm_history import PagedHistory, HISTORY_PAGE_SIZE
+from atm_journal import Journal, apply_record, JOURNAL_COMPACT_EVERY
+from atm_pin import hash_pin
+
+# Storage backends for the ATM. Both implement the same small interface:
+#   get_user(card)            -> account dict (name, account_number, pin_hash, balance) or None
+#   cards()                   -> list of card numbers
+#   find_cards(query, limit, after)
+#                             -> (page of {card, name, account_number} matching query,
+#                                 cursor for the next page or None); see atm_directory
+#   transactions(card, limit) -> newest-first list of transaction dicts
+#   history(card, limit, before, since, until, types)
+#                             -> (newest-first page, cursor for the next older page or None)
+#   commit(ops)               -> atomically apply one unit of work (see atm_journal)
+#   commit_many(batches)      -> apply several units with one durable write; returns a
+#                                per-unit list of exceptions (None = committed)
+#   flush()                   -> write back anything held in memory (called on logout)
+#   barrier()                 -> flush() and wait until every background write is on disk
+#   write_queue_depth()       -> snapshot writes queued or in progress
+#   sync_if_due() / close()   -> close() waits for queued writes
+#
+# JsonStorage keeps the whole bank in memory and journals every commit. Its
+# periodic full snapshot (JSON, or atm_binary's format for a *.bank path) is
+# serialized and written by a SnapshotWriter thread, so a commit that
+# triggers compaction only pays for a shallow copy.
+# SqliteStorage loads accounts on demand through an AccountCache and only
+# touches the rows a commit names.
+
+ACCOUNT_CACHE_SIZE = 1024  # accounts kept in memory by SqliteStorage
+
+def seed_data():
+    return {
+        "users": {
+            "1111222233334444": {
+                "name": "Alice Demo",
+                "account_number": "AC-10001",
+                "pin_hash": hash_pin("1234"),
+                "balance": 35000.0,
+                "transactions": []
+            },
+            "5555666677778888": {
+                "name": "Bob Demo",
+                "account_number": "AC-10002",
+                "pin_hash": hash_pin("4321"),
+                "balance": 12500.0,
+                "transactions": []
+            }
+        },
+        "atm": {
+            "cash_stock": 10_00_00  # simulated cash stock (not enforced strictly, just for realism)
+        }
+    }
+
+def load_data(path):
+    if not os.path.exists(path):
+        save_data(path, seed_data())
+    if path.endswith(BANK_EXT):
+        return open_bank(path)  # accounts are decoded as they are used
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_data(path, data):
+    # Write a full snapshot; temp file + rename so a crash never leaves a truncated bank file
+    if path.endswith(BANK_EXT):
+        write_bank(path, data)
+        return
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, default=list)  # history ring buffers are deques
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def snapshot_of(data):
+    # Copy of the bank data that later commits cannot touch. Transactions are
+    # never modified once recorded, so the entries themselves are shared.
+    snap = dict(data)
+    snap["users"] = {
+        card: {**user, "transactions": list(user.get("transactions", ())),
+               "history_pages": list(user.get("history_pages", ()))}
+        for card, user in data["users"].items()
+    }
+    snap["atm"] = dict(data.get("atm", {}))
+    return snap
+
+class SnapshotWriter:
+    # Writes bank snapshots with save_data on its own thread. Only the newest
+    # queued snapshot is kept: one submitted while another waits replaces it.
+    def __init__(self, path):
+        self.path = path
+        self.error = None
+        self._pending = None      # (snapshot, on_done) waiting to be written
+        self._writing = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="atm-snapshot-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, snapshot, on_done=None):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("snapshot writer is closed")
+            self._pending = (snapshot, on_done)
+            self._cond.notify_all()
+
+    def depth(self):
+        with self._cond:
+            return (self._pending is not None) + self._writing
+
+    def barrier(self):
+        # Blocks until every submitted snapshot is on disk; re-raises a failed write.
+        with self._cond:
+            while self._pending is not None or self._writing:
+                self._cond.wait()
+            error, self.error = self.error, None
+        if error is not None:
+            raise error
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed:
+                    self._cond.wait()
+                if self._pending is None:
+                    return  # closed and drained
+                (snapshot, on_done), self._pending = self._pending, None
+                self._writing = True
+            try:
+                save_data(self.path, snapshot)
+                if on_done is not None:
+                    on_done()
+            except Exception as e:
+                self.error = e
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+def journal_path(path):
+    return path + ".journal"  # full name, so bank.json and bank.bank never share a journal
+
+def history_dir(path):
+    return path + ".history"
+
+def adopt_legacy_names(path):
+    # Older builds named the journal and history pages of bank_data.json
+    # bank_data.journal / bank_data.history; move them to the current names.
+    if not path.endswith(".json"):
+        return
+    root = os.path.splitext(path)[0]
+    for old, new in ((root + ".journal", journal_path(path)),
+                     (root + ".journal.old", journal_path(path) + ".old"),
+                     (root + ".history", history_dir(path))):
+        if os.path.exists(old) and not os.path.exists(new):
+            os.replace(old, new)
+
+class JsonStorage:
+    def __init__(self, path):
+        self.path = path
+        adopt_legacy_names(path)
+        self.journal = Journal(journal_path(path))
+        self.data = load_data(path)
+        page_size = self.data.setdefault("history_page_size", HISTORY_PAGE_SIZE)  # fixed once pages exist
+        self.history_pages = PagedHistory(history_dir(path), page_size)
+        users = self.data["users"]
+        if isinstance(users, BankUsers):
+            users.on_load = self.history_pages.attach
+        else:
+            for card, user in users.items():
+                self.history_pages.attach(card, user)
+        for rec in self.journal.replay(self.data.get("journal_seq", 0)):
+            apply_record(self.data, rec, self.history_pages.append)
+        if self.journal.has_old():
+            # A background snapshot did not finish; fold both logs into one now.
+            self.data["journal_seq"] = self.journal.seq
+            self._materialize()
+            save_data(self.path, self.data)
+            self.journal.reset()
+        self.writer = SnapshotWriter(path)
+        self._directory = None  # built on the first find_cards; accounts are never added at runtime
+
+    def get_user(self, card):
+        return self.data["users"].get(card)
+
+    def cards(self):
+        return list(self.data["users"].keys())
+
+    def find_cards(self, query="", limit=DIRECTORY_PAGE_SIZE, after=None):
+        if self._directory is None:
+            users = self.data["users"]
+            self._directory = CardDirectory(users.entries() if isinstance(users, BankUsers) else users.items())
+        return self._directory.find(query, limit, after)
+
+    def transactions(self, card, limit=10):
+        return self.history(card, limit)[0]
+
+    def history(self, card, limit=10, before=None, since=None, until=None, types=None):
+        user = self.get_user(card)
+        if not user:
+            return [], None
+        return self.history_pages.read(card, user, limit, before, since, until, types)
+
+    def iter_transactions(self, card):
+        return self.history_pages.iter_all(card, self.data["users"][card])
+
+    def commit(self, ops):
+        rec = {"ops": ops}
+        self.journal.append(rec)
+        apply_record(self.data, rec, self.history_pages.append)
+        if self.journal.count >= JOURNAL_COMPACT_EVERY:
+            self.compact()
+
+    def commit_many(self, batches):
+        # One write and one fsync for the whole group.
+        recs = [{"ops": ops} for ops in batches]
+        self.journal.append_many(recs)
+        for rec in recs:
+            apply_record(self.data, rec, self.history_pages.append)
+        if self.journal.count >= JOURNAL_COMPACT_EVERY:
+            self.compact()
+        return [None] * len(batches)
+
+    def compact(self):
+        # Rotates the journal and hands a snapshot to the writer; the old log is
+        # deleted once the snapshot is on disk. While one is still being written,
+        # compaction waits for a later commit.
+        if self.journal.has_old():
+            return
+        self.journal.rotate()
+        self.data["journal_seq"] = self.journal.seq
+        self._materialize()
+        self.writer.submit(snapshot_of(self.data), on_done=self.journal.drop_old)
+
+    def _materialize(self):
+        # A snapshot needs every account, and the writer replaces the mapped
+        # .bank file, so decode the rest and let go of the mapping first.
+        users = self.data["users"]
+        if isinstance(users, BankUsers):
+            self.data["users"] = users.materialize()
+
+    def barrier(self):
+        self.journal.sync()
+        self.writer.barrier()
+
+    def write_queue_depth(self):
+        return self.writer.depth()
+
+    def flush(self):
+        self.journal.sync()
+
+    def sync_if_due(self):
+        self.journal.sync_if_due()
+
+    def close(self):
+        self.writer.close()
+        self.journal.close()
+        if isinstance(self.data["users"], BankUsers):
+            self.data["users"].close()
+        if self.writer.error is not None:
+            raise self.writer.error
+
+class AccountCache:
+    # Bounded LRU of account records. Records marked dirty hold changes that
+    # are not in the backing store yet; they are handed to write_back when
+    # they fall out of the cache or on flush().
+    def __init__(self, load, write_back, capacity=ACCOUNT_CACHE_SIZE):
+        self.load = load
+        self.write_back = write_back
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self._dirty = set()
+
+    def get(self, card):
+        rec = self._entries.get(card)
+        if rec is not None:
+            self._entries.move_to_end(card)
+            return rec
+        rec = self.load(card)
+        if rec is None:
+            return None
+        self._entries[card] = rec
+        while len(self._entries) > self.capacity:
+            old_card, old_rec = self._entries.popitem(last=False)
+            if old_card in self._dirty:
+                self._dirty.discard(old_card)
+                self.write_back(old_card, old_rec)
+        return rec
+
+    def peek(self, card):
+        return self._entries.get(card)
+
+    def mark_dirty(self, card):
+        self._dirty.add(card)
+
+    def mark_clean(self, card):
+        self._dirty.discard(card)
+
+    def dirty_count(self):
+        return len(self._dirty)
+
+    def flush(self):
+        for card in list(self._dirty):
+            self._dirty.discard(card)
+            self.write_back(card, self._entries[card])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    card TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    account_number TEXT NOT NULL,
+    pin_hash TEXT NOT NULL,
+    balance REAL NOT NULL,
+    balance_txn_id INTEGER NOT NULL DEFAULT 0  -- newest transaction already reflected in balance
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    card TEXT NOT NULL,
+    time TEXT NOT NULL,
+    type TEXT NOT NULL,
+    amount REAL NOT NULL,
+    balance REAL NOT NULL,
+    meta TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS idx_transactions_card_time ON transactions(card, time);
+CREATE INDEX IF NOT EXISTS idx_transactions_time ON transactions(time);
+CREATE INDEX IF NOT EXISTS idx_transactions_card_id ON transactions(card, id);  -- newest row of a card, for recovery
+CREATE INDEX IF NOT EXISTS idx_accounts_account_number ON accounts(lower(account_number), card);
+CREATE INDEX IF NOT EXISTS idx_accounts_name ON accounts(lower(name), card);
+CREATE TABLE IF NOT EXISTS atm (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+class SqliteStorage:
+    # Balances are written back lazily: a commit that records a transaction
+    # makes the new balance durable through that row's balance_after, so the
+    # accounts row itself is only updated when the cached record is evicted or
+    # flushed. _load_user re-derives the balance from any newer transaction,
+    # which is what recovers the account after a crash.
+    def __init__(self, path, cache_size=ACCOUNT_CACHE_SIZE):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)  # callers serialize access (see atm_service)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._upgrade_schema()
+        self.cache = AccountCache(self._load_user, self._write_back, cache_size)
+        self._txn_ids = {}  # card -> id of its newest transaction not yet written back
+
+    def _upgrade_schema(self):
+        cols = [r["name"] for r in self.conn.execute("PRAGMA table_info(accounts)")]
+        if "balance_txn_id" not in cols:
+            with self.conn:
+                self.conn.execute("ALTER TABLE accounts ADD COLUMN balance_txn_id INTEGER NOT NULL DEFAULT 0")
+                self.conn.execute(
+                    "UPDATE accounts SET balance_txn_id ="
+                    " (SELECT COALESCE(MAX(id), 0) FROM transactions t WHERE t.card = accounts.card)"
+                )
+
+    def _load_user(self, card):
+        row = self.conn.execute(
+            "SELECT name, account_number, pin_hash, balance, balance_txn_id FROM accounts WHERE card = ?", (card,)
+        ).fetchone()
+        if row is None:
+            return None
+        rec = dict(row)
+        txn_id = rec.pop("balance_txn_id")
+        # Newest by id, not by time: time is local wall-clock and can step back.
+        last = self.conn.execute(
+            "SELECT id, balance FROM transactions WHERE card = ? ORDER BY id DESC LIMIT 1", (card,)
+        ).fetchone()
+        if last is not None and last["id"] > txn_id:
+            rec["balance"] = last["balance"]
+            self._txn_ids[card] = last["id"]
+            self.cache.mark_dirty(card)
+        return rec
+
+    def _write_back(self, card, rec):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE accounts SET balance = ?, balance_txn_id = ? WHERE card = ?",
+                (rec["balance"], self._txn_ids.pop(card, 0), card),
+            )
+
+    def get_user(self, card):
+        return self.cache.get(card)
+
+    def cards(self):
+        return [r[0] for r in self.conn.execute("SELECT card FROM accounts ORDER BY card")]
+
+    def find_cards(self, query="", limit=DIRECTORY_PAGE_SIZE, after=None):
+        return find_paged(query, limit, after, self._scan_directory)
+
+    def _scan_directory(self, run, prefix, after, n):
+        # One range scan on the card primary key or a lower(...) index.
+        col = ("card", "lower(account_number)", "lower(name)")[run]
+        sql = f"SELECT {col} AS k, card, name, account_number FROM accounts WHERE {col} >= ?"
+        args = [prefix]
+        end = prefix_end(prefix)
+        if end is not None:
+            sql += f" AND {col} < ?"
+            args.append(end)
+        if run == 0:
+            order = "card"  # the key is the card itself
+            if after is not None:
+                sql += " AND card > ?"
+                args.append(after[1])
+        else:
+            order = f"{col}, card"
+            if after is not None:
+                sql += f" AND ({col}, card) > (?, ?)"
+                args += after
+        sql += f" ORDER BY {order} LIMIT ?"
+        args.append(n)
+        return [(r["k"], r["card"], entry_of(r["card"], r)) for r in self.conn.execute(sql, args)]
+
+    def transactions(self, card, limit=10):
+        return self.history(card, limit)[0]
+
+    def history(self, card, limit=10, before=None, since=None, until=None, types=None):
+        # Walks the (card, time) index backwards; the cursor is the (time, id) of the last row returned.
+        sql = "SELECT id, time, type, amount, balance, meta FROM transactions WHERE card = ?"
+        args = [card]
+        if before is not None:
+            sql += " AND (time < ? OR (time = ? AND id < ?))"
+            args += [before[0], before[0], before[1]]
+        if since:
+            sql += " AND time >= ?"
+            args.append(since)
+        if until:
+            sql += " AND time <= ?"
+            args.append(until)
+        if types:
+            sql += f" AND type IN ({','.join('?' * len(types))})"
+            args += types
+        sql += " ORDER BY time DESC, id DESC LIMIT ?"
+        args.append(limit + 1)
+        rows = self.conn.execute(sql, args).fetchall()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        cursor = (rows[-1]["time"], rows[-1]["id"]) if more else None
+        return [txn_from_row(r) for r in rows], cursor
+
+    def iter_transactions(self, card):
+        rows = self.conn.execute(
+            "SELECT time, type, amount, balance, meta FROM transactions WHERE card = ? ORDER BY time, id", (card,)
+        )
+        return (txn_from_row(r) for r in rows)
+
+    def commit(self, ops):
+        error = self.commit_many([ops])[0]
+        if error is not None:
+            raise error
+
+    def commit_many(self, batches):
+        # Several units of work in one SQLite transaction; each gets its own
+        # savepoint so a failing unit is rolled back without taking the others with it.
+        plans = [self._plan(ops) for ops in batches]
+        errors = [None] * len(batches)
+        with self.conn:
+            self.conn.execute("BEGIN")
+            for i, (ops, (deferred, txn_ids)) in enumerate(zip(batches, plans)):
+                self.conn.execute("SAVEPOINT unit")
+                try:
+                    self._execute(ops, deferred, txn_ids)
+                except sqlite3.Error as e:
+                    self.conn.execute("ROLLBACK TO unit")
+                    errors[i] = e
+                self.conn.execute("RELEASE unit")
+        for ops, (deferred, txn_ids), error in zip(batches, plans, errors):
+            if error is None:
+                self._update_cache(ops, deferred, txn_ids)
+        return errors
+
+    def _plan(self, ops):
+        txn_balances = {op["c"]: op["t"]["balance"] for op in ops if op["op"] == "txn"}
+        deferred = set()
+        for op in ops:
+            if op["op"] == "bal" and txn_balances.get(op["c"]) == op["v"] and self.cache.get(op["c"]) is not None:
+                deferred.add(op["c"])
+        return deferred, {}
+
+    def _execute(self, ops, deferred, txn_ids):
+        for op in ops:
+            kind, card = op["op"], op["c"]
+            if kind == "bal" and card not in deferred:
+                self.conn.execute(
+                    "UPDATE accounts SET balance = ?, balance_txn_id ="
+                    " (SELECT COALESCE(MAX(id), 0) FROM transactions WHERE card = ?) WHERE card = ?",
+                    (op["v"], card, card),
+                )
+            elif kind == "pin":
+                self.conn.execute("UPDATE accounts SET pin_hash = ? WHERE card = ?", (op["v"], card))
+            elif kind == "txn":
+                cur = self.conn.execute(
+                    "INSERT INTO transactions (card, time, type, amount, balance, meta) VALUES (?, ?, ?, ?, ?, ?)",
+                    txn_to_row(card, op["t"]),
+                )
+                txn_ids[card] = cur.lastrowid
+
+    def _update_cache(self, ops, deferred, txn_ids):
+        # Committed: bring cached records in line with what is now durable.
+        for op in ops:
+            kind, card = op["op"], op["c"]
+            rec = self.cache.peek(card)
+            if rec is None:
+                continue
+            if kind == "bal":
+                rec["balance"] = op["v"]
+                if card in deferred:
+                    self._txn_ids[card] = txn_ids[card]
+                    self.cache.mark_dirty(card)
+                else:
+                    self._txn_ids.pop(card, None)
+                    self.cache.mark_clean(card)
+            elif kind == "pin":
+                rec["pin_hash"] = op["v"]
+
+    def flush(self):
+        self.cache.flush()
+
+    def barrier(self):
+        self.flush()
+
+    def write_queue_depth(self):
+        return 0  # every commit is written before it returns
+
+    def sync_if_due(self):
+        pass
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+def txn_to_row(card, t):
+    return (card, t["time"], t["type"], t["amount"], t["balance"], json.dumps(t.get("meta") or {}))
+
+def txn_from_row(r):
+    return {
+        "time": r["time"],
+        "type": r["type"],
+        "amount": r["amount"],
+        "balance": r["balance"],
+        "meta": json.loads(r["meta"]),
+    }
+
+def import_data(db, data, txns_of=None):
+    with db.conn:
+        for card, user in data["users"].items():
+            db.conn.executemany(
+                "INSERT INTO transactions (card, time, type, amount, balance, meta) VALUES (?, ?, ?, ?, ?, ?)",
+                (txn_to_row(card, t) for t in (txns_of(card) if txns_of else user.get("transactions", []))),
+            )
+            db.conn.execute(
+                "INSERT INTO accounts (card, name, account_number, pin_hash, balance, balance_txn_id)"
+                " VALUES (?, ?, ?, ?, ?, (SELECT COALESCE(MAX(id), 0) FROM transactions WHERE card = ?))",
+                (card, user["name"], user["account_number"], user["pin_hash"], user["balance"], card),
+            )
+        for key, value in data.get("atm", {}).items():
+            db.conn.execute("INSERT INTO atm (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+def migrate_json(json_file, db_file):
+    # One-shot import of a bank_data.json (plus any pending journal) into a new SQLite file.
+    src = JsonStorage(json_file)
+    try:
+        db = SqliteStorage(db_file)
+        import_data(db, src.data, src.iter_transactions)
+    finally:
+        src.close()
+    return db
+
+def open_storage(path, legacy_json=None):
+    if path.endswith((".json", BANK_EXT)):
+        return JsonStorage(path)
+    if not os.path.exists(path):
+        # First start on SQLite: import the old JSON bank if there is one, else seed the demo cards.
+        if legacy_json and os.path.exists(legacy_json):
+            return migrate_json(legacy_json, path)
+        db = SqliteStorage(path)
+        import_data(db, seed_data())
+        return db
+    return SqliteStorage(path)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "migrate":
+        print("usage: python atm_storage.py migrate bank_data.json bank_data.db")
+        sys.exit(2)
+    if os.path.exists(sys.argv[3]):
+        print(f"{sys.argv[3]} already exists")
+        sys.exit(1)
+    migrate_json(sys.argv[2], sys.argv[3]).close()
+    print(f"Migrated {sys.argv[2]} -> {sys.argv[3]}")
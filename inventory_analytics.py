@@ -0,0 +1,161 @@
+import heapq
+import threading
+import time
+from collections import Counter, deque
+
+from inventory_model import Inventory
+from inventory_store import PAGE_SIZE
+
+# Incrementally maintained inventory analytics.
+#
+# InventoryAnalytics mirrors the catalogue in a columnar Inventory and keeps
+# running aggregates next to it, updating them from the service's change and
+# sales notifications:
+#   - total units and total stock value, adjusted by each changed row's delta
+#   - the set of products below the low-stock threshold
+#   - units sold per product over a sliding window, fed from the sales ledger
+# Every query is answered from these aggregates without scanning the catalogue.
+# Top-N is a heap selection over the products sold in the window.
+
+LOW_STOCK_THRESHOLD = 5
+SALES_WINDOW_SECONDS = 7 * 24 * 3600
+
+class InventoryAnalytics:
+    def __init__(self, threshold=LOW_STOCK_THRESHOLD, window=SALES_WINDOW_SECONDS):
+        self.threshold = threshold
+        self.window = window
+        self.model = Inventory()
+        self.total_units = 0
+        self.total_value = 0.0
+        self.low = set()
+        self.recent = deque()     # (time, name, qty, amount) sales inside the window, oldest first
+        self.sold = Counter()     # name -> units sold inside the window
+        self.revenue = 0.0        # takings inside the window
+        self._lock = threading.Lock()
+        self._touched = None      # names changed by notifications while load() runs
+        self.ready = threading.Event()
+
+    @classmethod
+    def attach(cls, service, threshold=LOW_STOCK_THRESHOLD, window=SALES_WINDOW_SECONDS):
+        # Subscribes first, then loads, so no change committed meanwhile is missed.
+        a = cls(threshold, window)
+        a.subscribe(service)
+        a.load(service.store)
+        return a
+
+    def subscribe(self, service):
+        service.subscribe(self.apply)
+        service.subscribe_sales(self.record_sales)
+
+    def load(self, store):
+        # Page by page, so notifications are not held up; rows a notification has
+        # already set are newer than what the page read and are left alone.
+        start = time.time()
+        with self._lock:
+            self._touched = set()
+        after = None
+        while True:
+            rows = store.page(after)
+            with self._lock:
+                for name, qty, price in rows:
+                    if name not in self._touched:
+                        self._set(name, (qty, price))
+            if len(rows) < PAGE_SIZE:
+                break
+            after = rows[-1][0]
+        with self._lock:
+            self._touched = None
+        # Sales from start on arrive through record_sales already.
+        self._backfill([s for s in store.sales_since(start - self.window) if s[0] < start])
+        self.ready.set()
+
+    def _set(self, name, row):
+        old = self.model.get(name)
+        if old is not None:
+            self.total_units -= old[0]
+            self.total_value -= old[0] * old[1]
+        if row is None:
+            self.model.apply({name: None})
+            self.low.discard(name)
+            return
+        qty, price = row
+        self.model.apply({name: row})
+        self.total_units += qty
+        self.total_value += qty * price
+        if qty < self.threshold:
+            self.low.add(name)
+        else:
+            self.low.discard(name)
+
+    def apply(self, changes):
+        with self._lock:
+            if self._touched is not None:
+                self._touched.update(changes)
+            for name, row in changes.items():
+                self._set(name, row)
+
+    def record_sales(self, sales):
+        with self._lock:
+            for when, name, qty, price in sales:
+                self.recent.append((when, name, qty, qty * price))
+                self.sold[name] += qty
+                self.revenue += qty * price
+            self._expire(time.time())
+
+    def _backfill(self, sales):
+        # Older sales than the ones notifications may have appended meanwhile;
+        # merged by time so recent stays oldest first for _expire.
+        with self._lock:
+            older = []
+            for when, name, qty, price in sales:
+                older.append((when, name, qty, qty * price))
+                self.sold[name] += qty
+                self.revenue += qty * price
+            self.recent = deque(heapq.merge(older, self.recent, key=lambda s: s[0]))
+            self._expire(time.time())
+
+    def _expire(self, now):
+        cutoff = now - self.window
+        recent, sold = self.recent, self.sold
+        while recent and recent[0][0] < cutoff:
+            _, name, qty, amount = recent.popleft()
+            self.revenue -= amount
+            sold[name] -= qty
+            if sold[name] <= 0:
+                del sold[name]
+
+    def valuation(self):
+        with self._lock:
+            return self.total_value
+
+    def units(self):
+        with self._lock:
+            return self.total_units
+
+    def low_stock(self, limit=None):
+        # Products under the threshold, fewest units first.
+        with self._lock:
+            rows = [(self.model.get(name)[0], name) for name in self.low]
+        rows = heapq.nsmallest(limit, rows) if limit else sorted(rows)
+        return [(name, qty) for qty, name in rows]
+
+    def top_sellers(self, n=10):
+        # [(name, units sold)] over the sliding window.
+        with self._lock:
+            self._expire(time.time())
+            return heapq.nlargest(n, self.sold.items(), key=lambda kv: (kv[1], kv[0]))
+
+    def window_revenue(self):
+        with self._lock:
+            self._expire(time.time())
+            return self.revenue
+
+    def summary(self, n=5):
+        return {
+            "products": len(self.model),
+            "units": self.units(),
+            "value": self.valuation(),
+            "low_stock": len(self.low),
+            "revenue": self.window_revenue(),
+            "top_sellers": self.top_sellers(n),
+        }
@@ -0,0 +1,116 @@
+import argparse
+import csv
+import time
+from datetime import datetime
+
+from inventory_model import Inventory
+from inventory_store import INVENTORY_DB, InventoryStore
+
+# Point-in-time reconstruction from the inventory event log.
+#
+# The state after changeset N can be rebuilt from any known full state by
+# replaying the events in between: forward (new values) from an earlier
+# snapshot, or backward (old values, newest first) from a later snapshot or
+# from the live products table. state_at() picks whichever start leaves the
+# fewest events to replay, so snapshots every SNAPSHOT_EVERY events keep the
+# cost bounded however long the log grows.
+#
+#   python inventory_history.py log
+#   python inventory_history.py at "2026-10-01 09:00:00" --export stock_then.csv
+#   python inventory_history.py verify
+
+def _starts(store, target):
+    # (events to replay, label, rows, lo, hi, reverse) for each possible starting point.
+    last = store.changesets(1)
+    last = last[0][0] if last else 0
+    yield store.count_events(target, last), "current", store.iter_items, target, last, True
+    for snap, cs, _, _ in store.snapshots():
+        rows = lambda snap=snap: store.snapshot_rows(snap)
+        if cs <= target:
+            yield store.count_events(cs, target), f"snapshot {snap}", rows, cs, target, False
+        else:
+            yield store.count_events(target, cs), f"snapshot {snap}", rows, target, cs, True
+
+def state_at(store, target):
+    # Inventory as it was right after changeset target; also returns (start used, events replayed).
+    replay, start, rows, lo, hi, reverse = min(_starts(store, target), key=lambda s: s[0])
+    inv = Inventory()
+    for name, qty, price in rows():
+        inv.add(name, qty, price)
+    for name, old_qty, old_price, new_qty, new_price in store.events(lo, hi, reverse):
+        qty, price = (old_qty, old_price) if reverse else (new_qty, new_price)
+        inv.apply({name: None if qty is None else (qty, price)})
+    return inv, (start, replay)
+
+def parse_when(text):
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(text, fmt).timestamp()
+        except ValueError:
+            pass
+    raise ValueError(f"unrecognised time {text!r}; use YYYY-MM-DD [HH:MM[:SS]]")
+
+def fmt_time(ts):
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and rebuild inventory history.")
+    parser.add_argument("--db", default=INVENTORY_DB)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_log = sub.add_parser("log", help="list recent changesets")
+    p_log.add_argument("-n", type=int, default=20)
+    p_at = sub.add_parser("at", help="reconstruct the stock at a time or changeset")
+    p_at.add_argument("when", help="YYYY-MM-DD [HH:MM[:SS]] or #changeset")
+    p_at.add_argument("--export", help="write the reconstructed stock to this CSV file")
+    sub.add_parser("verify", help="rebuild the current stock from the log and compare")
+    args = parser.parse_args()
+
+    store = InventoryStore(args.db)
+    try:
+        if args.cmd == "log":
+            for cs, when, kind, target, label in store.changesets(args.n):
+                ref = f" #{target}" if target else ""
+                print(f"#{cs:<8}{fmt_time(when)}  {kind}{ref:<8} {label}")
+            return
+        if args.cmd == "verify":
+            last = store.changesets(1)
+            target = last[0][0] if last else 0
+            # Force a replay from the newest snapshot rather than copying the live table.
+            snaps = [s for s in store.snapshots() if s[1] <= target]
+            if not snaps:
+                print("No snapshot yet; nothing to verify against.")
+                return
+            snap, cs = snaps[-1][0], snaps[-1][1]
+            t0 = time.perf_counter()
+            inv = Inventory()
+            for name, qty, price in store.snapshot_rows(snap):
+                inv.add(name, qty, price)
+            for name, _, _, new_qty, new_price in store.events(cs, target):
+                inv.apply({name: None if new_qty is None else (new_qty, new_price)})
+            elapsed = time.perf_counter() - t0
+            live = {name: (qty, price) for name, qty, price in store.iter_items()}
+            rebuilt = {name: (qty, price) for name, qty, price in inv}
+            status = "OK" if live == rebuilt else "MISMATCH"
+            print(f"{status}: snapshot {snap} + {store.count_events(cs, target)} events -> "
+                  f"{len(rebuilt)} products in {elapsed:.2f}s (live table has {len(live)})")
+            return
+        if args.when.startswith("#"):
+            target = int(args.when[1:])
+        else:
+            target = store.changeset_at(parse_when(args.when))
+        t0 = time.perf_counter()
+        inv, (start, replay) = state_at(store, target)
+        elapsed = time.perf_counter() - t0
+        print(f"State after changeset #{target}: {len(inv)} products, {inv.total_units()} units, "
+              f"value {inv.total_value():,.2f} (from {start}, {replay} events replayed, {elapsed:.2f}s)")
+        if args.export:
+            with open(args.export, "w", encoding="utf-8", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(("name", "qty", "price"))
+                writer.writerows(sorted(inv))
+            print(f"Exported to {args.export}")
+    finally:
+        store.close()
+
+if __name__ == "__main__":
+    main()
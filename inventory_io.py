@@ -0,0 +1,165 @@
+import argparse
+import csv
+import io
+import json
+import os
+
+from inventory_service import InventoryService
+from inventory_store import INVENTORY_DB
+
+# Streaming bulk import/export for the inventory.
+#
+# Files are CSV (header: name,qty,price) or JSON Lines ({"name", "qty",
+# "price"} per line), chosen by extension. Imports read the file in chunks of
+# IMPORT_CHUNK_ROWS. Each row is checked with the same rules as the Add / Update
+# form. Rows for the same product are merged within a chunk, and the chunk is
+# added to stock in one transaction. Bad rows are reported by line number and
+# skipped. Neither direction ever holds the whole file in memory.
+#
+#   python inventory_io.py import stock.csv
+#   python inventory_io.py export backup.jsonl
+
+IMPORT_CHUNK_ROWS = 10_000
+MAX_REPORTED_ERRORS = 1000  # further bad rows are only counted
+FIELDS = ("name", "qty", "price")
+
+def is_jsonl(path):
+    return path.lower().endswith((".jsonl", ".ndjson"))
+
+def parse_row(name, qty, price):
+    # Same rules as add_item: a non-empty name, an integer quantity and a numeric price.
+    name = (name or "").strip() if isinstance(name, str) else ""
+    if not name:
+        raise ValueError("Please enter a product name!")
+    if isinstance(qty, bool) or isinstance(qty, float):
+        raise ValueError("Please enter valid quantity and price!")
+    try:
+        return name, int(qty), float(price)
+    except (TypeError, ValueError):
+        raise ValueError("Please enter valid quantity and price!") from None
+
+class ByteCounter(io.RawIOBase):
+    # Passes a binary file through while counting bytes consumed, for progress reporting.
+    def __init__(self, raw):
+        self.raw = raw
+        self.count = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buf):
+        n = self.raw.readinto(buf)
+        self.count += n or 0
+        return n
+
+def read_rows(f, jsonl):
+    # Yields (line number, (name, qty, price)) with raw values, or (line number, error) for unreadable rows.
+    if jsonl:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                rec = json.loads(line)
+                yield line_no, (rec.get("name"), rec.get("qty"), rec.get("price"))
+            except (ValueError, AttributeError) as e:
+                yield line_no, ValueError(f"unreadable row ({e})")
+        return
+    reader = csv.reader(f)
+    header = next(reader, None)
+    if header is None:
+        return
+    cols = [h.strip().lower() for h in header]
+    try:
+        idx = [cols.index(field) for field in FIELDS]
+    except ValueError:
+        raise ValueError(f"CSV header must contain {', '.join(FIELDS)}") from None
+    for row in reader:
+        if not any(row):
+            continue
+        try:
+            yield reader.line_num, (row[idx[0]], row[idx[1]], row[idx[2]])
+        except IndexError:
+            yield reader.line_num, ValueError("missing columns")
+
+def import_file(service, path, chunk_rows=IMPORT_CHUNK_ROWS, progress=None, cancelled=None):
+    # Returns (rows imported, bad row count, [(line, message), ...] for the first MAX_REPORTED_ERRORS).
+    # progress(done_bytes, total_bytes) is called once per chunk, from the calling thread.
+    total_bytes = os.path.getsize(path)
+    imported = bad = 0
+    errors = []
+    with open(path, "rb") as raw:
+        counter = ByteCounter(raw)
+        f = io.TextIOWrapper(io.BufferedReader(counter), encoding="utf-8-sig", newline="")
+        chunk = {}
+        rows_in_chunk = 0
+        for line_no, fields in read_rows(f, is_jsonl(path)):
+            try:
+                if isinstance(fields, Exception):
+                    raise fields
+                name, qty, price = parse_row(*fields)
+            except ValueError as e:
+                bad += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append((line_no, str(e)))
+                continue
+            old = chunk.get(name)
+            chunk[name] = (qty + (old[0] if old else 0), price)  # last price wins, like repeated adds
+            rows_in_chunk += 1
+            if rows_in_chunk >= chunk_rows:
+                service.add_many(chunk)
+                imported += rows_in_chunk
+                chunk, rows_in_chunk = {}, 0
+                if progress:
+                    progress(counter.count, total_bytes)
+                if cancelled and cancelled():
+                    return imported, bad, errors
+        if chunk:
+            service.add_many(chunk)
+            imported += rows_in_chunk
+    if progress:
+        progress(total_bytes, total_bytes)
+    return imported, bad, errors
+
+def export_file(store, path, progress=None, every=IMPORT_CHUNK_ROWS):
+    # Streams the catalogue in name order; progress(done_rows, total_rows).
+    total = store.count()
+    done = 0
+    jsonl = is_jsonl(path)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8", newline="") as f:
+        writer = None if jsonl else csv.writer(f)
+        if writer:
+            writer.writerow(FIELDS)
+        for name, qty, price in store.iter_items():
+            if jsonl:
+                f.write(json.dumps({"name": name, "qty": qty, "price": price}) + "\n")
+            else:
+                writer.writerow((name, qty, price))
+            done += 1
+            if progress and done % every == 0:
+                progress(done, total)
+    os.replace(tmp, path)
+    if progress:
+        progress(done, total)
+    return done
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import/export inventory CSV or JSON Lines files.")
+    parser.add_argument("action", choices=("import", "export"))
+    parser.add_argument("file")
+    parser.add_argument("--db", default=INVENTORY_DB)
+    args = parser.parse_args()
+    service = InventoryService.open(args.db)
+    try:
+        if args.action == "export":
+            print(f"Exported {export_file(service.store, args.file)} products to {args.file}")
+            return
+        imported, bad, errors = import_file(service, args.file)
+        print(f"Imported {imported} rows into {args.db}; {bad} rejected")
+        for line_no, msg in errors:
+            print(f"  line {line_no}: {msg}")
+    finally:
+        service.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,48 @@
+import queue
+import threading
 import tkinter as tk
-from tkinter import messagebox
+from tkinter import filedialog, messagebox, ttk
 
-inventory = {}
+from inventory_analytics import InventoryAnalytics
+from inventory_io import export_file, import_file
+from inventory_search import SearchIndex
+from inventory_service import InventoryService
+from inventory_store import INVENTORY_DB
+from inventory_view import InventoryTable
+from ui_toast import Toaster
+
+UI_POLL_MS = 50
+SEARCH_RESULTS = 8
+FILE_TYPES = [("CSV", "*.csv"), ("JSON Lines", "*.jsonl *.ndjson")]
+
+inventory = InventoryService.open(INVENTORY_DB)
+
+# Inventory changes and job results can come from worker threads; they are
+# queued here and applied on the Tk thread by poll_ui, with changes coalesced.
+ui_calls = queue.SimpleQueue()
+pending_changes = {}
+pending_lock = threading.Lock()
+
+# The search index is filled on a background thread so the window opens at once;
+# until it is ready, searches fall back to a case-sensitive prefix query on the store.
+search_index = SearchIndex()
+search_ready = threading.Event()
+inventory.subscribe(search_index.apply)
+
+def build_search_index():
+    search_index.add_many(name for name, _, _ in inventory.store.iter_items())
+    search_ready.set()
+
+threading.Thread(target=build_search_index, daemon=True).start()
+
+analytics = InventoryAnalytics()
+analytics.subscribe(inventory)
+threading.Thread(target=analytics.load, args=(inventory.store,), daemon=True).start()
+
+def find_products(query, limit=SEARCH_RESULTS):
+    if search_ready.is_set():
+        return search_index.search(query, limit)
+    return inventory.store.prefix(query.strip(), limit)
 
 def add_item():
     name = entry_name.get().strip()
@@ -9,58 +50,207 @@ def add_item():
         qty = int(entry_qty.get())
         price = float(entry_price.get())
     except ValueError:
-        messagebox.showerror("Error", "Please enter valid quantity and price!")
+        toast.error("Please enter valid quantity and price!")
         return
 
-    if not name:
-        messagebox.showerror("Error", "Please enter a product name!")
+    ok, msg = inventory.add_item(name, qty, price)
+    if not ok:
+        toast.error(msg)
         return
+    toast.info(msg, action=("Undo", undo))
 
-    if name in inventory:
-        inventory[name]['qty'] += qty
-        inventory[name]['price'] = price
-    else:
-        inventory[name] = {'qty': qty, 'price': price}
+def sell_item():
+    name = entry_name.get().strip()
+    try:
+        qty = int(entry_qty.get())
+    except ValueError:
+        toast.error("Please enter a valid quantity!")
+        return
+    ok, msg = inventory.sell_item(name, qty)
+    if not ok:
+        if name and inventory.get(name) is None:
+            matches = find_products(name, 3)
+            if matches:
+                msg += "\nDid you mean: " + ", ".join(matches) + "?"
+        toast.error(msg)
+        return
+    toast.info(msg, action=("Undo", undo))
 
-    messagebox.showinfo("Success", f"Added/Updated {name} with qty {qty} and price {price:.2f}")
-    refresh_inventory()
+basket = []  # (name, qty) lines of the order being keyed in
 
-def sell_item():
+def add_to_basket():
     name = entry_name.get().strip()
     try:
         qty = int(entry_qty.get())
     except ValueError:
-        messagebox.showerror("Error", "Please enter a valid quantity!")
+        toast.error("Please enter a valid quantity!")
+        return
+    if not name:
+        toast.error("Please enter a product name!")
+        return
+    basket.append((name, qty))
+    show_basket()
+
+def checkout():
+    if not basket:
+        return
+    ok, msg = inventory.sell_order(basket)
+    if not ok:
+        toast.error(msg)
         return
-    if name not in inventory:
-        messagebox.showerror("Error", "Item not found!")
+    basket.clear()
+    show_basket()
+    toast.info(msg, action=("Undo", undo))
+
+def clear_basket():
+    basket.clear()
+    show_basket()
+
+def show_basket():
+    lines = ", ".join(f"{qty} x {name}" for name, qty in basket[-5:])
+    if len(basket) > 5:
+        lines = "..., " + lines
+    basket_var.set(f"Basket ({len(basket)}): {lines}" if basket else "Basket is empty.")
+
+def select_item(name):
+    row = inventory.get(name)
+    if row is None:
+        return
+    entry_name.delete(0, tk.END)
+    entry_name.insert(0, name)
+    entry_price.delete(0, tk.END)
+    entry_price.insert(0, f"{row[1]:.2f}")
+
+def on_inventory_change(changes):
+    with pending_lock:
+        pending_changes.update(changes)
+
+def poll_ui():
+    with pending_lock:
+        changes = dict(pending_changes)
+        pending_changes.clear()
+    if changes:
+        table_inventory.on_change(changes)
+    while True:
+        try:
+            fn = ui_calls.get_nowait()
+        except queue.Empty:
+            break
+        fn()
+    root.after(UI_POLL_MS, poll_ui)
+
+def run_job(label, job, on_done):
+    # Runs job(progress) on a worker thread; progress(done, total) drives the progress bar.
+    for btn in job_buttons:
+        btn.config(state="disabled")
+    progress_bar.config(value=0)
+    status_var.set(label)
+
+    def progress(done, total):
+        ui_calls.put(lambda: progress_bar.config(value=100 * done / total if total else 100))
+
+    def finish():
+        for btn in job_buttons:
+            btn.config(state="normal")
+        status_var.set("")
+
+    def work():
+        try:
+            result = job(progress)
+            ui_calls.put(lambda: (finish(), on_done(result)))
+        except Exception as e:
+            ui_calls.put(lambda e=e: (finish(), toast.error(str(e))))
+
+    threading.Thread(target=work, daemon=True).start()
+
+def import_items():
+    path = filedialog.askopenfilename(title="Import stock", filetypes=FILE_TYPES)
+    if not path:
         return
-    if qty > inventory[name]['qty']:
-        messagebox.showerror("Error", "Not enough stock!")
+
+    def done(result):
+        imported, bad, errors = result
+        msg = f"Imported {imported} rows."
+        if not bad:
+            toast.info(msg)
+            return
+        # The rejected rows need reading, so these stay in a dialog.
+        shown = "\n".join(f"line {line_no}: {err}" for line_no, err in errors[:10])
+        msg += f"\n{bad} rows rejected:\n{shown}"
+        if bad > 10:
+            msg += "\n..."
+        messagebox.showwarning("Import", msg)
+
+    run_job(f"Importing {path}...", lambda progress: import_file(inventory, path, progress=progress), done)
+
+def export_items():
+    path = filedialog.asksaveasfilename(title="Export stock", filetypes=FILE_TYPES, defaultextension=".csv")
+    if not path:
         return
+    run_job(f"Exporting to {path}...", lambda progress: export_file(inventory.store, path, progress=progress),
+            lambda n: toast.info(f"Exported {n} products to {path}"))
+
+def on_search(event=None):
+    query = entry_search.get()
+    list_results.delete(0, tk.END)
+    if query.strip():
+        for name in find_products(query):
+            list_results.insert(tk.END, name)
 
-    inventory[name]['qty'] -= qty
-    total = qty * inventory[name]['price']
-    if inventory[name]['qty'] == 0:
-        del inventory[name]
-        messagebox.showinfo("Sold", f"Sold {qty} {name}(s) for ${total:.2f}\n{name} is now out of stock.")
-    else:
-        messagebox.showinfo("Sold", f"Sold {qty} {name}(s) for ${total:.2f}")
-    refresh_inventory()
-
-def refresh_inventory():
-    text_inventory.delete("1.0", tk.END)
-    if not inventory:
-        text_inventory.insert(tk.END, "Inventory is empty.\n")
+def pick_result(event=None):
+    sel = list_results.curselection()
+    if not sel:
         return
-    text_inventory.insert(tk.END, f"{'Product':<15}{'Qty':<10}{'Price':<10}\n")
-    text_inventory.insert(tk.END, "-"*35 + "\n")
-    for name, data in inventory.items():
-        text_inventory.insert(tk.END, f"{name:<15}{data['qty']:<10}{data['price']:<10.2f}\n")
+    name = list_results.get(sel[0])
+    select_item(name)
+    table_inventory.show(name)
+
+def undo(event=None):
+    ok, msg = inventory.undo()
+    (toast.info if ok else toast.error)(msg)
+
+def redo(event=None):
+    ok, msg = inventory.redo()
+    (toast.info if ok else toast.error)(msg)
+
+def show_reports():
+    if not analytics.ready.is_set():
+        toast.info("Still loading the catalogue, try again in a moment.")
+        return
+    summary = analytics.summary()
+    lines = [
+        f"Products: {summary['products']}",
+        f"Units in stock: {summary['units']}",
+        f"Stock value: ${summary['value']:,.2f}",
+        f"Sales in the last {analytics.window // 86400} days: ${summary['revenue']:,.2f}",
+        "",
+        "Top sellers:",
+    ]
+    lines += [f"  {name}: {units}" for name, units in summary["top_sellers"]] or ["  (no sales)"]
+    lines += ["", f"Below {analytics.threshold} units: {summary['low_stock']}"]
+    lines += [f"  {name}: {qty}" for name, qty in analytics.low_stock(10)]
+    win = tk.Toplevel(root)
+    win.title("Inventory Reports")
+    text = tk.Text(win, width=50, height=len(lines) + 1)
+    text.insert("1.0", "\n".join(lines))
+    text.config(state="disabled")
+    text.pack(padx=10, pady=10)
 
 # GUI Setup
 root = tk.Tk()
 root.title("Inventory Management System")
+toast = Toaster(root)
+
+# Search
+frame_search = tk.Frame(root)
+frame_search.pack(pady=(10, 0), fill="x", padx=10)
+tk.Label(frame_search, text="Search:").pack(side="left")
+entry_search = tk.Entry(frame_search)
+entry_search.pack(side="left", fill="x", expand=True, padx=5)
+entry_search.bind("<KeyRelease>", on_search)
+list_results = tk.Listbox(root, height=4)
+list_results.pack(fill="x", padx=10)
+list_results.bind("<<ListboxSelect>>", pick_result)
 
 # Input fields
 frame_input = tk.Frame(root)
@@ -84,15 +274,41 @@ frame_buttons.pack(pady=10)
 
 tk.Button(frame_buttons, text="Add / Update Item", command=add_item).grid(row=0, column=0, padx=5)
 tk.Button(frame_buttons, text="Sell Item", command=sell_item).grid(row=0, column=1, padx=5)
-tk.Button(frame_buttons, text="Exit", command=root.quit).grid(row=0, column=2, padx=5)
+tk.Button(frame_buttons, text="Exit", command=root.quit).grid(row=0, column=4, padx=5)
+job_buttons = [
+    tk.Button(frame_buttons, text="Import...", command=import_items),
+    tk.Button(frame_buttons, text="Export...", command=export_items),
+]
+job_buttons[0].grid(row=0, column=2, padx=5)
+job_buttons[1].grid(row=0, column=3, padx=5)
+tk.Button(frame_buttons, text="Add to Basket", command=add_to_basket).grid(row=1, column=0, padx=5, pady=5)
+tk.Button(frame_buttons, text="Checkout", command=checkout).grid(row=1, column=1, padx=5, pady=5)
+tk.Button(frame_buttons, text="Clear Basket", command=clear_basket).grid(row=1, column=2, padx=5, pady=5)
+tk.Button(frame_buttons, text="Reports", command=show_reports).grid(row=1, column=3, padx=5, pady=5)
+tk.Button(frame_buttons, text="Undo", command=undo).grid(row=2, column=0, padx=5)
+tk.Button(frame_buttons, text="Redo", command=redo).grid(row=2, column=1, padx=5)
+root.bind("<Control-z>", undo)
+root.bind("<Control-y>", redo)
+basket_var = tk.StringVar(value="Basket is empty.")
+tk.Label(root, textvariable=basket_var, anchor="w").pack(fill="x", padx=10)
+
+# Progress of bulk import/export
+frame_progress = tk.Frame(root)
+frame_progress.pack(fill="x", padx=10)
+status_var = tk.StringVar()
+tk.Label(frame_progress, textvariable=status_var, anchor="w").pack(fill="x")
+progress_bar = ttk.Progressbar(frame_progress, maximum=100)
+progress_bar.pack(fill="x")
 
 # Inventory display
 frame_display = tk.Frame(root)
 frame_display.pack(pady=10)
 
 tk.Label(frame_display, text="Current Inventory:").pack()
-text_inventory = tk.Text(frame_display, width=40, height=10)
-text_inventory.pack()
+table_inventory = InventoryTable(frame_display, inventory.store, on_select=select_item)
+table_inventory.pack(fill="both", expand=True)
+inventory.subscribe(on_inventory_change)  # only the changed rows are redrawn
 
-refresh_inventory()
+poll_ui()
 root.mainloop()
+inventory.close()
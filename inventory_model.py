@@ -0,0 +1,130 @@
+import operator
+from array import array
+
+try:
+    import numpy
+except ImportError:  # aggregates fall back to plain loops over the arrays
+    numpy = None
+
+# Compact in-memory inventory.
+#
+# Products are stored column-wise: a name -> row dict plus parallel typed
+# arrays of quantities and prices, so a product costs its name, one dict slot
+# and 16 bytes of column data rather than a dict per item. Rows of removed
+# products are recycled. Aggregates run over the columns, through numpy when it
+# is installed.
+#
+# Inventory follows the same add/sell rules as InventoryService and can be kept
+# in step with an InventoryStore by subscribing apply() to the service:
+#
+#   model = Inventory.load(service.store)
+#   service.subscribe(model.apply)
+
+class Inventory:
+    __slots__ = ("names", "index", "qty", "price", "free")
+
+    def __init__(self):
+        self.names = []          # row -> name, None for a free row
+        self.index = {}          # name -> row
+        self.qty = array("q")
+        self.price = array("d")
+        self.free = []           # rows to reuse
+
+    @classmethod
+    def load(cls, store):
+        inv = cls()
+        for name, qty, price in store.iter_items():
+            inv._put(name, qty, price)
+        return inv
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __iter__(self):
+        # (name, qty, price) in insertion order
+        qty, price = self.qty, self.price
+        for name, row in self.index.items():
+            yield name, qty[row], price[row]
+
+    def get(self, name):
+        row = self.index.get(name)
+        return None if row is None else (self.qty[row], self.price[row])
+
+    def _put(self, name, qty, price):
+        row = self.index.get(name)
+        if row is None:
+            if self.free:
+                row = self.free.pop()
+                self.names[row] = name
+            else:
+                row = len(self.names)
+                self.names.append(name)
+                self.qty.append(0)
+                self.price.append(0.0)
+            self.index[name] = row
+        self.qty[row] = qty
+        self.price[row] = price
+        return row
+
+    def _remove(self, name):
+        row = self.index.pop(name, None)
+        if row is not None:
+            self.names[row] = None
+            self.qty[row] = 0
+            self.price[row] = 0.0
+            self.free.append(row)
+
+    def add(self, name, qty, price):
+        # add_item: stock accumulates, the price is replaced. Returns the new quantity.
+        row = self.index.get(name)
+        new_qty = qty + (self.qty[row] if row is not None else 0)
+        self._put(name, new_qty, price)
+        return new_qty
+
+    def sell(self, name, qty):
+        # sell_item: the product is dropped once it reaches zero. Returns the sale total.
+        if isinstance(qty, bool) or not isinstance(qty, int) or qty <= 0:
+            raise ValueError("Please enter a valid quantity!")  # a negative sale would add stock
+        row = self.index.get(name)
+        if row is None:
+            raise KeyError("Item not found!")
+        if qty > self.qty[row]:
+            raise ValueError("Not enough stock!")
+        total = qty * self.price[row]
+        if qty == self.qty[row]:
+            self._remove(name)
+        else:
+            self.qty[row] -= qty
+        return total
+
+    def apply(self, changes):
+        # Mirrors a committed InventoryService change set: {name: (qty, price) or None}.
+        for name, row in changes.items():
+            if row is None:
+                self._remove(name)
+            else:
+                self._put(name, row[0], row[1])
+
+    def total_units(self):
+        if numpy is not None:
+            return int(numpy.frombuffer(self.qty, dtype=numpy.int64).sum())
+        return sum(self.qty)
+
+    def total_value(self):
+        # Free rows hold qty 0 and price 0, so whole columns can be summed.
+        if numpy is not None:
+            return float(numpy.dot(numpy.frombuffer(self.qty, dtype=numpy.int64).astype(numpy.float64),
+                                   numpy.frombuffer(self.price, dtype=numpy.float64)))
+        return sum(map(operator.mul, self.qty, self.price))
+
+    def low_stock(self, threshold):
+        # Names of products with fewer than threshold units, in row order.
+        names = self.names
+        if numpy is not None:
+            rows = numpy.flatnonzero(numpy.frombuffer(self.qty, dtype=numpy.int64) < threshold).tolist()
+        else:
+            rows = [row for row, q in enumerate(self.qty) if q < threshold]
+        return [names[row] for row in rows if names[row] is not None]
@@ -0,0 +1,151 @@
+import heapq
+import itertools
+import threading
+from bisect import bisect_left
+
+# Product search: case-insensitive prefix completion plus typo-tolerant
+# matching, over one sorted list of "<casefolded name>\0<name>" keys.
+#
+# A prefix lookup is a bisect followed by a short forward walk. Fuzzy lookup
+# expands the query into every string one edit away (a deletion, a
+# transposition, or a substitution or insertion drawn from the characters that
+# occur in product names) and runs a prefix lookup for each. That finds
+# products whose name starts with the query give or take one typo, in a few
+# hundred bisects, with no index beyond the sorted keys.
+#
+# The index only holds names. Subscribing apply() to an InventoryService keeps
+# it current: a single add or sell costs one bisect and insert. A bulk add (the startup
+# build) folds, sorts and merges its keys into a copy of the list without the
+# lock, so adds and sells on the UI thread are not held up while it runs;
+# changes made meanwhile are logged and replayed onto the copy before it is
+# swapped in.
+
+BULK_REBUILD = 1000  # change sets larger than this re-sort the key list instead of inserting one by one
+SEP = "\0"
+
+def fold(name):
+    return name.casefold()
+
+def key_of(name):
+    return fold(name) + SEP + name
+
+def one_edit(q, alphabet):
+    # Every string one deletion, transposition, substitution or insertion away from q.
+    # Appending at the end is left out: q's own prefix matches already cover it.
+    out = set()
+    for i in range(len(q)):
+        head, tail = q[:i], q[i + 1:]
+        out.add(head + tail)
+        if tail:
+            out.add(head + tail[0] + q[i] + tail[1:])
+        for c in alphabet:
+            out.add(head + c + tail)
+            out.add(head + c + q[i:])
+    out.discard(q)
+    out.discard("")
+    return out
+
+class SearchIndex:
+    def __init__(self, names=()):
+        self._lock = threading.RLock()
+        self.keys = []           # sorted key_of(name)
+        self.alphabet = set()    # characters seen in folded names
+        self._logs = []          # per bulk add in progress: [(added?, key)] made since it copied keys
+        self.add_many(names)
+
+    @classmethod
+    def load(cls, store):
+        return cls(name for name, _, _ in store.iter_items())
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add_many(self, names):
+        # names may be a generator over the store; it is consumed before the lock is taken.
+        new = sorted(set(map(key_of, names)))
+        if len(new) <= BULK_REBUILD:
+            with self._lock:
+                self._insert(self.keys, new)
+                self._log(True, new)
+            return
+        log = []
+        with self._lock:
+            base = list(self.keys)
+            self._logs.append(log)
+        try:
+            merged = [key for key, _ in itertools.groupby(heapq.merge(base, new))]
+            alphabet = set()
+            for key in new:
+                alphabet.update(key.split(SEP, 1)[0])
+        finally:
+            with self._lock:
+                self._logs.remove(log)
+        with self._lock:
+            for added, key in log:
+                (self._insert if added else self._delete)(merged, [key])
+            self.keys = merged
+            self.alphabet |= alphabet
+
+    def remove_many(self, names):
+        gone = [key_of(n) for n in names]
+        with self._lock:
+            if len(gone) > BULK_REBUILD:
+                dropped = set(gone)
+                self.keys = [k for k in self.keys if k not in dropped]
+            else:
+                self._delete(self.keys, gone)
+            self._log(False, gone)
+
+    def _insert(self, keys, new):
+        for key in new:
+            i = bisect_left(keys, key)
+            if i == len(keys) or keys[i] != key:
+                keys.insert(i, key)
+                self.alphabet.update(key.split(SEP, 1)[0])
+
+    def _delete(self, keys, gone):
+        for key in gone:
+            i = bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                del keys[i]
+
+    def _log(self, added, keys):
+        for log in self._logs:
+            log.extend((added, key) for key in keys)
+
+    def apply(self, changes):
+        # InventoryService change set; only additions and removals matter here.
+        self.remove_many([n for n, row in changes.items() if row is None])
+        self.add_many(n for n, row in changes.items() if row is not None)
+
+    def _walk(self, q, limit):
+        keys = self.keys
+        i = bisect_left(keys, q)
+        out = []
+        while i < len(keys) and len(out) < limit and keys[i].startswith(q):
+            out.append(keys[i].split(SEP, 1)[1])
+            i += 1
+        return out
+
+    def prefix(self, query, limit=20):
+        q = fold(query.strip())
+        with self._lock:
+            return self._walk(q, limit)
+
+    def fuzzy(self, query, limit=20):
+        # Names starting with something one edit away from query (exact prefix matches excluded).
+        q = fold(query.strip())
+        if not q:
+            return []
+        with self._lock:
+            found = set()
+            for variant in one_edit(q, self.alphabet):
+                found.update(self._walk(variant, limit))
+        return sorted((n for n in found if not fold(n).startswith(q)), key=key_of)[:limit]
+
+    def search(self, query, limit=20):
+        # Prefix matches first, topped up with fuzzy ones.
+        found = self.prefix(query, limit)
+        if len(found) < limit:
+            found += self.fuzzy(query, limit - len(found))
+        return found
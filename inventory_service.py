@@ -0,0 +1,246 @@
+import argparse
+import json
+import threading
+import time
+
+from inventory_store import INVENTORY_DB, InventoryStore
+
+# UI-independent inventory logic; the Tk app (or any script) drives an
+# InventoryService and shows the (ok, message) results however it likes.
+# Every committed change is published to subscribers as {name: (qty, price)},
+# with None for a removed product, so views can update just those rows. Sales
+# are also recorded in a ledger and published to sales subscribers as
+# [(time, name, qty, price), ...].
+#
+# Each write is a changeset in the store's event log, which is what undo() and
+# redo() work from. Both revert one changeset by writing its "before" values
+# back as a new changeset, so the log stays append-only. The undo stack holds
+# the changesets whose effects are live, newest last. The redo stack holds the
+# undos that can themselves be reverted. Any new change clears the redo stack.
+
+UNDO_DEPTH = 100
+
+class InventoryService:
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.RLock()
+        self._listeners = []
+        self._sales_listeners = []
+        self._undo, self._redo = self._load_stacks()
+
+    @classmethod
+    def open(cls, path=INVENTORY_DB):
+        return cls(InventoryStore(path))
+
+    def subscribe(self, fn):
+        self._listeners.append(fn)
+
+    def unsubscribe(self, fn):
+        self._listeners.remove(fn)
+
+    def subscribe_sales(self, fn):
+        self._sales_listeners.append(fn)
+
+    def _load_stacks(self):
+        # Rebuilt from the tail of the changeset log, so undo survives a restart.
+        undo, redo = [], []
+        for cs, _, kind, target, _ in reversed(self.store.changesets(UNDO_DEPTH * 2)):
+            if kind == "do":
+                undo.append(cs)
+                redo.clear()
+            elif kind == "undo":
+                if target in undo:
+                    undo.remove(target)
+                redo.append(cs)
+            elif kind == "redo":
+                if target in redo:
+                    redo.remove(target)
+                undo.append(cs)
+        return undo[-UNDO_DEPTH:], redo[-UNDO_DEPTH:]
+
+    def _apply(self, changes, before=None, sales=(), label="", kind="do", target=None):
+        cs = self.store.apply(changes, before, sales, kind, target, label)
+        if kind == "do":
+            self._undo.append(cs)
+            del self._undo[:-UNDO_DEPTH]
+            self._redo.clear()
+        elif kind == "undo":
+            self._redo.append(cs)
+        else:
+            self._undo.append(cs)
+        for fn in list(self._listeners):
+            fn(changes)
+        if sales:
+            for fn in list(self._sales_listeners):
+                fn(sales)
+
+    def get(self, name):
+        return self.store.get(name)
+
+    def add_item(self, name, qty, price):
+        name = name.strip()
+        if not name:
+            return False, "Please enter a product name!"
+        with self._lock:
+            row = self.store.get(name)
+            new_qty = qty + (row[0] if row else 0)
+            self._apply({name: (new_qty, price)}, {name: row} if row else {}, label=f"add {name}")
+        return True, f"Added/Updated {name} with qty {qty} and price {price:.2f}"
+
+    def add_many(self, items, label="bulk add"):
+        # Bulk add_item: items is {name: (qty, price)} with names already validated.
+        # Quantities are merged into existing stock and everything is written in one transaction.
+        if not items:
+            return 0
+        with self._lock:
+            existing = self.store.get_many(items)
+            changes = {}
+            for name, (qty, price) in items.items():
+                row = existing.get(name)
+                changes[name] = (qty + (row[0] if row else 0), price)
+            self._apply(changes, existing, label=label)
+        return len(changes)
+
+    def sell_item(self, name, qty):
+        return self.sell_order([(name, qty)])
+
+    def sell_order(self, lines):
+        # A basket of (name, qty) lines: either every line is sold or none is.
+        return self.sell_orders([lines])[0]
+
+    def sell_orders(self, orders):
+        # Many baskets, each all-or-nothing, checked in order against the stock the
+        # earlier ones left; every accepted basket is written in one transaction
+        # with a single change notification. Returns one (ok, message) per basket.
+        with self._lock:
+            names = {str(name).strip() for lines in orders for name, _ in lines}
+            before = self.store.get_many(names)
+            stock = dict(before)
+            changes = {}
+            sales = []
+            now = time.time()
+            results = []
+            for lines in orders:
+                wanted = {}
+                error = None
+                for name, qty in lines:
+                    name = str(name).strip()
+                    if isinstance(qty, bool) or not isinstance(qty, int) or qty <= 0:
+                        error = "Please enter a valid quantity!"
+                        break
+                    wanted[name] = wanted.get(name, 0) + qty
+                    row = stock.get(name)
+                    if row is None:
+                        error = f"Item not found: {name}"
+                        break
+                    if wanted[name] > row[0]:
+                        error = f"Not enough stock of {name}!"
+                        break
+                if error or not wanted:
+                    results.append((False, error or "The basket is empty!"))
+                    continue
+                total = 0.0
+                sold_out = []
+                for name, qty in wanted.items():
+                    stock_qty, price = stock[name]
+                    total += qty * price
+                    sales.append((now, name, qty, price))
+                    if stock_qty == qty:
+                        del stock[name]
+                        changes[name] = None
+                        sold_out.append(name)
+                    else:
+                        stock[name] = changes[name] = (stock_qty - qty, price)
+                if len(wanted) == 1:
+                    (name, qty), = wanted.items()
+                    msg = f"Sold {qty} {name}(s) for ${total:.2f}"
+                else:
+                    msg = f"Sold {sum(wanted.values())} items ({len(wanted)} products) for ${total:.2f}"
+                if sold_out:
+                    msg += f"\n{', '.join(sold_out)} {'is' if len(sold_out) == 1 else 'are'} now out of stock."
+                results.append((True, msg))
+            if changes:
+                accepted = sum(ok for ok, _ in results)
+                label = f"sell {', '.join(changes)}" if accepted == 1 else f"{accepted} orders"
+                self._apply(changes, before, sales, label=label[:200])
+        return results
+
+    def can_undo(self):
+        return bool(self._undo)
+
+    def can_redo(self):
+        return bool(self._redo)
+
+    def undo(self):
+        with self._lock:
+            if not self._undo:
+                return False, "Nothing to undo."
+            return self._revert(self._undo[-1], "undo")
+
+    def redo(self):
+        with self._lock:
+            if not self._redo:
+                return False, "Nothing to redo."
+            return self._revert(self._redo[-1], "redo")
+
+    def _revert(self, cs, kind):
+        # Writes back the values changeset cs overwrote, provided nothing has changed them since.
+        events = list(self.store.events(cs - 1, cs))
+        current = self.store.get_many(name for name, *_ in events)
+        changes = {}
+        for name, old_qty, old_price, new_qty, new_price in events:
+            now = None if new_qty is None else (new_qty, new_price)
+            if current.get(name) != now:
+                return False, f"Cannot {kind}: {name} has changed since."
+            changes[name] = None if old_qty is None else (old_qty, old_price)
+        # Sales are reversed with negative ledger rows, never deleted.
+        sales = [(time.time(), name, -qty, price) for _, name, qty, price in self.store.sales_of(cs)]
+        label = self.store.changeset(cs)[4]
+        if kind == "undo":
+            self._undo.pop()
+        else:
+            self._redo.pop()
+        self._apply(changes, current, sales, label=label, kind=kind, target=cs)
+        return True, f"{kind.capitalize()}: {label}"
+
+    def close(self):
+        self.store.close()
+
+def read_orders(f):
+    # JSON Lines: each line is a basket, either [[name, qty], ...] or {"lines": [[name, qty], ...]}.
+    for line in f:
+        if line.strip():
+            order = json.loads(line)
+            yield order["lines"] if isinstance(order, dict) else order
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay point-of-sale orders against the inventory.")
+    parser.add_argument("orders", help="JSON Lines file of baskets")
+    parser.add_argument("--db", default=INVENTORY_DB)
+    parser.add_argument("--batch", type=int, default=500, help="baskets written per transaction")
+    args = parser.parse_args()
+    service = InventoryService.open(args.db)
+    accepted = rejected = 0
+    start = time.perf_counter()
+    try:
+        with open(args.orders, "r", encoding="utf-8") as f:
+            batch = []
+            for order in read_orders(f):
+                batch.append(order)
+                if len(batch) < args.batch:
+                    continue
+                for ok, _ in service.sell_orders(batch):
+                    accepted += ok
+                    rejected += not ok
+                batch = []
+            for ok, _ in service.sell_orders(batch):
+                accepted += ok
+                rejected += not ok
+    finally:
+        service.close()
+    elapsed = time.perf_counter() - start
+    count = accepted + rejected
+    print(f"{count} orders in {elapsed:.2f}s ({count / elapsed:,.0f} orders/s): {accepted} sold, {rejected} rejected")
+
+if __name__ == "__main__":
+    main()
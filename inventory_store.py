@@ -0,0 +1,365 @@
+import os
+import sqlite3
+import threading
+import time
+
+# Persistent product catalogue for the inventory app.
+#
+# Products live in an SQLite table clustered on name (WITHOUT ROWID, so the
+# name index is the table and a lookup is a single B-tree probe). Opening a
+# catalogue of any size costs nothing up front: rows are fetched on demand (by
+# name, or a page at a time in name order) and each stock movement writes back
+# only the rows it changed, in one short WAL transaction.
+#
+# Every apply() is also logged as a changeset: one events row per product
+# holding its values before and after (NULL where it did not exist), so any
+# change can be reverted and any past state rebuilt (see inventory_history).
+# Every SNAPSHOT_EVERY events a full copy of the products table is kept as a
+# snapshot, which bounds how many events a reconstruction has to replay. The
+# copy is taken after the write that crossed the threshold has committed, on a
+# background thread with its own connections: it reads one consistent view of
+# the catalogue and writes it in short transactions, so neither apply() nor
+# the caller's thread waits for it.
+
+INVENTORY_DB = os.environ.get("INVENTORY_DB", "inventory.db")
+PAGE_SIZE = 500
+CACHE_KB = 64 * 1024  # SQLite page cache; bulk imports touch index pages all over the catalogue
+QUERY_CHUNK = 500  # names per IN (...) query, well under SQLite's bound-parameter limit
+EVENT_PAGE = 10_000  # rows per read when streaming events or snapshots
+SNAPSHOT_EVERY = 50_000  # events between snapshots
+SNAPSHOT_KEEP = 5        # older snapshots are dropped; the events themselves are kept
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    name TEXT PRIMARY KEY,
+    qty INTEGER NOT NULL,
+    price REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sales (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,  -- unix seconds
+    name TEXT NOT NULL,
+    qty INTEGER NOT NULL,  -- negative when a sale is undone
+    price REAL NOT NULL,
+    changeset INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_sales_time ON sales(time);
+CREATE TABLE IF NOT EXISTS changesets (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    kind TEXT NOT NULL,  -- do | undo | redo
+    target INTEGER,      -- for undo/redo: the changeset being reverted
+    label TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_changesets_time ON changesets(time);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    changeset INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    old_qty INTEGER,  -- NULL: the product did not exist
+    old_price REAL,
+    new_qty INTEGER,  -- NULL: the product was removed
+    new_price REAL
+);
+CREATE INDEX IF NOT EXISTS idx_events_changeset ON events(changeset);
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    changeset INTEGER NOT NULL,  -- state after this changeset
+    time REAL NOT NULL,
+    products INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshot_rows (
+    snapshot INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    qty INTEGER NOT NULL,
+    price REAL NOT NULL,
+    PRIMARY KEY (snapshot, name)
+) WITHOUT ROWID;
+"""
+
+class InventoryStore:
+    def __init__(self, path=INVENTORY_DB):
+        self.path = path
+        # Autocommit mode: reads take no lock, writes open an explicit BEGIN in apply().
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(f"PRAGMA cache_size=-{CACHE_KB}")
+        self.conn.executescript(SCHEMA)
+        self._upgrade_schema()
+        self._lock = threading.RLock()
+        self._count = None
+        self._snapshotter = None  # background snapshot thread, while one runs
+        last = self.conn.execute("SELECT COALESCE(MAX(changeset), 0) FROM snapshots").fetchone()[0]
+        self._since_snapshot = self.conn.execute(
+            "SELECT COUNT(*) FROM events WHERE changeset > ?", (last,)).fetchone()[0]
+
+    def _upgrade_schema(self):
+        cols = [r[1] for r in self.conn.execute("PRAGMA table_info(sales)")]
+        if "changeset" not in cols:
+            self.conn.execute("ALTER TABLE sales ADD COLUMN changeset INTEGER NOT NULL DEFAULT 0")
+
+    def get(self, name):
+        # (qty, price) or None
+        with self._lock:
+            return self.conn.execute("SELECT qty, price FROM products WHERE name = ?", (name,)).fetchone()
+
+    def get_many(self, names):
+        # {name: (qty, price)} for those of names that exist, fetched in chunks of one query each.
+        names = sorted(names)  # in key order, so lookups walk the index instead of jumping around
+        found = {}
+        with self._lock:
+            for i in range(0, len(names), QUERY_CHUNK):
+                part = names[i:i + QUERY_CHUNK]
+                marks = ",".join("?" * len(part))
+                for name, qty, price in self.conn.execute(
+                        f"SELECT name, qty, price FROM products WHERE name IN ({marks})", part):
+                    found[name] = (qty, price)
+        return found
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def count(self):
+        with self._lock:
+            if self._count is None:
+                self._count = self.conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+            return self._count
+
+    def page(self, after=None, limit=PAGE_SIZE):
+        # Keyset paging in name order: pass the last name of one page to get the next.
+        with self._lock:
+            if after is None:
+                sql, args = "SELECT name, qty, price FROM products ORDER BY name LIMIT ?", (limit,)
+            else:
+                sql, args = "SELECT name, qty, price FROM products WHERE name > ? ORDER BY name LIMIT ?", (after, limit)
+            return self.conn.execute(sql, args).fetchall()
+
+    def rows_from(self, name, limit=PAGE_SIZE):
+        # Rows from name (inclusive) on, in name order; None starts at the beginning.
+        with self._lock:
+            return self.conn.execute(
+                "SELECT name, qty, price FROM products WHERE name >= ? ORDER BY name LIMIT ?", (name or "", limit)
+            ).fetchall()
+
+    def rows_before(self, name, limit=PAGE_SIZE):
+        # The limit rows just before name (the last rows if name is None), nearest first.
+        with self._lock:
+            if name is None:
+                sql, args = "SELECT name, qty, price FROM products ORDER BY name DESC LIMIT ?", (limit,)
+            else:
+                sql, args = ("SELECT name, qty, price FROM products WHERE name < ? ORDER BY name DESC LIMIT ?",
+                             (name, limit))
+            return self.conn.execute(sql, args).fetchall()
+
+    def window(self, offset, limit=PAGE_SIZE):
+        # Rows by position in name order; costs O(offset), so only for jumps (a scrollbar drag).
+        with self._lock:
+            return self.conn.execute(
+                "SELECT name, qty, price FROM products ORDER BY name LIMIT ? OFFSET ?", (limit, offset)
+            ).fetchall()
+
+    def rank(self, name):
+        # Position name has (or would have) in name order; O(position), like window().
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM products WHERE name < ?", (name,)).fetchone()[0]
+
+    def prefix(self, query, limit=20):
+        # Names starting with query, case-sensitive, straight off the primary key.
+        with self._lock:
+            return [r[0] for r in self.conn.execute(
+                "SELECT name FROM products WHERE name >= ? AND name < ? ORDER BY name LIMIT ?",
+                (query, query + "\U0010ffff", limit))]
+
+    def iter_items(self, chunk=PAGE_SIZE):
+        after = None
+        while True:
+            rows = self.page(after, chunk)
+            yield from rows
+            if len(rows) < chunk:
+                return
+            after = rows[-1][0]
+
+    def apply(self, changes, before=None, sales=(), kind="do", target=None, label=""):
+        # changes: {name: (qty, price), or None to delete}; all rows are written in one transaction.
+        # before: {name: (qty, price)} for the names among changes that exist, if the caller has just
+        # read them. sales: (time, name, qty, price) ledger rows recorded in the same transaction.
+        # Returns the id of the changeset logged for this write.
+        upserts = sorted((name, row[0], row[1]) for name, row in changes.items() if row is not None)
+        deletes = [(name,) for name, row in changes.items() if row is None]
+        with self._lock:
+            if before is None:
+                before = self.get_many(changes)
+            now = time.time()
+            self.conn.execute("BEGIN")
+            try:
+                delta = 0  # keeps count() exact without a table scan
+                events = []
+                for name, row in changes.items():
+                    old = before.get(name)
+                    if row is None:
+                        delta -= old is not None
+                    elif old is None:
+                        delta += 1
+                    events.append((name, *(old or (None, None)), *(row or (None, None))))
+                cs = self.conn.execute(
+                    "INSERT INTO changesets (time, kind, target, label) VALUES (?, ?, ?, ?)",
+                    (now, kind, target, label)).lastrowid
+                self.conn.executemany(
+                    "INSERT INTO events (changeset, name, old_qty, old_price, new_qty, new_price)"
+                    f" VALUES ({cs}, ?, ?, ?, ?, ?)", events)
+                if upserts:
+                    self.conn.executemany(
+                        "INSERT INTO products (name, qty, price) VALUES (?, ?, ?)"
+                        " ON CONFLICT(name) DO UPDATE SET qty = excluded.qty, price = excluded.price",
+                        upserts,
+                    )
+                if deletes:
+                    self.conn.executemany("DELETE FROM products WHERE name = ?", deletes)
+                if sales:
+                    self.conn.executemany(
+                        f"INSERT INTO sales (time, name, qty, price, changeset) VALUES (?, ?, ?, ?, {cs})", sales)
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self._since_snapshot += len(events)
+            if self._count is not None:
+                self._count += delta
+            if self._since_snapshot >= SNAPSHOT_EVERY and self._snapshotter is None:
+                self._snapshotter = threading.Thread(target=self._snapshot, name="inventory-snapshot", daemon=True)
+                self._snapshotter.start()
+            return cs
+
+    def _snapshot(self):
+        # Runs on the snapshot thread. `read` holds one read transaction, so the
+        # rows and the changeset they belong to agree however many writes
+        # commit meanwhile. The snapshots row goes in last: until then the
+        # copied rows belong to no listed snapshot and nobody reads them.
+        read = sqlite3.connect(self.path, isolation_level=None)
+        write = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+        try:
+            read.execute("BEGIN")
+            cs = read.execute("SELECT COALESCE(MAX(id), 0) FROM changesets").fetchone()[0]
+            snap = read.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM snapshots").fetchone()[0]
+            write.execute("DELETE FROM snapshot_rows WHERE snapshot = ?", (snap,))  # left by an interrupted run
+            after, products = "", 0
+            while True:
+                rows = read.execute(
+                    "SELECT name, qty, price FROM products WHERE name > ? ORDER BY name LIMIT ?",
+                    (after, EVENT_PAGE)).fetchall()
+                if rows:
+                    with write:
+                        write.execute("BEGIN")
+                        write.executemany(
+                            "INSERT INTO snapshot_rows (snapshot, name, qty, price) VALUES (?, ?, ?, ?)",
+                            [(snap, *row) for row in rows])
+                    products += len(rows)
+                    after = rows[-1][0]
+                if len(rows) < EVENT_PAGE:
+                    break
+            read.execute("COMMIT")
+            with write:
+                write.execute("BEGIN")
+                write.execute("INSERT INTO snapshots (id, changeset, time, products) VALUES (?, ?, ?, ?)",
+                              (snap, cs, time.time(), products))
+                old = [r[0] for r in write.execute(
+                    "SELECT id FROM snapshots ORDER BY id DESC LIMIT -1 OFFSET ?", (SNAPSHOT_KEEP,))]
+                for sid in old:
+                    write.execute("DELETE FROM snapshot_rows WHERE snapshot = ?", (sid,))
+                    write.execute("DELETE FROM snapshots WHERE id = ?", (sid,))
+            with self._lock:  # apply() counts its events under the same lock
+                self._since_snapshot = write.execute(
+                    "SELECT COUNT(*) FROM events WHERE changeset > ?", (cs,)).fetchone()[0]
+        finally:
+            read.close()
+            write.close()
+            with self._lock:
+                self._snapshotter = None
+
+    def changesets(self, limit=100):
+        # Most recent first: (id, time, kind, target, label).
+        with self._lock:
+            return self.conn.execute(
+                "SELECT id, time, kind, target, label FROM changesets ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+
+    def changeset(self, cs):
+        # (id, time, kind, target, label) or None
+        with self._lock:
+            return self.conn.execute(
+                "SELECT id, time, kind, target, label FROM changesets WHERE id = ?", (cs,)).fetchone()
+
+    def changeset_at(self, when):
+        # Id of the last changeset committed at or before a unix time (0 if none).
+        with self._lock:
+            return self.conn.execute(
+                "SELECT COALESCE(MAX(id), 0) FROM changesets WHERE time <= ?", (when,)).fetchone()[0]
+
+    def events(self, lo, hi, reverse=False):
+        # (name, old_qty, old_price, new_qty, new_price) of changesets lo < id <= hi, in commit order
+        # (or reversed), read in pages so long ranges are never held in memory.
+        order = "DESC" if reverse else "ASC"
+        last = None
+        while True:
+            with self._lock:
+                sql = ("SELECT id, name, old_qty, old_price, new_qty, new_price FROM events"
+                       " WHERE changeset > ? AND changeset <= ?")
+                args = [lo, hi]
+                if last is not None:
+                    sql += " AND id < ?" if reverse else " AND id > ?"
+                    args.append(last)
+                rows = self.conn.execute(f"{sql} ORDER BY id {order} LIMIT ?", args + [EVENT_PAGE]).fetchall()
+            for r in rows:
+                yield r[1:]
+            if len(rows) < EVENT_PAGE:
+                return
+            last = rows[-1][0]
+
+    def count_events(self, lo, hi):
+        with self._lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM events WHERE changeset > ? AND changeset <= ?", (lo, hi)).fetchone()[0]
+
+    def sales_of(self, cs):
+        with self._lock:
+            return self.conn.execute("SELECT time, name, qty, price FROM sales WHERE changeset = ?", (cs,)).fetchall()
+
+    def snapshots(self):
+        # (id, changeset, time, products), oldest first.
+        with self._lock:
+            return self.conn.execute("SELECT id, changeset, time, products FROM snapshots ORDER BY id").fetchall()
+
+    def snapshot_rows(self, snap):
+        after = ""
+        while True:
+            with self._lock:
+                rows = self.conn.execute(
+                    "SELECT name, qty, price FROM snapshot_rows WHERE snapshot = ? AND name > ? ORDER BY name LIMIT ?",
+                    (snap, after, EVENT_PAGE)).fetchall()
+            yield from rows
+            if len(rows) < EVENT_PAGE:
+                return
+            after = rows[-1][0]
+
+    def sales_since(self, since):
+        # (time, name, qty, price) in time order, read off the time index.
+        with self._lock:
+            return self.conn.execute(
+                "SELECT time, name, qty, price FROM sales WHERE time >= ? ORDER BY time, id", (since,)
+            ).fetchall()
+
+    def top_sellers(self, since, limit=10):
+        # [(name, units sold)] since a time, for windows the analytics module does not keep in memory.
+        with self._lock:
+            return self.conn.execute(
+                "SELECT name, SUM(qty) AS units FROM sales WHERE time >= ?"
+                " GROUP BY name ORDER BY units DESC, name LIMIT ?", (since, limit)
+            ).fetchall()
+
+    def close(self):
+        snapshotter = self._snapshotter
+        if snapshotter is not None:
+            snapshotter.join()
+        with self._lock:
+            self.conn.close()
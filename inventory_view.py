@@ -0,0 +1,157 @@
+from tkinter import ttk
+
+# Virtualized product table: the Treeview only ever holds the rows that are on
+# screen. The window is anchored on its first name and read by key (name >=
+# top), so refreshing it or scrolling by a few rows costs the rows read,
+# wherever in the catalogue it is. Only a scrollbar drag, which asks for a
+# position, reads by offset. Change notifications update the affected rows in
+# place and touch nothing else.
+
+VISIBLE_ROWS = 15
+
+class InventoryTable(ttk.Frame):
+    def __init__(self, master, store, rows=VISIBLE_ROWS, on_select=None):
+        super().__init__(master)
+        self.store = store
+        self.rows = rows
+        self.on_select = on_select
+        self.offset = 0    # position of the first row, for the scrollbar
+        self.total = 0     # catalogue size at the last refresh
+        self.top = None    # first name shown; None = start of the catalogue
+        self.names = []    # names currently shown, in order
+        self.tree = ttk.Treeview(self, columns=("qty", "price"), height=rows, selectmode="browse")
+        self.tree.heading("#0", text="Product")
+        self.tree.heading("qty", text="Qty")
+        self.tree.heading("price", text="Price")
+        self.tree.column("#0", width=180)
+        self.tree.column("qty", width=80, anchor="e")
+        self.tree.column("price", width=90, anchor="e")
+        self.scroll = ttk.Scrollbar(self, orient="vertical", command=self._on_scrollbar)
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.scroll.pack(side="right", fill="y")
+        self.empty = ttk.Label(self, text="Inventory is empty.")
+        self.tree.bind("<MouseWheel>", self._on_wheel)
+        self.tree.bind("<Button-4>", lambda e: self.scroll_by(-3))
+        self.tree.bind("<Button-5>", lambda e: self.scroll_by(3))
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+        self.refresh()
+
+    def refresh(self):
+        # Re-reads the current window (rows on screen), never the whole catalogue.
+        total = self.store.count()
+        rows = self.store.rows_from(self.top, self.rows)
+        if len(rows) < self.rows:
+            # Past the end (rows were deleted, or the catalogue is short): fill from above.
+            above = self.store.rows_before(rows[0][0] if rows else None, self.rows - len(rows))
+            rows = above[::-1] + rows
+            self.offset = total - len(rows)
+        self._show(rows, total)
+
+    def _show(self, rows, total):
+        self.total = total
+        self.offset = max(0, min(self.offset, total - len(rows)))
+        self.tree.delete(*self.names)
+        self.names = []
+        for name, qty, price in rows:
+            self.tree.insert("", "end", iid=name, text=name, values=(qty, f"{price:.2f}"))
+            self.names.append(name)
+        self.top = self.names[0] if self.names else None
+        if total:
+            self.empty.place_forget()
+        else:
+            self.empty.place(relx=0.5, rely=0.5, anchor="center")
+        self._set_scroll()
+
+    def _set_scroll(self):
+        if self.total:
+            self.scroll.set(self.offset / self.total, (self.offset + len(self.names)) / self.total)
+        else:
+            self.scroll.set(0, 1)
+
+    def scroll_to(self, offset):
+        # Jump to a position (scrollbar drag); the one place the window is read by offset.
+        total = self.store.count()
+        self.offset = max(0, min(offset, total - self.rows))
+        self._show(self.store.window(self.offset, self.rows), total)
+
+    def scroll_by(self, rows):
+        if not self.names:
+            self.refresh()
+            return
+        if rows > 0:
+            more = [r[0] for r in self.store.page(self.names[-1], rows)]
+            step = len(more)  # never past the point where the last row is at the bottom
+            self.top = (self.names + more)[step]
+        else:
+            back = self.store.rows_before(self.names[0], -rows)
+            step = -len(back)
+            if back:
+                self.top = back[-1][0]
+        self.offset += step
+        self.refresh()
+
+    def show(self, name):
+        # Scrolls so that name is the first visible row (if it exists).
+        self.offset = self.store.rank(name)
+        self.top = name
+        self.refresh()
+        if name in self.names:
+            self.tree.selection_set(name)
+
+    def _on_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(value) * self.store.count()))
+        elif action == "scroll":
+            step = self.rows if unit == "pages" else 1
+            self.scroll_by(int(value) * step)
+
+    def _on_wheel(self, event):
+        self.scroll_by(-3 if event.delta > 0 else 3)
+
+    def _on_select(self, event):
+        sel = self.tree.selection()
+        if sel and self.on_select:
+            self.on_select(sel[0])
+
+    def on_change(self, changes):
+        # changes: {name: (qty, price), or None if deleted}, as published by InventoryService.
+        if not self.names or len(changes) > self.rows:
+            # Re-reading the window is cheaper than sorting out a bulk change row by row.
+            self.refresh()
+            return
+        first, last = self.names[0], self.names[-1]
+        above = False
+        reload = False
+        known = 0         # change to the catalogue size from rows at or inside the window
+        unknown = False   # a change below the window, which may or may not have been an insert
+        for name, row in changes.items():
+            if name in self.names:
+                if row is None:
+                    reload = True
+                    known -= 1
+                else:
+                    self.tree.item(name, values=(row[0], f"{row[1]:.2f}"))
+            elif name < first:
+                # Could be an insert, a delete or an update of a row that was
+                # already there; the change alone does not say which.
+                above = True
+            elif row is not None and (name < last or len(self.names) < self.rows):
+                reload = True
+                if name < last:
+                    known += 1  # not in the window but inside its range: an insert
+                else:
+                    unknown = True
+            else:
+                unknown = True
+        if above:
+            # Keep the same products on screen; only the scrollbar position moves.
+            # The catalogue's size (kept by the store) says how many rows came or
+            # went above the window unless changes below it blur that; then the
+            # position stays an estimate until the next jump.
+            total = self.store.count()
+            if not unknown:
+                self.offset = max(0, self.offset + total - self.total - known)
+            self.total = total
+            self._set_scroll()
+        if reload:
+            self.refresh()
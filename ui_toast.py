@@ -0,0 +1,92 @@
+import tkinter as tk
+from collections import deque
+
+# In-window notifications for the Tk apps, replacing modal message boxes.
+#
+# A toast is a bar along the bottom of the window that dismisses itself.
+# Errors are queued and each stays up for ERROR_MS (or until clicked), so none
+# is lost when several arrive together. An info toast never waits: it replaces
+# whatever info is showing. While an error is up or queued the newest info
+# (with its action) is held and shown once the errors are dismissed. A
+# toast can carry one action button (e.g. "Save receipt"). Every message is
+# also kept in history, which lets scripted UI tests check outcomes without
+# handling dialogs.
+
+INFO_MS = 2500
+ERROR_MS = 5000
+HISTORY_SIZE = 200
+COLORS = {"info": ("#14532d", "#dcfce7"), "error": ("#7f1d1d", "#fee2e2")}
+
+class Toaster:
+    def __init__(self, root, info_ms=INFO_MS, error_ms=ERROR_MS):
+        self.root = root
+        self.info_ms = info_ms
+        self.error_ms = error_ms
+        self.history = deque(maxlen=HISTORY_SIZE)  # (level, text)
+        self._errors = deque()
+        self._info = None     # (text, action) held back behind errors
+        self._showing = None  # level of the toast on screen
+        self._timer = None
+        self.bar = tk.Frame(root, padx=12, pady=6)
+        self.label = tk.Label(self.bar, font=("TkDefaultFont", 11), anchor="w", justify="left")
+        self.label.pack(side="left", fill="x", expand=True)
+        self.action = tk.Button(self.bar, relief="flat")
+        for w in (self.bar, self.label):
+            w.bind("<Button-1>", lambda e: self._next())
+
+    def info(self, text, action=None):
+        # action: optional (button text, callback)
+        self.history.append(("info", text))
+        if self._showing == "error" or self._errors:
+            self._info = (text, action)
+            return
+        self._show("info", text, action, self.info_ms)
+
+    def error(self, text):
+        self.history.append(("error", text))
+        if self._showing == "error":
+            self._errors.append(text)
+        else:
+            self._show("error", text, None, self.error_ms)
+
+    def pending(self):
+        return len(self._errors)
+
+    def clear(self):
+        self._errors.clear()
+        self._info = None
+        self._hide()
+
+    def _show(self, level, text, action, ms):
+        if self._timer is not None:
+            self.root.after_cancel(self._timer)
+        bg, fg = COLORS[level]
+        self.bar.config(bg=bg)
+        self.label.config(text=text, bg=bg, fg=fg)
+        if action:
+            label, fn = action
+            self.action.config(text=label, bg=bg, fg=fg, activebackground=bg,
+                               command=lambda: (self._hide(), fn()))
+            self.action.pack(side="right", padx=(12, 0))
+        else:
+            self.action.pack_forget()
+        self.bar.place(relx=0, rely=1, relwidth=1, anchor="sw")
+        self.bar.lift()
+        self._showing = level
+        self._timer = self.root.after(ms, self._next)
+
+    def _next(self):
+        if self._errors:
+            self._show("error", self._errors.popleft(), None, self.error_ms)
+        elif self._info is not None:
+            (text, action), self._info = self._info, None
+            self._show("info", text, action, self.info_ms)
+        else:
+            self._hide()
+
+    def _hide(self):
+        if self._timer is not None:
+            self.root.after_cancel(self._timer)
+            self._timer = None
+        self.bar.place_forget()
+        self._showing = None